@@ -1,5 +1,5 @@
 import os
-from elasticsearch import Elasticsearch
+import client
 from pathlib import Path
 
 TIMEOUT = 10
@@ -17,13 +17,13 @@ def load():
                     body = f.read()
                     filename = Path(file).stem
                     
-                    with Elasticsearch(os.environ['ELASTICSEARCH_URL'], basic_auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD'])) as client:
-                        resp = client.indices.exists(index=index)
-                        if resp:
-                            print(f"{index} found, creating alias")
-                            resp = client.indices.put_alias(index=index, name=filename, body=body)
-                            print(resp)
-                            return True
-                        else:
-                            print(f"{index} not yet found...")
-                            return False
+                    es = client.es_client()
+                    resp = es.indices.exists(index=index)
+                    if resp:
+                        print(f"{index} found, creating alias")
+                        resp = es.indices.put_alias(index=index, name=filename, body=body)
+                        print(resp)
+                        return True
+                    else:
+                        print(f"{index} not yet found...")
+                        return False
@@ -12,14 +12,15 @@ import integrations
 import enroll_elastic_agent
 import subprocess
 import ingest_pipelines
+import bootstrap
+import client
+from bootstrap import Step
 
 
 app = Flask(__name__)
 
 
-def init():
-    #assistant.load()
-    #context.load()
+def download_logs():
     full_logs_script = 'download-s3/download-logs.sh'
 
     # Set execute permissions on the shell scripts
@@ -29,13 +30,24 @@ def init():
     print("Running download-full-logs.sh...")
     subprocess.run(['sudo', full_logs_script, 'full', '--no-timestamp-processing'], check=True)
 
-    integrations.load() #nginx, mysql
-    ingest_pipelines.load()
-    enroll_elastic_agent.install_elastic_agent()
-    slo.load() 
-    time.sleep(600)
-    ml.load_integration_jobs()
-    kibana.load() #dashboards
-    
+def init():
+    #assistant.load()
+    #context.load()
+    try:
+        bootstrap.run([
+            Step('download_logs', download_logs),
+            Step('integrations', integrations.load), #nginx, mysql
+            Step('ingest_pipelines', ingest_pipelines.load),
+            Step('elastic_agent', enroll_elastic_agent.install_elastic_agent, after=['integrations', 'ingest_pipelines']),
+            Step('slo', slo.load),
+            # wait for the agent to ship the downloaded logs rather than a fixed 10 minutes
+            Step('ml_integration_jobs', ml.load_integration_jobs,
+                 after=['download_logs', 'ingest_pipelines', 'elastic_agent'], ready=ml.integration_data_ready),
+            Step('kibana', kibana.load, after=['slo']), #dashboards
+        ])
+    finally:
+        print("Elastic API requests during bootstrap:")
+        client.metrics.report()
+
 
 init()
@@ -0,0 +1,129 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from waiter import wait_for
+
+BOOTSTRAP_STATE_PATH = os.environ.get('BOOTSTRAP_STATE_PATH', '.bootstrap_state.json')
+MAX_WORKERS = int(os.environ.get('BOOTSTRAP_MAX_WORKERS', 4))
+
+READY_MAX_POLL_INTERVAL = 30
+READY_TIMEOUT = 1800
+
+class Step:
+    """
+    One unit of environment bring-up.
+
+    `after` names the steps that must have finished first. `ready` is an
+    optional probe polled before the step runs (instead of a fixed sleep);
+    if it is still false after `ready_timeout` seconds the step runs anyway,
+    as it would have after the old sleep.
+    """
+
+    def __init__(self, name, run, *, after=(), ready=None, ready_timeout=READY_TIMEOUT):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        self.ready = ready
+        self.ready_timeout = ready_timeout
+
+def load_state(path=BOOTSTRAP_STATE_PATH):
+    try:
+        with open(path, 'r', encoding='utf8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_state(state, path=BOOTSTRAP_STATE_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def wait_ready(step):
+    if step.ready is None:
+        return True
+    try:
+        return wait_for(step.ready, name=step.name, timeout=step.ready_timeout, max_delay=READY_MAX_POLL_INTERVAL)
+    except TimeoutError:
+        print(f"{step.name}: not ready after {step.ready_timeout}s, running anyway")
+        return False
+
+def _execute(step):
+    timing = {'started_at': time.time()}
+    start = time.monotonic()
+    wait_ready(step)
+    timing['wait_seconds'] = time.monotonic() - start
+    step.run()
+    timing['run_seconds'] = time.monotonic() - start - timing['wait_seconds']
+    return timing
+
+def run(steps, *, state_path=BOOTSTRAP_STATE_PATH, max_workers=MAX_WORKERS, force=()):
+    """
+    Runs the steps as a dependency graph, independent steps concurrently.
+    Finished steps are recorded in `state_path`, so a re-run skips them unless
+    named in `force`. Prints a per-step timing breakdown and raises if any
+    step failed.
+    """
+    by_name = {step.name: step for step in steps}
+    for step in steps:
+        for dependency in step.after:
+            if dependency not in by_name:
+                raise ValueError(f"step {step.name} depends on unknown step {dependency}")
+
+    state = load_state(state_path)
+    results = {}
+    for step in steps:
+        if state.get(step.name, {}).get('status') == 'done' and step.name not in force:
+            print(f"{step.name}: already done, skipping")
+            results[step.name] = 'skipped'
+
+    def finished(name):
+        return results.get(name) in ('done', 'skipped')
+
+    start = time.monotonic()
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            for step in steps:
+                if step.name in results or step.name in running.values():
+                    continue
+                if any(results.get(dependency) in ('failed', 'blocked') for dependency in step.after):
+                    print(f"{step.name}: blocked by a failed dependency")
+                    results[step.name] = 'blocked'
+                    continue
+                if all(finished(dependency) for dependency in step.after):
+                    print(f"{step.name}: starting")
+                    running[pool.submit(_execute, step)] = step.name
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    timing = future.result()
+                    results[name] = 'done'
+                    entry = dict(timing, status='done')
+                    print(f"{name}: done in {timing['wait_seconds'] + timing['run_seconds']:.1f}s")
+                except Exception as inst:
+                    results[name] = 'failed'
+                    entry = {'status': 'failed', 'error': str(inst)}
+                    print(f"{name}: failed: {inst}")
+                state[name] = entry
+                save_state(state, state_path)
+
+    print(f"bootstrap finished in {time.monotonic() - start:.1f}s")
+    for step in steps:
+        entry = state.get(step.name, {})
+        if results.get(step.name) == 'done':
+            print(f"  {step.name:<24} waited {entry['wait_seconds']:7.1f}s  ran {entry['run_seconds']:7.1f}s")
+        else:
+            print(f"  {step.name:<24} {results.get(step.name)}")
+
+    failed = [name for name, result in results.items() if result in ('failed', 'blocked')]
+    if failed:
+        raise RuntimeError(f"bootstrap steps did not complete: {', '.join(failed)}")
+    return results
@@ -0,0 +1,154 @@
+"""
+Shared Elasticsearch and Kibana clients for the resource loaders.
+
+All loaders go through the pooled sessions here (and the one cached
+Elasticsearch client), so connections are reused across loaders and threads,
+auth, timeouts and retries are the same everywhere, and every request is
+counted in `metrics`.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from elasticsearch import Elasticsearch
+from elastic_transport import Urllib3HttpNode
+
+TIMEOUT = float(os.environ.get('CLIENT_TIMEOUT', 30))
+RETRIES = int(os.environ.get('CLIENT_RETRIES', 3))
+POOL_SIZE = int(os.environ.get('CLIENT_POOL_SIZE', 16))
+# the service turned the request away without acting on it, so any method can be retried
+REFUSED_STATUSES = (429, 503)
+# a gateway lost the upstream's answer: the upstream may have applied the request, so only
+# idempotent methods are retried on these
+RETRY_STATUSES = REFUSED_STATUSES + (502, 504)
+
+def credentials():
+    # no default: a missing variable fails with a KeyError naming it, as it did before the shared client
+    return (os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD'])
+
+class Metrics:
+    """Request count, errors, latency and bytes per service, safe to update from many threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._services = defaultdict(lambda: {'requests': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                              'bytes_sent': 0, 'bytes_received': 0})
+
+    def record(self, service, seconds, *, ok, sent=0, received=0):
+        with self._lock:
+            entry = self._services[service]
+            entry['requests'] += 1
+            entry['errors'] += 0 if ok else 1
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+            entry['bytes_sent'] += sent
+            entry['bytes_received'] += received
+
+    def snapshot(self):
+        with self._lock:
+            return {service: dict(entry) for service, entry in self._services.items()}
+
+    def report(self):
+        for service, entry in sorted(self.snapshot().items()):
+            mean_ms = 1000 * entry['seconds'] / entry['requests'] if entry['requests'] else 0
+            print(f"  {service:<14} {entry['requests']:6d} requests  {entry['errors']:4d} errors  "
+                  f"{entry['seconds']:7.1f}s total  {mean_ms:7.1f}ms mean  {1000 * entry['max_seconds']:8.1f}ms max  "
+                  f"{entry['bytes_sent'] / 1024:9.1f}KiB sent  {entry['bytes_received'] / 1024:9.1f}KiB received")
+
+metrics = Metrics()
+
+def _body_size(body):
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode('utf8'))
+    return 0
+
+class IdempotentRetry(Retry):
+    """Retries idempotent methods on RETRY_STATUSES, and POST/PATCH only on REFUSED_STATUSES."""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method.upper() not in Retry.DEFAULT_ALLOWED_METHODS and status_code not in REFUSED_STATUSES:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+class Api:
+    """A pooled, retrying requests session bound to one service's base URL."""
+
+    def __init__(self, name, url_env, *, default_url=None, headers=None):
+        self.name = name
+        self.url_env = url_env
+        self.default_url = default_url
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        retry = IdempotentRetry(total=RETRIES, read=0, status_forcelist=RETRY_STATUSES, allowed_methods=None,
+                                backoff_factor=0.5, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def url(self):
+        url = os.environ.get(self.url_env, self.default_url)
+        if url is None:
+            raise KeyError(self.url_env)
+        return url.rstrip('/')
+
+    def request(self, method, path, *, timeout=TIMEOUT, **kwargs):
+        """Sends method to the service's base URL + path; returns the response whatever its status."""
+        start = time.monotonic()
+        try:
+            resp = self.session.request(method, f"{self.url}{path}", auth=credentials(), timeout=timeout, **kwargs)
+        except requests.RequestException:
+            metrics.record(self.name, time.monotonic() - start, ok=False)
+            raise
+        received = int(resp.headers.get('Content-Length', 0)) if kwargs.get('stream') else len(resp.content)
+        metrics.record(self.name, time.monotonic() - start, ok=resp.status_code < 400,
+                       sent=_body_size(resp.request.body), received=received)
+        return resp
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+elasticsearch = Api('elasticsearch', 'ELASTICSEARCH_URL')
+kibana = Api('kibana', 'KIBANA_URL', default_url='http://localhost:5601', headers={'kbn-xsrf': 'reporting'})
+
+class MeteredNode(Urllib3HttpNode):
+    """Elasticsearch client connection that records its requests in `metrics`."""
+
+    def perform_request(self, method, target, body=None, headers=None, **kwargs):
+        start = time.monotonic()
+        try:
+            response = super().perform_request(method, target, body=body, headers=headers, **kwargs)
+        except Exception:
+            metrics.record('elasticsearch', time.monotonic() - start, ok=False, sent=_body_size(body))
+            raise
+        metrics.record('elasticsearch', time.monotonic() - start, ok=response.meta.status < 400,
+                       sent=_body_size(body), received=_body_size(response.body))
+        return response
+
+_es_client = None
+_es_client_lock = threading.Lock()
+
+def es_client():
+    """The process-wide Elasticsearch client; created on first use and never closed by callers."""
+    global _es_client
+    with _es_client_lock:
+        if _es_client is None:
+            _es_client = Elasticsearch(elasticsearch.url, basic_auth=credentials(), node_class=MeteredNode,
+                                       connections_per_node=POOL_SIZE, request_timeout=TIMEOUT,
+                                       max_retries=RETRIES, retry_on_status=REFUSED_STATUSES, retry_on_timeout=True)
+        return _es_client
@@ -1,20 +1,124 @@
 import os
+import json
+import time
 import requests
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import client
 
 INDICES_RESOURCES_PATH = 'context/indices'
 KNOWLEDGE_RESOURCES_PATH = 'context/knowledge'
 
 TIMEOUT = 10
+
+BULK_MAX_BYTES = int(os.environ.get('CONTEXT_BULK_MAX_BYTES', 5 * 1024 * 1024))
+BULK_WORKERS = int(os.environ.get('CONTEXT_BULK_WORKERS', 4))
+BULK_RETRIES = 3
+BULK_TIMEOUT = 60
+
+def iter_json_docs(path):
+    """Yields (id, compact source) for each JSON file in path, read one at a time."""
+    for file in os.listdir(path):
+        if file.endswith(".json"):
+            with open(os.path.join(path, file), "rt", encoding='utf8') as f:
+                yield Path(file).stem, json.dumps(json.loads(f.read()), separators=(',', ':'))
+
+def iter_bulk_items(index, docs):
+    """Turns (id, source) docs into (id, NDJSON index action + source) bulk items."""
+    for doc_id, source in docs:
+        action = json.dumps({"index": {"_index": index, "_id": doc_id}})
+        yield doc_id, f"{action}\n{source}\n".encode('utf8')
+
+def iter_bulk_batches(items, max_bytes=BULK_MAX_BYTES):
+    """Groups bulk items into batches of at most max_bytes (unless a single item is larger)."""
+    batch = []
+    batch_bytes = 0
+    for item in items:
+        if batch and batch_bytes + len(item[1]) > max_bytes:
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(item)
+        batch_bytes += len(item[1])
+    if batch:
+        yield batch
+
+def send_bulk(batch, pipeline):
+    """
+    Sends one _bulk request; returns (indexed count, items worth retrying).
+    Items rejected for good (e.g. mapping errors) are reported and dropped.
+    """
+    try:
+        resp = client.elasticsearch.post("/_bulk",
+                                         data=b''.join(body for _, body in batch), timeout=BULK_TIMEOUT,
+                                         params={'pipeline': pipeline} if pipeline else None,
+                                         headers={"Content-Type": "application/x-ndjson"})
+    except requests.RequestException as inst:
+        print(f"bulk request of {len(batch)} docs failed: {inst}")
+        return 0, batch
+    if resp.status_code == 429 or resp.status_code >= 500:
+        print(f"bulk request of {len(batch)} docs failed: {resp.status_code}")
+        return 0, batch
+    resp.raise_for_status()
+
+    indexed = 0
+    retry = []
+    for item, result in zip(batch, resp.json()['items']):
+        status = result['index']['status']
+        if status < 300:
+            indexed += 1
+        elif status == 429 or status >= 500:
+            retry.append(item)
+        else:
+            print(f"failed to index {item[0]}: {result['index'].get('error')}")
+    return indexed, retry
+
+def bulk_load(index, docs, *, pipeline=None, workers=BULK_WORKERS, max_bytes=BULK_MAX_BYTES):
+    """Streams docs into concurrent _bulk requests, retrying only the items that failed transiently."""
+    start = time.monotonic()
+    indexed = 0
+    retry = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for batch in iter_bulk_batches(iter_bulk_items(index, docs), max_bytes):
+            # keep only a couple of batches per worker read ahead of the requests
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_indexed, batch_retry = future.result()
+                    indexed += batch_indexed
+                    retry.extend(batch_retry)
+            pending.add(pool.submit(send_bulk, batch, pipeline))
+        for future in pending:
+            batch_indexed, batch_retry = future.result()
+            indexed += batch_indexed
+            retry.extend(batch_retry)
+
+    for attempt in range(1, BULK_RETRIES + 1):
+        if not retry:
+            break
+        time.sleep(2 ** attempt)
+        print(f"retrying {len(retry)} docs into {index} (attempt {attempt})")
+        items = retry
+        retry = []
+        for batch in iter_bulk_batches(items, max_bytes):
+            batch_indexed, batch_retry = send_bulk(batch, pipeline)
+            indexed += batch_indexed
+            retry.extend(batch_retry)
+
+    if retry:
+        print(f"gave up on {len(retry)} docs into {index}: {', '.join(doc_id for doc_id, _ in retry)}")
+    print(f"bulk loaded {indexed} docs into {index} in {time.monotonic() - start:.1f}s")
+    return indexed, [doc_id for doc_id, _ in retry]
              
 def load_index(parent, index):
 
     with open(os.path.join(parent, "index.json"), "rt", encoding='utf8') as f:
         body = f.read()
-        resp = requests.put(f"{os.environ['ELASTICSEARCH_URL']}/{index}",
-                                data=body, timeout=TIMEOUT,
-                                auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD']), 
-                                headers={"kbn-xsrf": "reporting", "Content-Type": "application/json"})
+        resp = client.elasticsearch.put(f"/{index}",
+                                        data=body, timeout=TIMEOUT,
+                                        headers={"Content-Type": "application/json"})
         print(resp.json())
         
 def load_pipelines(parent):
@@ -26,27 +130,15 @@ def load_pipelines(parent):
                 body = f.read()
                 filename = Path(file).stem
 
-                resp = requests.put(f"{os.environ['ELASTICSEARCH_URL']}/_ingest/pipeline/{filename}",
-                                     data=body, timeout=TIMEOUT,
-                                     auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD']), 
-                                        headers={"kbn-xsrf": "reporting", "Content-Type": "application/json"})
+                resp = client.elasticsearch.put(f"/_ingest/pipeline/{filename}",
+                                                data=body, timeout=TIMEOUT,
+                                                headers={"Content-Type": "application/json"})
                 print(resp.json())    
         
 
 def load_docs(parent, index):
     docs_path = os.path.join(parent, 'docs')    
-    
-    for file in os.listdir(docs_path):
-        if file.endswith(".json"):
-            with open(os.path.join(docs_path, file), "rt", encoding='utf8') as f:
-                body = f.read()
-                filename = Path(file).stem
-
-                resp = requests.put(f"{os.environ['ELASTICSEARCH_URL']}/{index}/_doc/${filename}?pipeline={index}",
-                                     data=body, timeout=TIMEOUT,
-                                     auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD']),
-                                     headers={"Content-Type": "application/json"})
-                print(resp.json())  
+    bulk_load(index, iter_json_docs(docs_path), pipeline=index)
 
 def load_indices():
     for index in os.listdir(INDICES_RESOURCES_PATH):
@@ -63,24 +155,16 @@ def load_elser():
             "num_threads": 1
         }
     }
-    resp = requests.put(f"{os.environ['ELASTICSEARCH_URL']}/_inference/sparse_embedding/elser_model_2_linux-x86_64",
-                            json=body, timeout=TIMEOUT,
-                            auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD']), 
-                            headers={"kbn-xsrf": "reporting", "Content-Type": "application/json"})
+    resp = client.elasticsearch.put("/_inference/sparse_embedding/elser_model_2_linux-x86_64",
+                                    json=body, timeout=TIMEOUT,
+                                    headers={"Content-Type": "application/json"})
     print(resp.json())  
     
 
 def load_knowledge():
-    for file in os.listdir(KNOWLEDGE_RESOURCES_PATH):
-        if file.endswith(".json"):
-            with open(os.path.join(KNOWLEDGE_RESOURCES_PATH, file), "rt", encoding='utf8') as f:
-                body = f.read()
-                filename = Path(file).stem
-                resp = requests.put(f"{os.environ['ELASTICSEARCH_URL']}/.kibana-observability-ai-assistant-kb-000001/_doc/${filename}?pipeline=.kibana-observability-ai-assistant-kb-ingest-pipeline",
-                                     data=body, timeout=TIMEOUT,
-                                     auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD']),
-                                     headers={"Content-Type": "application/json"})
-                print(f"loading knowledge {filename}: {resp.json()}")  
+    print(f"loading knowledge from {KNOWLEDGE_RESOURCES_PATH}")
+    bulk_load('.kibana-observability-ai-assistant-kb-000001', iter_json_docs(KNOWLEDGE_RESOURCES_PATH),
+              pipeline='.kibana-observability-ai-assistant-kb-ingest-pipeline')
 
 def load():
     load_elser()
@@ -1,14 +1,13 @@
 import os
-import requests
 import json
 import subprocess
 import base64
 
+import client
+import fleet
+
 # Set environment variables or replace with your own values
-KIBANA_URL = os.environ.get('KIBANA_URL', 'http://localhost:5601')
 FLEET_URL = os.environ.get('FLEET_URL', 'http://localhost:8220')
-ELASTIC_USER = os.environ.get('ELASTICSEARCH_USER', 'elastic')
-ELASTIC_PASSWORD = os.environ.get('ELASTICSEARCH_PASSWORD', 'changeme')
 ELASTIC_AGENT_DOWNLOAD_URL = os.environ.get(
     'ELASTIC_AGENT_DOWNLOAD_URL',
     'https://artifacts.elastic.co/downloads/beats/elastic-agent/elastic-agent-8.15.2-linux-x86_64.tar.gz'
@@ -24,36 +23,25 @@ HEADERS = {
 
 def get_agent_policy_id(policy_name):
     """Retrieve the agent policy ID by name."""
-    url = f"{KIBANA_URL}/api/fleet/agent_policies"
-    response = requests.get(
-        url,
-        headers=HEADERS,
-        auth=(ELASTIC_USER, ELASTIC_PASSWORD),
-        verify=False
-    )
-
-    if response.status_code == 200:
-        data = response.json()
-        items = data.get('items', [])
-        for item in items:
-            if item.get('name') == policy_name:
-                policy_id = item.get('id')
-                print(f"Found agent policy '{policy_name}' with ID: {policy_id}")
-                return policy_id
-        print(f"No agent policy found with name '{policy_name}'")
+    try:
+        policy_id = fleet.cache.agent_policy_id(policy_name)
+    except Exception as inst:
+        print(f"Failed to retrieve agent policies: {inst}")
         return None
+
+    if policy_id:
+        print(f"Found agent policy '{policy_name}' with ID: {policy_id}")
     else:
-        print(f"Failed to retrieve agent policies: {response.status_code} {response.text}")
-        return None
+        print(f"No agent policy found with name '{policy_name}'")
+    return policy_id
 
 def get_enrollment_api_key_for_policy(policy_id):
     """Retrieve or create an enrollment API key for the given policy ID."""
-    url = f"{KIBANA_URL}/api/fleet/enrollment_api_keys"
+    url = "/api/fleet/enrollment_api_keys"
     params = {'kuery': f'policy_id:"{policy_id}"'}
-    response = requests.get(
+    response = client.kibana.get(
         url,
         headers=HEADERS,
-        auth=(ELASTIC_USER, ELASTIC_PASSWORD),
         params=params,
         verify=False
     )
@@ -76,15 +64,14 @@ def get_enrollment_api_key_for_policy(policy_id):
 
 def create_enrollment_api_key_for_policy(policy_id):
     """Create a new enrollment API key for the given policy ID."""
-    url = f"{KIBANA_URL}/api/fleet/enrollment_api_keys"
+    url = "/api/fleet/enrollment_api_keys"
     payload = {
         "name": f"Enrollment key for policy {policy_id}",
         "policy_id": policy_id
     }
-    response = requests.post(
+    response = client.kibana.post(
         url,
         headers=HEADERS,
-        auth=(ELASTIC_USER, ELASTIC_PASSWORD),
         json=payload,
         verify=False
     )
@@ -130,10 +117,8 @@ def download_and_install_elastic_agent(enrollment_token):
     # Determine the extracted directory name (remove .tar.gz extension)
     extracted_dir = tarball_name.replace('.tar.gz', '')
 
-    # Change to the extracted directory
-    os.chdir(extracted_dir)
-
-    # Install the Agent
+    # Install the Agent from the extracted directory; run it there rather than
+    # chdir-ing, as other bootstrap steps may be running in this process
     print("Installing Elastic Agent...")
     install_command = [
         'sudo',  # Add 'sudo' if root permissions are required
@@ -144,10 +129,7 @@ def download_and_install_elastic_agent(enrollment_token):
         '--enrollment-token', enrollment_token,
         '--insecure'  # Remove this if SSL is properly configured
     ]
-    subprocess.run(install_command, check=True)
-
-    # Go back to the original directory
-    os.chdir('..')
+    subprocess.run(install_command, check=True, cwd=extracted_dir)
 
     # Cleanup
     print("Cleaning up...")
@@ -0,0 +1,60 @@
+import threading
+
+import client
+
+PER_PAGE = 100
+
+PATHS = {
+    'agent_policies': '/api/fleet/agent_policies',
+    'package_policies': '/api/fleet/package_policies',
+}
+
+def iter_items(path, *, per_page=PER_PAGE):
+    """Yields every item of a paginated Fleet list API."""
+    page = 1
+    while True:
+        response = client.kibana.get(path, params={'page': page, 'perPage': per_page},
+                                     verify=False)  # Set to True in production
+        response.raise_for_status()
+        data = response.json()
+        items = data.get('items', [])
+        yield from items
+        if not items or page * per_page >= data.get('total', 0):
+            return
+        page += 1
+
+class FleetCache:
+    """
+    Agent and package policies, each listed once and indexed by name.
+    Call invalidate() after creating or changing a policy; the next lookup
+    lists them again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_name = {}
+
+    def _index(self, kind):
+        with self._lock:
+            if kind not in self._by_name:
+                self._by_name[kind] = {item['name']: item for item in iter_items(PATHS[kind])}
+            return self._by_name[kind]
+
+    def agent_policies(self):
+        return self._index('agent_policies')
+
+    def package_policies(self):
+        return self._index('package_policies')
+
+    def agent_policy_id(self, name):
+        item = self.agent_policies().get(name)
+        return item['id'] if item else None
+
+    def invalidate(self, kind=None):
+        with self._lock:
+            if kind is None:
+                self._by_name.clear()
+            else:
+                self._by_name.pop(kind, None)
+
+cache = FleetCache()
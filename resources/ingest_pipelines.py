@@ -1,16 +1,32 @@
 import glob
 import json
 import os
-import requests
 
-# Replace these with your actual Elasticsearch URL and headers
-ELASTICSEARCH_URL = os.environ['ELASTICSEARCH_URL']
-HEADERS = {'Content-Type': 'application/json'}
+import client
+from reconcile import Reconciler
+
+def get_pipelines(desired):
+    """Names of the ingest pipelines that currently exist."""
+    response = client.elasticsearch.get("/_ingest/pipeline")
+    response.raise_for_status()
+    return {pipeline_name: pipeline_name for pipeline_name in response.json()}
+
+def put_pipeline(pipeline_name, pipeline_config):
+    # Create or replace the pipeline
+    response = client.elasticsearch.put(f"/_ingest/pipeline/{pipeline_name}", json=pipeline_config)
+
+    if response.status_code not in [200, 201]:
+        print(f"Failed to create pipeline {pipeline_name}: {response.status_code} - {response.text}")
+        return None
+
+    print(f"Pipeline {pipeline_name} created successfully.")
+    return pipeline_name
 
 def load():
     """Process and create ingest pipelines from JSON files in the 'ingest-pipelines' directory."""
     pipeline_files = glob.glob('ingest-pipelines/*.json')
 
+    desired = {}
     for pipeline_file in pipeline_files:
         # Load the pipeline configuration from the JSON file
         with open(pipeline_file, 'r') as config_file:
@@ -21,19 +37,7 @@ def load():
         if not pipeline_name:
             # Fall back to filename without extension if name not in config
             pipeline_name = os.path.splitext(os.path.basename(pipeline_file))[0]
+        desired[pipeline_name] = pipeline_config
 
-        # Create pipeline
-        pipeline_url = f"{ELASTICSEARCH_URL}/_ingest/pipeline/{pipeline_name}"
-
-        response = requests.put(
-            pipeline_url,
-            headers={'Content-Type': 'application/json'},
-            auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD']),
-            json=pipeline_config
-        )
-
-        if response.status_code not in [200, 201]:
-            print(f"Failed to create pipeline {pipeline_name}: {response.status_code} - {response.text}")
-            continue
-
-        print(f"Pipeline {pipeline_name} from {pipeline_file} created successfully.")
\ No newline at end of file
+    Reconciler('ingest_pipelines', fetch=get_pipelines, create=put_pipeline,
+               update=lambda pipeline_name, _, pipeline_config: put_pipeline(pipeline_name, pipeline_config)).apply(desired)
@@ -1,9 +1,11 @@
 import os
-import requests
 import json
 import glob
 
-KIBANA_URL = os.environ['KIBANA_URL']
+import client
+import fleet
+from reconcile import Reconciler
+
 TIMEOUT = 10
 
 HEADERS = {
@@ -13,33 +15,44 @@ HEADERS = {
 
 def get_agent_policy_id(policy_name):
     """Retrieve the agent policy ID by name."""
-    url = f"{KIBANA_URL}/api/fleet/agent_policies"
-    params = {'kuery': f'name:"{policy_name}"'}
-    response = requests.get(
-        url,
+    try:
+        policy_id = fleet.cache.agent_policy_id(policy_name)
+    except Exception as inst:
+        print(f"Failed to retrieve agent policies: {inst}")
+        return None
+
+    if policy_id:
+        print(f"Found agent policy '{policy_name}' with ID: {policy_id}")
+    else:
+        print(f"No agent policy found with name '{policy_name}'")
+    return policy_id
+
+def get_agent_policies(desired):
+    """Ids of the agent policies that currently exist, by name."""
+    return {name: item['id'] for name, item in fleet.cache.agent_policies().items()}
+
+def create_agent_policy(agent_policy_name, agent_policy_config):
+    # Create a new agent policy
+    agent_policy_url = "/api/fleet/agent_policies?sys_monitoring=true"
+    response = client.kibana.post(
+        agent_policy_url,
         headers=HEADERS,
-        auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD']),
-        params=params,
-        verify=False  # Set to True in production
+        json=agent_policy_config
     )
 
-    if response.status_code == 200:
-        data = response.json()
-        items = data.get('items', [])
-        for item in items:
-            if item.get('name') == policy_name:
-                policy_id = item.get('id')
-                print(f"Found agent policy '{policy_name}' with ID: {policy_id}")
-                return policy_id
-        print(f"No agent policy found with name '{policy_name}'")
-        return None
-    else:
-        print(f"Failed to retrieve agent policies: {response.status_code} {response.text}")
+    if response.status_code != 200:
+        print(f"Failed to create agent policy: {response.status_code} - {response.text}")
         return None
 
+    agent_policy_id = response.json()['item']['id']
+    fleet.cache.invalidate('agent_policies')
+    print(f"Created agent policy '{agent_policy_name}' with ID: {agent_policy_id}")
+    return agent_policy_id
+
 def create_agent_policies():
-    """Create agent policies from JSON files in the 'agent_policies' directory."""
+    """Create agent policies from JSON files in the 'agent_policies' directory; returns their IDs by name."""
     agent_policy_files = glob.glob('agent_policies/*.json')
+    desired = {}
     for agent_policy_file in agent_policy_files:
         with open(agent_policy_file, 'r') as file:
             agent_policy_config = json.load(file)
@@ -48,33 +61,53 @@ def create_agent_policies():
         if not agent_policy_name:
             print(f"No 'name' field in {agent_policy_file}")
             continue
+        desired[agent_policy_name] = agent_policy_config
 
-        agent_policy_id = get_agent_policy_id(agent_policy_name)
-        if agent_policy_id:
-            print(f"Agent policy '{agent_policy_name}' already exists with ID: {agent_policy_id}")
-            continue
+    # existing agent policies are left as they are, as before
+    return Reconciler('agent_policies', fetch=get_agent_policies, create=create_agent_policy).apply(desired)
 
-        # Create a new agent policy
-        agent_policy_url = f"{KIBANA_URL}/api/fleet/agent_policies?sys_monitoring=true"
-        response = requests.post(
-            agent_policy_url,
-            headers=HEADERS,
-            auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD']),
-            json=agent_policy_config
-        )
-
-        if response.status_code != 200:
-            print(f"Failed to create agent policy: {response.status_code} - {response.text}")
-            continue
+def get_package_policies(desired):
+    """Ids of the package policies that currently exist, by name."""
+    return {name: item['id'] for name, item in fleet.cache.package_policies().items()}
+
+def create_package_policy(name, package_policy_payload):
+    package_policy_url = "/api/fleet/package_policies"
 
-        agent_policy_id = response.json()['item']['id']
-        print(f"Created agent policy '{agent_policy_name}' with ID: {agent_policy_id}")
+    response = client.kibana.post(
+        package_policy_url,
+        headers=HEADERS,
+        json=package_policy_payload
+    )
+
+    if response.status_code != 200:
+        print(f"Failed to create package policy: {response.status_code} - {response.text}")
+        return None
+
+    fleet.cache.invalidate('package_policies')
+    print(f"Integration {name} installed successfully.")
+    return response.json()['item']['id']
+
+def update_package_policy(name, package_policy_id, package_policy_payload):
+    response = client.kibana.put(
+        f"/api/fleet/package_policies/{package_policy_id}",
+        headers=HEADERS,
+        json=package_policy_payload
+    )
+
+    if response.status_code != 200:
+        print(f"Failed to update package policy: {response.status_code} - {response.text}")
+        return None
+
+    fleet.cache.invalidate('package_policies')
+    print(f"Integration {name} updated successfully.")
+    return package_policy_id
 
 def load():
-    create_agent_policies()
+    agent_policy_ids = create_agent_policies()
     """Process and create package policies from JSON files in the 'integrations' directory."""
     integration_files = glob.glob('integrations/*.json')
 
+    desired = {}
     for integration_file in integration_files:
         # Load the package policy configuration from the JSON file
         with open(integration_file, 'r') as config_file:
@@ -87,7 +120,7 @@ def load():
             continue
 
         # Retrieve the agent policy ID
-        agent_policy_id = get_agent_policy_id(agent_policy_name)
+        agent_policy_id = agent_policy_ids.get(agent_policy_name) or get_agent_policy_id(agent_policy_name)
         if not agent_policy_id:
             print(f"Agent policy '{agent_policy_name}' not found for {integration_file}")
             continue
@@ -100,17 +133,7 @@ def load():
 
         package_policy_payload = package_policy.copy()
         package_policy_payload['policy_id'] = agent_policy_id  # Assign the agent policy ID
-        package_policy_url = f"{KIBANA_URL}/api/fleet/package_policies"
-
-        response = requests.post(
-            package_policy_url,
-            headers=HEADERS,
-            auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD']),
-            json=package_policy_payload
-        )
-
-        if response.status_code != 200:
-            print(f"Failed to create package policy: {response.status_code} - {response.text}")
-            continue
+        desired[package_policy_payload.get('name', integration_file)] = package_policy_payload
 
-        print(f"Integration from {integration_file} installed successfully.")
+    Reconciler('package_policies', fetch=get_package_policies, create=create_package_policy,
+               update=update_package_policy).apply(desired)
@@ -1,23 +1,44 @@
 import os
-import requests
+import json
+
+import client
+from reconcile import Reconciler
 
 KIBANA_RESOURCES_PATH = 'kibana'
 TIMEOUT = 10
 
+def get_imported(desired):
+    """The ndjson files all of whose saved objects already exist, checked in one _bulk_get."""
+    objects = {}
+    for file, dashboards in desired.items():
+        objects[file] = [{'type': saved_object['type'], 'id': saved_object['id']}
+                         for saved_object in map(json.loads, filter(str.strip, dashboards.splitlines()))
+                         if 'type' in saved_object and 'id' in saved_object]
+
+    resp = client.kibana.post("/api/saved_objects/_bulk_get",
+                              json=[saved_object for file_objects in objects.values() for saved_object in file_objects],
+                              timeout=TIMEOUT)
+    resp.raise_for_status()
+    found = {(saved_object['type'], saved_object['id'])
+             for saved_object in resp.json()['saved_objects'] if 'error' not in saved_object}
+    return {file: file for file, file_objects in objects.items()
+            if all((saved_object['type'], saved_object['id']) in found for saved_object in file_objects)}
+
+def import_saved_objects(file, dashboards):
+    resp = client.kibana.post("/api/saved_objects/_import",
+                              files={"file": ("export.ndjson", dashboards)}, timeout=TIMEOUT,
+                              params={'compatibilityMode': True, 'overwrite': True})
+    resp_json = resp.json()
+    print(resp_json)
+    return file if resp_json.get('success') else None
+
 def load():
 
+    desired = {}
     for file in os.listdir(KIBANA_RESOURCES_PATH):
         if file.endswith(".ndjson"):
             with open(os.path.join(KIBANA_RESOURCES_PATH, file), "rt", encoding='utf8') as f:
-                dashboards = f.read()
-                resp = requests.post(f"{os.environ['KIBANA_URL']}/api/saved_objects/_import",
-                                     files={"file": ("export.ndjson", dashboards)}, timeout=TIMEOUT,
-                                     auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD']), 
-                                     headers={"kbn-xsrf": "reporting"},
-                                     params={'compatibilityMode': True, 'overwrite': True})
-                print(resp.json())
-
-
-
+                desired[file] = f.read()
 
-                
\ No newline at end of file
+    Reconciler('saved_objects', fetch=get_imported, create=import_saved_objects,
+               update=lambda file, _, dashboards: import_saved_objects(file, dashboards)).apply(desired)
@@ -0,0 +1,118 @@
+"""
+Downloads a recorded log archive and installs it under /var/log in one pass.
+
+The .tar.gz is streamed from the URL (or a local file) through gunzip and tar,
+dates are shifted line by line with logshift, and each log is written straight
+to its final place, so nothing but the logs themselves touches the disk.
+
+    python logfetch.py full
+    python logfetch.py truncated --source /tmp/logs_truncated_20241028_133026.tar.gz --dest /tmp/var/log
+"""
+import argparse
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import time
+import urllib.request
+from datetime import date
+
+import logshift
+
+S3_BASE = 'https://david-hope-elastic-snapshots.s3.us-east-2.amazonaws.com'
+TIMESTAMPS = {
+    'full': '20241028_133026',
+    'truncated': '20241028_133026',
+}
+LOG_DIRS = ('nginx_backend', 'nginx_frontend', 'mysql')
+DEST_ROOT = '/var/log'
+COPY_BUFFER_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60
+
+def archive_url(log_type):
+    return f"{S3_BASE}/logs_{log_type}_{TIMESTAMPS[log_type]}.tar.gz"
+
+def open_source(source):
+    """Opens a URL or local path as a readable binary stream."""
+    if source.startswith(('http://', 'https://')):
+        # urllib rather than requests: this runs under sudo, outside the app's virtualenv
+        return urllib.request.urlopen(source, timeout=DOWNLOAD_TIMEOUT)
+    return open(source, 'rb')
+
+def destination(member_name, dest_root):
+    """Where an archive member belongs under dest_root, or None if it is not one of the logs we install."""
+    name = posixpath.normpath(member_name.lstrip('/'))
+    parts = name.split('/')
+    if len(parts) < 4 or parts[:2] != ['var', 'log'] or parts[2] not in LOG_DIRS or '..' in parts:
+        return None
+    return os.path.join(dest_root, *parts[2:])
+
+def install_member(src, path, mode, offset):
+    """Writes one member to path through a temp file and rename, shifting dates unless offset is None."""
+    substitutions = logshift.substitutions_for(path, offset) if offset is not None else None
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        if substitutions is None:
+            with os.fdopen(fd, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+        else:
+            # streamed tar members are not seekable, which TextIOWrapper insists on
+            lines = (line.decode('utf8', 'surrogateescape') for line in src)
+            with os.fdopen(fd, 'w', encoding='utf8', errors='surrogateescape', newline='') as dst:
+                dst.writelines(logshift.shift_lines(lines, substitutions))
+        os.chmod(tmp_path, mode & 0o7777)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def fetch(source, *, dest_root=DEST_ROOT, overwrite=True, offset=None):
+    """
+    Streams the archive at source (URL or path) into dest_root. Existing files
+    are replaced only when overwrite is set. Dates are shifted by offset unless
+    it is None. Returns the paths written.
+    """
+    written = []
+    skipped = 0
+    start = time.monotonic()
+    with open_source(source) as raw, tarfile.open(fileobj=raw, mode='r|gz') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            path = destination(member.name, dest_root)
+            if path is None:
+                continue
+            if not overwrite and os.path.exists(path):
+                skipped += 1
+                continue
+            install_member(archive.extractfile(member), path, member.mode, offset)
+            print(f"Installed {path}")
+            written.append(path)
+
+    print(f"Installed {len(written)} log files in {time.monotonic() - start:.1f}s"
+          + (f", kept {skipped} existing" if skipped else ""))
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download recorded logs into /var/log, shifting their dates.")
+    parser.add_argument('log_type', choices=sorted(TIMESTAMPS))
+    parser.add_argument('--no-timestamp-processing', dest='process_timestamps', action='store_false')
+    parser.add_argument('--source', help="archive URL or local .tar.gz (default: the published archive for log_type)")
+    parser.add_argument('--dest', default=DEST_ROOT, help=f"where the log directories go (default: {DEST_ROOT})")
+    parser.add_argument('--target-end', type=date.fromisoformat, default=None,
+                        help="day the latest logs should land on (default: yesterday)")
+    args = parser.parse_args(argv)
+
+    source = args.source or archive_url(args.log_type)
+    offset = logshift.default_offset(logshift.SOURCE_END, args.target_end) if args.process_timestamps else None
+    print(f"Downloading {args.log_type} logs from {source}...")
+    if offset is not None:
+        print(f"Adjusting dates in log files by {offset}...")
+    # full logs replace what is there, truncated ones never clobber existing files
+    fetch(source, dest_root=args.dest, overwrite=args.log_type == 'full', offset=offset)
+
+if __name__ == '__main__':
+    main()
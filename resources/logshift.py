@@ -0,0 +1,161 @@
+"""
+Shifts the timestamps in recorded nginx and mysql logs by a fixed offset.
+
+Each file is streamed once through compiled per-format patterns and written
+back atomically; files are processed in parallel across cores.
+
+    python logshift.py --source-end 2024-10-28 /tmp/logs/var/log/nginx_backend /tmp/logs/var/log/mysql
+"""
+import argparse
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+# Latest day recorded in the published log archives
+SOURCE_END = date(2024, 10, 28)
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+MONTH_NUMBERS = {month: number for number, month in enumerate(MONTHS, start=1)}
+
+# [28/Oct/2024:13:45:01 +0000]
+NGINX_ACCESS = re.compile(r'\[(\d{2})/([A-Z][a-z]{2})/(\d{4}):(\d{2}):(\d{2}):(\d{2})')
+# 2024/10/28 13:45:01
+NGINX_ERROR = re.compile(r'(\d{4})/(\d{2})/(\d{2}) (\d{2}):(\d{2}):(\d{2})')
+# 2024-10-28T13:45:01.123456Z (general log, 8.0 error log)
+MYSQL_ISO = re.compile(r'(\d{4})-(\d{2})-(\d{2})([T ])(\d{2}):(\d{2}):(\d{2})')
+# Time: 2024-10-28T13:45:01.123456Z (slow query log entry header)
+MYSQL_SLOW_TIME = re.compile(r'(Time: )(\d{4})-(\d{2})-(\d{2})([T ])(\d{2}):(\d{2}):(\d{2})')
+# 241028 13:45:01 (5.x error log)
+MYSQL_SHORT = re.compile(r'^(\d{2})(\d{2})(\d{2})(\s+)(\d{1,2}):(\d{2}):(\d{2})')
+
+def _nginx_access(offset):
+    def shift(match):
+        day, month, year, hour, minute, second = match.groups()
+        ts = datetime(int(year), MONTH_NUMBERS[month], int(day), int(hour), int(minute), int(second)) + offset
+        return f"[{ts.day:02d}/{MONTHS[ts.month - 1]}/{ts.year:04d}:{ts.hour:02d}:{ts.minute:02d}:{ts.second:02d}"
+    return [(NGINX_ACCESS, shift)]
+
+def _nginx_error(offset):
+    def shift(match):
+        ts = datetime(*map(int, match.groups())) + offset
+        return ts.strftime('%Y/%m/%d %H:%M:%S')
+    return [(NGINX_ERROR, shift)]
+
+def _mysql_iso(offset):
+    def shift(match):
+        year, month, day, separator, hour, minute, second = match.groups()
+        ts = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second)) + offset
+        return ts.strftime(f'%Y-%m-%d{separator}%H:%M:%S')
+    return [(MYSQL_ISO, shift)]
+
+def _mysql_slow(offset):
+    # only the headers: a datetime in the logged SQL is query text, not a timestamp
+    def shift(match):
+        prefix, year, month, day, separator, hour, minute, second = match.groups()
+        ts = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second)) + offset
+        return prefix + ts.strftime(f'%Y-%m-%d{separator}%H:%M:%S')
+    return [(MYSQL_SLOW_TIME, shift)]
+
+def _mysql_error(offset):
+    def shift(match):
+        year, month, day, space, hour, minute, second = match.groups()
+        ts = datetime(2000 + int(year), int(month), int(day), int(hour), int(minute), int(second)) + offset
+        # mysqld pads single digit hours with a space rather than a zero
+        hour = f"{ts.hour:02d}" if len(hour) == 2 else str(ts.hour)
+        return f"{ts.year % 100:02d}{ts.month:02d}{ts.day:02d}{space}{hour}:{ts.minute:02d}:{ts.second:02d}"
+    return [(MYSQL_SHORT, shift)] + _mysql_iso(offset)
+
+def substitutions_for(path, offset):
+    """Patterns to apply to a log file, chosen by its name as download-logs.sh did; None to leave it alone."""
+    name = os.path.basename(path)
+    if name.endswith('access.log'):
+        return _nginx_access(offset)
+    if name.endswith('mysql-slow.log'):
+        return _mysql_slow(offset)
+    if name.endswith('mysql.log'):
+        return _mysql_iso(offset)
+    if name.endswith('error.log'):
+        return _mysql_error(offset) if 'mysql' in path else _nginx_error(offset)
+    return None
+
+def shift_lines(lines, substitutions):
+    """Yields the lines with every timestamp shifted."""
+    for line in lines:
+        for pattern, shift in substitutions:
+            line = pattern.sub(shift, line)
+        yield line
+
+def shift_file(path, offset):
+    """Rewrites one log file in place (via a temp file and rename); returns (path, shifted)."""
+    substitutions = substitutions_for(path, offset)
+    if substitutions is None:
+        return path, False
+
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        # surrogateescape passes through any bytes that are not valid UTF-8 untouched
+        with open(path, 'r', encoding='utf8', errors='surrogateescape', newline='') as src, \
+                os.fdopen(fd, 'w', encoding='utf8', errors='surrogateescape', newline='') as dst:
+            dst.writelines(shift_lines(src, substitutions))
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path, True
+
+def iter_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for parent, _, files in os.walk(path):
+                for file in files:
+                    yield os.path.join(parent, file)
+        elif os.path.isfile(path):
+            yield path
+        else:
+            print(f"{path} does not exist, skipping.")
+
+def shift_files(paths, offset, workers=None):
+    """Shifts every log file under paths by offset, in parallel; returns the files that were rewritten."""
+    files = list(iter_files(paths))
+    # the biggest files go first so one of them does not finish the run alone
+    files.sort(key=os.path.getsize, reverse=True)
+    shifted = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, changed in pool.map(shift_file, files, [offset] * len(files)):
+            if changed:
+                print(f"Processed {path}")
+                shifted.append(path)
+    return shifted
+
+def default_offset(source_end=SOURCE_END, target_end=None):
+    """Whole days moving source_end to target_end (yesterday by default), as download-logs.sh did."""
+    if target_end is None:
+        target_end = date.today() - timedelta(days=1)
+    return timedelta(days=(target_end - source_end).days)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shift timestamps in recorded nginx/mysql logs.")
+    parser.add_argument('paths', nargs='+', help="log files or directories to rewrite in place")
+    parser.add_argument('--source-end', type=date.fromisoformat, default=SOURCE_END,
+                        help=f"latest day in the logs (default: {SOURCE_END})")
+    parser.add_argument('--target-end', type=date.fromisoformat, default=None,
+                        help="day the latest logs should land on (default: yesterday)")
+    parser.add_argument('--offset-seconds', type=float, default=None,
+                        help="shift by an arbitrary number of seconds instead of whole days")
+    parser.add_argument('--workers', type=int, default=None, help="parallel processes (default: number of cores)")
+    args = parser.parse_args(argv)
+
+    if args.offset_seconds is not None:
+        offset = timedelta(seconds=args.offset_seconds)
+    else:
+        offset = default_offset(args.source_end, args.target_end)
+    print(f"Adjusting dates in log files by {offset}...")
+    shift_files(args.paths, offset, args.workers)
+
+if __name__ == '__main__':
+    main()
@@ -1,202 +1,306 @@
-from elasticsearch import Elasticsearch
 import os
 from pathlib import Path
 import json
 import time
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from client import es_client, kibana
+from waiter import Waiter, WaitFailed
+from reconcile import Reconciler
 
 TIMEOUT = 10
+TRAINED_MODEL_TIMEOUT = 900
+INTEGRATION_JOB_WORKERS = int(os.environ.get('ML_INTEGRATION_JOB_WORKERS', 4))
+# how long the integration document count must hold still before ingestion counts as finished
+INTEGRATION_DATA_SETTLE_S = float(os.environ.get('ML_INTEGRATION_DATA_SETTLE_S', 60))
 
 def load_trained(*, replace=True):
-    with Elasticsearch(os.environ['ELASTICSEARCH_URL'], basic_auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD'])) as client:
-
-        inference_processors = []
-
-        for file in os.listdir("ml/trained/job"):
-            
-            with open(os.path.join("ml/trained/job", file), 'r') as job:
-                filename = Path(file).stem
-                print("preparing trained ml job {filename}")
-
-                if replace:
-                    try:
-                        print(f"looking for old pipelines ml-inference-{filename}*")
-                        result = client.ingest.get_pipeline(id=f"ml-inference-{filename}*")
-                        for _, pipeline_id in enumerate(result.keys()):
-                                print(f"deleting old pipeline {pipeline_id}")
-                                res = client.ingest.delete_pipeline(id=pipeline_id)
-                    except Exception as inst:
-                        print(f"unable to delete old pipelines ml-inference-{filename}*: {inst}")
-                    
-                    try:
-                        print(f"looking for old trained models {filename}*")
-                        result = client.ml.get_trained_models(model_id=f"{filename}*")
-                        for trained_model_config in result['trained_model_configs']:
-                            print(f"deleting old trained model {filename}*")
-                            res = client.ml.delete_trained_model(model_id=trained_model_config['model_id'], force=True)
-                    except Exception as inst:
-                        print(f"unable to delete old trained models {filename}*: {inst}")
-                              
-                    try:
-                        print(f"deleting old data frame analytics {filename}*")
-                        result = client.ml.delete_data_frame_analytics(id=filename, force=True)
-                    except Exception as inst:
-                        print(f"unable to delete old data frame analytics {filename}*: {inst}")
-                    
-                    try:
-                        print(f"deleting old index {filename}")
-                        result = client.indices.delete(index=filename)
-                    except Exception as inst:
-                        print(f"unable to delete old index {filename}: {inst}")
-
-                json_job = json.load(job)
+    client = es_client()
 
-                try:
-                    print("create trained ml job {filename}")
-                    client.ml.put_data_frame_analytics(id=filename, body=json_job)
-                except Exception as inst:
-                    print(f"create trained ml job {filename}: {inst}")
+    start = time.monotonic()
+    inference_processors = []
+    waiter = Waiter(timeout=TRAINED_MODEL_TIMEOUT)
 
-                try:
-                    print(f"start data frame analytics {filename}")
-                    res = client.ml.start_data_frame_analytics(id=filename)
-                    print(res)
-                except Exception as inst:
-                    print(f"started data frame analytics {filename}: {inst}")
-                
-                for _ in range(5):
-                    time.sleep(2)
-                    
-                    try:
-                        print(f"get trained models {filename}")
-                        result = client.ml.get_trained_models(model_id=f"{filename}*")
-                        if len(result['trained_model_configs']) == 0:
-                            continue
-                        
-                        model = result['trained_model_configs'][0]
-                            
-                        with open(os.path.join("ml/trained/pipeline", file), 'r') as pipeline:
-                            print("preparing pipeline {filename}")
-                            
-                            raw_pipeline = pipeline.read()
-                            raw_pipeline = raw_pipeline.replace("{{ MODEL_ID }}", model['model_id'])
-                            json_pipeline = json.loads(raw_pipeline)
-                            
-                            print("create pipeline {filename}")
-                            res = client.ingest.put_pipeline(id=f"ml-inference-{model['model_id']}", body=json_pipeline)
-                            
-                            inference_processors.append({
-                                        "pipeline": {
-                                            "name": f"ml-inference-{model['model_id']}",
-                                            "ignore_missing_pipeline": True,
-                                            "ignore_failure": True
-                                        }
-                                    })
-                        break
-                    except Exception as inst:
-                        print(f"started data frame analytics {filename}: {inst}")
-                        
-                        
-        body = {
-            "processors": inference_processors
-        }
-        print("setting apm pipelines {body}")
-        res = client.ingest.put_pipeline(id="traces-apm@custom", body=body)
+    def add_inference_pipeline(filename, model, file):
+        with open(os.path.join("ml/trained/pipeline", file), 'r') as pipeline:
+            print("preparing pipeline {filename}")
 
+            raw_pipeline = pipeline.read()
+            raw_pipeline = raw_pipeline.replace("{{ MODEL_ID }}", model['model_id'])
+            json_pipeline = json.loads(raw_pipeline)
 
-def load_anomaly(*, replace=False):
-    with Elasticsearch(os.environ['ELASTICSEARCH_URL'], basic_auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD'])) as client:
+            print("create pipeline {filename}")
+            res = client.ingest.put_pipeline(id=f"ml-inference-{model['model_id']}", body=json_pipeline)
 
-        for file in os.listdir("ml/anomaly/job"):
-            with open(os.path.join("ml/anomaly/job", file), 'r') as job:
-                filename = Path(file).stem
-                json_job = json.load(job)
+            inference_processors.append({
+                        "pipeline": {
+                            "name": f"ml-inference-{model['model_id']}",
+                            "ignore_missing_pipeline": True,
+                            "ignore_failure": True
+                        }
+                    })
 
-                if replace:
-                    client.ml.stop_datafeed(datafeed_id=json_job['datafeed_config']['datafeed_id'])
-                    client.ml.close_job(job_id=filename)
-                    client.ml.delete_job(job_id=filename, delete_user_annotations=True)
+    for file in os.listdir("ml/trained/job"):
+        
+        with open(os.path.join("ml/trained/job", file), 'r') as job:
+            filename = Path(file).stem
+            print("preparing trained ml job {filename}")
 
+            if replace:
                 try:
-                    client.ml.put_job(job_id=filename, body=json_job)
+                    print(f"looking for old pipelines ml-inference-{filename}*")
+                    result = client.ingest.get_pipeline(id=f"ml-inference-{filename}*")
+                    for _, pipeline_id in enumerate(result.keys()):
+                            print(f"deleting old pipeline {pipeline_id}")
+                            res = client.ingest.delete_pipeline(id=pipeline_id)
                 except Exception as inst:
-                    print(inst)
-                    
+                    print(f"unable to delete old pipelines ml-inference-{filename}*: {inst}")
+                
                 try:
-                    client.ml.open_job(job_id=filename)
+                    print(f"looking for old trained models {filename}*")
+                    result = client.ml.get_trained_models(model_id=f"{filename}*")
+                    for trained_model_config in result['trained_model_configs']:
+                        print(f"deleting old trained model {filename}*")
+                        res = client.ml.delete_trained_model(model_id=trained_model_config['model_id'], force=True)
                 except Exception as inst:
-                    print(inst)
-  
+                    print(f"unable to delete old trained models {filename}*: {inst}")
+                          
                 try:
-                    client.ml.start_datafeed(datafeed_id=json_job['datafeed_config']['datafeed_id'])
+                    print(f"deleting old data frame analytics {filename}*")
+                    result = client.ml.delete_data_frame_analytics(id=filename, force=True)
                 except Exception as inst:
-                    print(inst)
+                    print(f"unable to delete old data frame analytics {filename}*: {inst}")
+                
+                try:
+                    print(f"deleting old index {filename}")
+                    result = client.indices.delete(index=filename)
+                except Exception as inst:
+                    print(f"unable to delete old index {filename}: {inst}")
 
-def load_integration_jobs(config_path="ml-integrations/config.json", replace=False):
+            json_job = json.load(job)
+
+            try:
+                print("create trained ml job {filename}")
+                client.ml.put_data_frame_analytics(id=filename, body=json_job)
+            except Exception as inst:
+                print(f"create trained ml job {filename}: {inst}")
+
+            try:
+                print(f"start data frame analytics {filename}")
+                res = client.ml.start_data_frame_analytics(id=filename)
+                print(res)
+            except Exception as inst:
+                print(f"started data frame analytics {filename}: {inst}")
+
+            # all jobs are started before any is waited on; see below
+            waiter.add(filename, trained_model_probe(client, filename),
+                       on_ready=lambda name, model, file=file: add_inference_pipeline(name, model, file))
+
+    results = waiter.run()
+    for filename, (outcome, _, seconds) in sorted(results.items()):
+        print(f"trained ml job {filename}: {outcome} after {seconds:.1f}s")
 
+    body = {
+        "processors": sorted(inference_processors, key=lambda processor: processor['pipeline']['name'])
+    }
+    print("setting apm pipelines {body}")
+    res = client.ingest.put_pipeline(id="traces-apm@custom", body=body)
+    print(f"trained ml jobs set up in {time.monotonic() - start:.1f}s")
+
+def trained_model_probe(client, filename):
+    """Probe for waiter: the trained model of a data frame analytics job, once it exists."""
+    def probe():
+        result = client.ml.get_trained_models(model_id=f"{filename}*")
+        if len(result['trained_model_configs']) > 0:
+            return result['trained_model_configs'][0]
+        stats = client.ml.get_data_frame_analytics_stats(id=filename)
+        for job_stats in stats['data_frame_analytics']:
+            if job_stats['state'] == 'failed':
+                raise WaitFailed(job_stats.get('failure_reason', 'data frame analytics failed'))
+        return None
+    return probe
+
+
+def load_anomaly(*, replace=False):
+    client = es_client()
+
+    def get_jobs(desired):
+        result = client.ml.get_jobs(job_id='_all')
+        return {job['job_id']: job['job_id'] for job in result['jobs']}
+
+    def create_job(filename, json_job):
+        # anything but "already there" propagates, so the reconciler does not record the job as applied
+        try:
+            client.ml.put_job(job_id=filename, body=json_job)
+        except Exception as inst:
+            if not _already_exists(inst):
+                raise
+            print(f"Job {filename} already exists")
+
+        client.ml.open_job(job_id=filename)
+
+        try:
+            client.ml.start_datafeed(datafeed_id=json_job['datafeed_config']['datafeed_id'])
+        except Exception as inst:
+            # 409: already started
+            if not _conflict(inst):
+                raise
+        return filename
+
+    def replace_job(filename, job_id, json_job):
+        client.ml.stop_datafeed(datafeed_id=json_job['datafeed_config']['datafeed_id'], force=True)
+        client.ml.close_job(job_id=filename, force=True)
+        client.ml.delete_job(job_id=filename, delete_user_annotations=True)
+        return create_job(filename, json_job)
+
+    desired = {}
+    for file in os.listdir("ml/anomaly/job"):
+        with open(os.path.join("ml/anomaly/job", file), 'r') as job:
+            desired[Path(file).stem] = json.load(job)
+
+    # replacing a job throws away its model state and annotations, so existing jobs are only
+    # replaced with replace=True, as before; otherwise they are adopted as they are
+    Reconciler('anomaly_jobs', fetch=get_jobs, create=create_job,
+               update=replace_job if replace else None).apply(desired, force=replace)
+
+# last document count seen by integration_data_ready, and since when it has not changed
+_integration_data = {'count': None, 'since': None}
+
+def integration_data_ready(config_path="ml-integrations/config.json"):
+    """
+    True once the agent has finished shipping the integration jobs' documents:
+    there are some, and their count has not changed for
+    INTEGRATION_DATA_SETTLE_S seconds. The bring-up step bounds the wait.
+    """
     with open(config_path, 'r') as f:
-        config = json.load(f)
+        attributes = json.load(f).get('attributes', {})
 
-    attributes = config.get('attributes', {})
-    jobs = attributes.get('jobs', [])
-    datafeeds = attributes.get('datafeeds', [])
-    query = attributes.get('query', {})
-    default_index_pattern = attributes.get('defaultIndexPattern', 'logs-*')
+    client = es_client()
+    result = client.count(index=attributes.get('defaultIndexPattern', 'logs-*'),
+                          query=attributes.get('query', {'match_all': {}}),
+                          ignore_unavailable=True, allow_no_indices=True)
+    count = result['count']
+    now = time.monotonic()
+    if count != _integration_data['count']:
+        _integration_data.update(count=count, since=now)
+    settled = now - _integration_data['since']
+    print(f"integration data available: {count} documents, unchanged for {settled:.0f}s")
+    return count > 0 and settled >= INTEGRATION_DATA_SETTLE_S
+
+def _already_exists(inst):
+    return getattr(inst, 'error', None) == 'resource_already_exists_exception'
+
+def _conflict(inst):
+    meta = getattr(inst, 'meta', None)
+    return getattr(meta, 'status', None) == 409
 
-    es = Elasticsearch(
-        os.environ['ELASTICSEARCH_URL'],
-        basic_auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD'])
-    )
+def provision_integration_job(es, job_entry, datafeeds, *, replace=False):
+    """
+    Creates and opens one anomaly detection job, then creates and starts its
+    datafeeds, deleting the existing ones first with replace=True. A job
+    without a 'config' only gets its datafeeds. Returns the state the job
+    reached, how long it took and the error it stopped on.
+    """
+    job_id = job_entry['id']
+    job_config = job_entry.get('config')
+    result = {'state': 'pending', 'seconds': 0.0, 'error': None}
+    start = time.monotonic()
 
-    # Create ML Jobs
-    for job_entry in jobs:
-        job_id = job_entry['id']
-        job_config = job_entry['config']
-        if replace:
+    def fail(state, e):
+        result.update(state=state, error=str(e), seconds=time.monotonic() - start)
+        return result
+
+    if replace:
+        result['state'] = 'deleting'
+        print(f"Deleting existing job: {job_id}")
+        deletions = []
+        for datafeed_entry in datafeeds or [{'id': f"datafeed-{job_id}"}]:
+            deletions.append((es.ml.stop_datafeed, {'datafeed_id': datafeed_entry['id'], 'force': True}))
+            deletions.append((es.ml.delete_datafeed, {'datafeed_id': datafeed_entry['id'], 'force': True}))
+        if job_config is not None:
+            deletions.append((es.ml.close_job, {'job_id': job_id, 'force': True}))
+            deletions.append((es.ml.delete_job, {'job_id': job_id, 'force': True}))
+        for delete, kwargs in deletions:
             try:
-                print(f"Deleting existing job: {job_id}")
-                es.ml.stop_datafeed(datafeed_id=f"datafeed-{job_id}", force=True)
-                es.ml.close_job(job_id=job_id, force=True)
-                es.ml.delete_job(job_id=job_id, force=True)
+                delete(**kwargs)
             except Exception as e:
                 print(f"Could not delete job {job_id}: {e}")
 
+    if job_config is not None:
+        result['state'] = 'creating job'
+        print(f"Creating job: {job_id}")
         try:
-            print(f"Creating job: {job_id}")
             es.ml.put_job(job_id=job_id, body=job_config)
+        except Exception as e:
+            if not _already_exists(e):
+                print(f"Error creating job {job_id}: {e}")
+                return fail('job failed', e)
+            print(f"Job {job_id} already exists")
+        try:
             es.ml.open_job(job_id=job_id)
         except Exception as e:
-            print(f"Error creating job {job_id}: {e}")
+            print(f"Error opening job {job_id}: {e}")
+            return fail('job failed', e)
+        result['state'] = 'job opened'
 
-    # Create Datafeeds
+    # datafeeds only once their job is open
     for datafeed_entry in datafeeds:
         datafeed_id = datafeed_entry.get('id')
-        datafeed_config = datafeed_entry.get('config')
-        datafeed_config['indices'] = [default_index_pattern]
-        if replace:
-            try:
-                print(f"Deleting existing datafeed: {datafeed_id}")
-                es.ml.stop_datafeed(datafeed_id=datafeed_id, force=True)
-                es.ml.delete_datafeed(datafeed_id=datafeed_id, force=True)
-            except Exception as e:
-                print(f"Could not delete datafeed {datafeed_id}: {e}")
-
+        result['state'] = 'creating datafeed'
+        print(f"Creating datafeed: {datafeed_id}")
+        try:
+            es.ml.put_datafeed(datafeed_id=datafeed_id, body=datafeed_entry.get('config'))
+        except Exception as e:
+            if not _already_exists(e):
+                print(f"Error creating datafeed {datafeed_id}: {e}")
+                return fail('datafeed failed', e)
+            print(f"Datafeed {datafeed_id} already exists")
         try:
-            print(f"Creating datafeed: {datafeed_id}")
-            es.ml.put_datafeed(datafeed_id=datafeed_id, body=datafeed_config)
             es.ml.start_datafeed(datafeed_id=datafeed_id)
         except Exception as e:
-            print(f"Error creating datafeed {datafeed_id}: {e}")
-
-    es.close()
-
-    sync_resp = requests.get(
-        f"{os.environ['KIBANA_URL']}/api/ml/saved_objects/sync",
-        timeout=TIMEOUT,
-        auth=(
-            os.environ['ELASTICSEARCH_USER'],
-            os.environ['ELASTICSEARCH_PASSWORD']
-        ),
-        headers={"kbn-xsrf": "reporting"}
-    )
+            # 409: already started
+            if not _conflict(e):
+                print(f"Error starting datafeed {datafeed_id}: {e}")
+                return fail('datafeed failed', e)
+        result['state'] = 'datafeed started'
+
+    result['seconds'] = time.monotonic() - start
+    return result
+
+def load_integration_jobs(config_path="ml-integrations/config.json", replace=False):
+
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+
+    attributes = config.get('attributes', {})
+    jobs = attributes.get('jobs', [])
+    datafeeds = attributes.get('datafeeds', [])
+    default_index_pattern = attributes.get('defaultIndexPattern', 'logs-*')
+
+    datafeeds_by_job = {}
+    for datafeed_entry in datafeeds:
+        datafeed_config = datafeed_entry.get('config')
+        datafeed_config['indices'] = [default_index_pattern]
+        datafeeds_by_job.setdefault(datafeed_config.get('job_id'), []).append(datafeed_entry)
+
+    # each job and its datafeeds are provisioned in order by one worker;
+    # independent jobs run concurrently
+    es = es_client()
+    start = time.monotonic()
+    results = {}
+    with ThreadPoolExecutor(max_workers=INTEGRATION_JOB_WORKERS) as pool:
+        futures = {pool.submit(provision_integration_job, es, job_entry,
+                               datafeeds_by_job.pop(job_entry['id'], []), replace=replace): job_entry['id']
+                   for job_entry in jobs}
+        # datafeeds whose job is not in the config
+        for job_id, job_datafeeds in datafeeds_by_job.items():
+            futures[pool.submit(provision_integration_job, es, {'id': job_id}, job_datafeeds, replace=replace)] = job_id
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    print(f"ml integration jobs provisioned in {time.monotonic() - start:.1f}s")
+    for job_id, result in sorted(results.items()):
+        print(f"  {job_id:<40} {result['state']:<18} {result['seconds']:6.1f}s"
+              + (f"  {result['error']}" if result['error'] else ""))
+
+    sync_resp = kibana.get("/api/ml/saved_objects/sync", timeout=TIMEOUT)
     print(sync_resp.json())
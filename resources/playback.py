@@ -1,4 +1,3 @@
-import ndjson
 import requests
 import time
 from datetime import datetime, timezone, timedelta
@@ -8,6 +7,11 @@ import gzip
 import uuid
 import random
 import html
+import hashlib
+import heapq
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 def get_day_of_week(attributes):
     for attribute in attributes:
@@ -18,15 +22,82 @@ def overwrite_datasource(attributes):
     for attribute in attributes:
         if attribute['key'] == 'com.example.data_source':
             attribute['value'] = {'stringValue': 'playback'}
-            
-        
-def conform_time(parent, key, first_ts, ts_offset, last_ts):
+
+SIGNAL_PAYLOAD_TYPES = {
+    'traces': 'resourceSpans',
+    'metrics': 'resourceMetrics',
+    'logs': 'resourceLogs'
+}
+
+class IdRemapper:
+    """
+    Derives replayed trace and span IDs from a keyed BLAKE2b hash of the
+    recorded ID and the loop number, so no lookup table is kept and memory
+    stays constant however large the recording is. The same key and loop
+    always yield the same IDs; each loop yields a fresh set of traces.
+
+    Set PLAYBACK_ID_KEY (hex) to make replays reproducible across runs.
+    """
+
+    def __init__(self, key=None, loop=0):
+        if key is None:
+            key = bytes.fromhex(os.environ['PLAYBACK_ID_KEY']) if 'PLAYBACK_ID_KEY' in os.environ else os.urandom(16)
+        self.key = key
+        self.set_loop(loop)
+
+    def set_loop(self, loop):
+        self.loop = loop
+        salt = loop.to_bytes(16, 'big')
+        # keyed hashers are primed once per loop and copied per ID
+        self._trace_hasher = hashlib.blake2b(digest_size=16, key=self.key, salt=salt)
+        self._span_hasher = hashlib.blake2b(digest_size=8, key=self.key, salt=salt)
+
+    @staticmethod
+    def _derive(hasher, value):
+        # empty IDs (e.g. the parentSpanId of a root span) must stay empty
+        if not value:
+            return value
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            raw = value.encode('utf-8')
+        h = hasher.copy()
+        h.update(raw)
+        return h.hexdigest()
+
+    def trace_id(self, value):
+        return self._derive(self._trace_hasher, value)
+
+    def span_id(self, value):
+        return self._derive(self._span_hasher, value)
+
+    def remap_spans(self, spans):
+        """Remaps the IDs of a batch of spans (or log records) in place."""
+        derive = self._derive
+        trace_hasher = self._trace_hasher
+        span_hasher = self._span_hasher
+        for span in spans:
+            if 'traceId' in span:
+                span['traceId'] = derive(trace_hasher, span['traceId'])
+            if 'spanId' in span:
+                span['spanId'] = derive(span_hasher, span['spanId'])
+            if 'parentSpanId' in span:
+                span['parentSpanId'] = derive(span_hasher, span['parentSpanId'])
+            for link in span.get('links', ()):
+                link['traceId'] = derive(trace_hasher, link['traceId'])
+                link['spanId'] = derive(span_hasher, link['spanId'])
+        return spans
+
+def conform_time(parent, key, first_ts, ts_offset, last_ts, speed=1.0):
     if key in parent:
         ts = int(parent[key])
         if first_ts is None:
             first_ts = ts
             print("SET")
         ts -= first_ts
+        if speed != 1.0:
+            # compress (or stretch) the recording for faster than real-time replay
+            ts = int(ts / speed)
         if ts >= 0:
             parent[key] = ts+ts_offset
             if ts+ts_offset > last_ts:
@@ -36,25 +107,289 @@ def conform_time(parent, key, first_ts, ts_offset, last_ts):
 
 
 
-def parse(file, ts_offset=0, align_to_days=False):
+INDEX_SUFFIX = '.idx.json'
+INDEX_VERSION = 3
+INDEX_BUCKET_NS = 3600 * 10**9
+
+def index_path(file):
+    return file + INDEX_SUFFIX
+
+def _line_summary(data):
+    """Days of week of one recorded line's spans (in order of appearance) and its earliest timestamp."""
+    days = []
+    earliest = None
+    for span in data.get('resourceSpans', ()):
+        for scope in span['scopeSpans']:
+            for scope_span in scope['spans']:
+                dow = get_day_of_week(scope_span['attributes'])
+                if dow is not None and (not days or days[-1] != dow):
+                    days.append(dow)
+                ts = int(scope_span.get('startTimeUnixNano', 0))
+                if ts and (earliest is None or ts < earliest):
+                    earliest = ts
+    for log in data.get('resourceLogs', ()):
+        for scope_log in log['scopeLogs']:
+            for log_record in scope_log['logRecords']:
+                ts = int(log_record.get('timeUnixNano', 0))
+                if ts and (earliest is None or ts < earliest):
+                    earliest = ts
+    for metric in data.get('resourceMetrics', ()):
+        for scope in metric['scopeMetrics']:
+            for scope_metric in scope['metrics']:
+                for metricType in ('sum', 'gauge', 'histogram'):
+                    # not startTimeUnixNano: a cumulative point starts where its series did
+                    for datapoint in scope_metric.get(metricType, {}).get('dataPoints', ()):
+                        ts = int(datapoint.get('timeUnixNano', 0))
+                        if ts and (earliest is None or ts < earliest):
+                            earliest = ts
+    return days, earliest
+
+def build_index(file, bucket_ns=INDEX_BUCKET_NS):
+    """
+    Scans a recording once and writes a sidecar index next to it with the
+    byte offset of every day-of-week boundary, the first line of every time
+    bucket and the byte ranges holding each signal, so later replays can seek
+    instead of decoding everything before the window they want.
+
+    A line belongs to the latest bucket any line up to it reached, so the
+    buckets only move forward even if the recording is not quite in order.
+    """
+    stat = os.stat(file)
+    index = {
+        'version': INDEX_VERSION,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'bucket_ns': bucket_ns,
+        'days': [],
+        'buckets': [],
+        'signals': {payload_type: [] for payload_type in SIGNAL_PAYLOAD_TYPES.values()}
+    }
+    last_dow = None
+    offset = 0
+    with open(file, 'rb') as f:
+        for line in f:
+            end = offset + len(line)
+            if line.strip():
+                data = json.loads(line)
+                days, earliest = _line_summary(data)
+                for dow in days:
+                    if dow != last_dow:
+                        index['days'].append({'day': dow, 'offset': offset})
+                        last_dow = dow
+                if earliest is not None:
+                    bucket = earliest // bucket_ns * bucket_ns
+                    if not index['buckets'] or bucket > index['buckets'][-1][0]:
+                        index['buckets'].append([bucket, offset])
+                for payload_type, runs in index['signals'].items():
+                    if payload_type in data:
+                        if runs and runs[-1][1] == offset:
+                            runs[-1][1] = end
+                        else:
+                            runs.append([offset, end])
+            offset = end
+
+    tmp_path = index_path(file) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path(file))
+    print(f"indexed {file}: {len(index['days'])} day boundaries, {len(index['buckets'])} buckets")
+    return index
+
+def load_index(file):
+    """Returns the sidecar index of a recording, or None if missing or stale."""
+    try:
+        with open(index_path(file), encoding='utf-8') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return None
+    stat = os.stat(file)
+    if index.get('version') != INDEX_VERSION or index['size'] != stat.st_size or index['mtime_ns'] != stat.st_mtime_ns:
+        print(f"ignoring stale index {index_path(file)}")
+        return None
+    return index
+
+def seek_bucket(index, ts_ns):
+    """Offset of the first line in the time bucket holding ts_ns, or in the next one recorded; None past the end."""
+    bucket = ts_ns // index['bucket_ns'] * index['bucket_ns']
+    for start, offset in index['buckets']:
+        if start >= bucket:
+            return offset
+    return None
+
+def _time_window(index, since_ns, until_ns):
+    """Byte window [start, end) of the buckets from since_ns's to until_ns's (either may be None)."""
+    start = 0
+    if since_ns is not None:
+        start = seek_bucket(index, since_ns)
+        if start is None:
+            return 0, 0
+    end = None
+    if until_ns is not None:
+        end = seek_bucket(index, until_ns - 1 + index['bucket_ns'])
+    return start, end
+
+def index_window(index, align_to_days=False, day=None, time_window=None):
+    """
+    Byte window [start, end) to replay; end is None for end of file.
+    time_window (since_ns, until_ns) further narrows it to whole time buckets.
+    """
+    start, end = _day_window(index, align_to_days, day)
+    if time_window is not None:
+        time_start, time_end = _time_window(index, *time_window)
+        start = max(start, time_start)
+        if time_end is not None:
+            end = time_end if end is None else min(end, time_end)
+    return start, end
+
+def _day_window(index, align_to_days, day):
+    boundaries = index['days']
+    if day is not None:
+        for i, boundary in enumerate(boundaries):
+            if boundary['day'] == day:
+                end = boundaries[i + 1]['offset'] if i + 1 < len(boundaries) else None
+                # the boundary line may still hold spans of the next day
+                return boundary['offset'], (end + 1 if end is not None else None)
+        return 0, 0
+    if align_to_days:
+        start = None
+        tuesday_seen = False
+        for boundary in boundaries:
+            if start is None:
+                if boundary['day'] == 'M':
+                    start = boundary['offset']
+            elif boundary['day'] == 'Tu':
+                tuesday_seen = True
+            elif tuesday_seen and boundary['day'] == 'M':
+                # parse() still stops on the first span of the next Monday
+                return start, boundary['offset'] + 1
+        return (start if start is not None else 0), None
+    return 0, None
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+class TimeWindow:
+    """
+    The window _time_window() picks, found line by line from the lines'
+    timestamps when there is no index.
+    """
+
+    def __init__(self, since_ns, until_ns, bucket_ns=None):
+        bucket_ns = bucket_ns or INDEX_BUCKET_NS
+        self.first_bucket = None if since_ns is None else since_ns // bucket_ns * bucket_ns
+        self.last_bucket = None if until_ns is None else (until_ns - 1) // bucket_ns * bucket_ns
+        self.bucket_ns = bucket_ns
+        self.bucket = None
+
+    def accept(self, earliest):
+        """(whether to replay a line with this earliest timestamp, whether the window ended before it)."""
+        if earliest is not None:
+            bucket = earliest // self.bucket_ns * self.bucket_ns
+            if self.bucket is None or bucket > self.bucket:
+                self.bucket = bucket
+        if self.last_bucket is not None and self.bucket is not None and self.bucket > self.last_bucket:
+            return False, True
+        if self.first_bucket is None:
+            return True, False
+        return self.bucket is not None and self.bucket >= self.first_bucket, False
+
+class DayWindow:
+    """
+    The window index_window() picks, found line by line from the spans' days
+    when there is no index: lines before it are skipped, and its last line is
+    the one where the next day (or, aligned to days, the second Monday) starts.
+    """
+
+    def __init__(self, day=None):
+        self.day = day
+        self.first_day = day or 'M'
+        self.started = False
+        self.tuesday_seen = False
+
+    def accept(self, days):
+        """(whether to replay a line with these span days, whether it is the window's last)."""
+        if not self.started:
+            if self.first_day not in days:
+                return False, False
+            self.started = True
+            days = days[days.index(self.first_day) + 1:]
+        if self.day is not None:
+            return True, any(dow != self.day for dow in days)
+        for dow in days:
+            if dow == 'Tu':
+                self.tuesday_seen = True
+            elif self.tuesday_seen and dow == 'M':
+                return True, True
+        return True, False
+
+def read_ranges(f, ranges):
+    """Yields the lines of a binary file starting inside the given byte ranges."""
+    for start, end in ranges:
+        f.seek(start)
+        offset = start
+        while end is None or offset < end:
+            line = f.readline()
+            if not line:
+                break
+            offset += len(line)
+            yield line
+
+def parse(file, ts_offset=0, align_to_days=False, id_remapper=None, speed=1.0, *, index=None, day=None, signals=None,
+          time_window=None):
+    if id_remapper is None:
+        id_remapper = IdRemapper()
     first_ts = None
     last_ts = ts_offset
     first_monday_done = False
+    day_seen = day_done = False
     out_data = {}
     out_data['resourceSpans'] = []
     out_data['resourceLogs'] = []
     out_data['resourceMetrics'] = []
-    
-    uuids = {
-        'traceId': {},
-        'spanId': {}
-    }
-    
-    with open(file, encoding='utf-8') as f:
-        datas = ndjson.load(f)
-        for data in datas:
 
-            if 'resourceMetrics' in data:
+    payload_types = set(SIGNAL_PAYLOAD_TYPES.values()) if signals is None else {SIGNAL_PAYLOAD_TYPES[signal] for signal in signals}
+    ranges = [[0, None]]
+    window = times = None
+    if index is None:
+        if day is not None or align_to_days:
+            window = DayWindow(day)
+        if time_window is not None:
+            times = TimeWindow(*time_window)
+    else:
+        start, end = index_window(index, align_to_days, day, time_window)
+        ranges = [[start, end]]
+        if signals is not None:
+            # only visit lines that carry one of the wanted signals
+            wanted = _merge_ranges(run for signal in signals for run in index['signals'][SIGNAL_PAYLOAD_TYPES[signal]])
+            ranges = [[max(s, start), e if end is None else min(e, end)] for s, e in wanted
+                      if e > start and (end is None or s < end)]
+
+    with open(file, 'rb') as f:
+        for line in read_ranges(f, ranges):
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            last_line = False
+            if window is not None or times is not None:
+                days, earliest = _line_summary(data)
+                accepted = True
+                if window is not None:
+                    accepted, last_line = window.accept(days)
+                if times is not None:
+                    in_window, ended = times.accept(earliest)
+                    if ended:
+                        break
+                    accepted = accepted and in_window
+                if not accepted:
+                    continue
+
+            if 'resourceMetrics' in data and 'resourceMetrics' in payload_types:
                 for metric in data['resourceMetrics']:
                     add_metric = True
                     for scope in metric['scopeMetrics']:
@@ -70,21 +405,28 @@ def parse(file, ts_offset=0, align_to_days=False):
                                 print(scope_metric)
                             for datapoint in scope_metric[metricType]['dataPoints']:
                                 if add_metric:
-                                    add_metric, first_ts, last_ts = conform_time(datapoint, 'startTimeUnixNano', first_ts, ts_offset, last_ts)
+                                    add_metric, first_ts, last_ts = conform_time(datapoint, 'startTimeUnixNano', first_ts, ts_offset, last_ts, speed)
                                 if add_metric:
-                                    add_metric, first_ts, last_ts = conform_time(datapoint, 'timeUnixNano', first_ts, ts_offset, last_ts)
+                                    add_metric, first_ts, last_ts = conform_time(datapoint, 'timeUnixNano', first_ts, ts_offset, last_ts, speed)
                     if add_metric:
                         out_data['resourceMetrics'].append(metric)
-            if 'resourceSpans' in data:
+            if 'resourceSpans' in data and 'resourceSpans' in payload_types:
                 
                 for span in data['resourceSpans']:
                     add_span = True
                     for scope in span['scopeSpans']:
+                        if day is not None:
+                            day_spans = [scope_span for scope_span in scope['spans'] if get_day_of_week(scope_span['attributes']) == day]
+                            if day_seen and len(day_spans) < len(scope['spans']):
+                                day_done = True
+                            day_seen = day_seen or len(day_spans) > 0
+                            scope['spans'] = day_spans
+                        id_remapper.remap_spans(scope['spans'])
                         for scope_span in scope['spans']:
                             
                             overwrite_datasource(scope_span['attributes'])
 
-                            if align_to_days:
+                            if align_to_days and day is None:
                                 dow = get_day_of_week(scope_span['attributes'])
                                 if first_ts is None and dow != 'M':
                                     #print("skip non-monday")
@@ -96,65 +438,204 @@ def parse(file, ts_offset=0, align_to_days=False):
                                     print("LOOPED!")
                                     return first_ts, last_ts, out_data
                             
-                            if scope_span['traceId'] not in uuids['traceId']:
-                                uuids['traceId'][scope_span['traceId']] = os.urandom(16).hex()#random.getrandbits(128)
-                                scope_span['traceId'] =  uuids['traceId'][scope_span['traceId']]
-                            else:
-                                scope_span['traceId'] = uuids['traceId'][scope_span['traceId']]
-                                
-                            if scope_span['spanId'] not in uuids['spanId']:
-                                uuids['spanId'][scope_span['spanId']] = os.urandom(8).hex()
-                                scope_span['spanId'] = uuids['spanId'][scope_span['spanId']]
-                            else:
-                                scope_span['spanId'] = uuids['spanId'][scope_span['spanId']]
-                                
-                            if scope_span['parentSpanId'] not in uuids['spanId']:
-                                uuids['spanId'][scope_span['parentSpanId']] = os.urandom(8).hex()
-                                scope_span['parentSpanId'] = uuids['spanId'][scope_span['parentSpanId']]
-                            else:
-                                scope_span['parentSpanId'] = uuids['spanId'][scope_span['parentSpanId']]
-
                             if add_span:
-                                add_span, first_ts, last_ts = conform_time(scope_span, 'startTimeUnixNano', first_ts, ts_offset, last_ts)
+                                add_span, first_ts, last_ts = conform_time(scope_span, 'startTimeUnixNano', first_ts, ts_offset, last_ts, speed)
                             if add_span:
-                                add_span, first_ts, last_ts = conform_time(scope_span, 'endTimeUnixNano', first_ts, ts_offset, last_ts)
+                                add_span, first_ts, last_ts = conform_time(scope_span, 'endTimeUnixNano', first_ts, ts_offset, last_ts, speed)
                             if 'events' in scope_span:
                                 for event in scope_span['events']:
                                     if add_span:
-                                        add_span, first_ts, last_ts = conform_time(event, 'timeUnixNano', first_ts, ts_offset, last_ts)
-                    if add_span:
+                                        add_span, first_ts, last_ts = conform_time(event, 'timeUnixNano', first_ts, ts_offset, last_ts, speed)
+                    if add_span and (day is None or any(scope['spans'] for scope in span['scopeSpans'])):
                         out_data['resourceSpans'].append(span)
-            if 'resourceLogs' in data:
+                if day_done:
+                    print(f"{day} is done")
+                    return first_ts, last_ts, out_data
+            if 'resourceLogs' in data and 'resourceLogs' in payload_types:
                 for log in data['resourceLogs']:
                     add_log = True
                     for scope_log in log['scopeLogs']:
+                        # same derivation as the spans, so log/trace correlation survives the replay
+                        id_remapper.remap_spans(scope_log['logRecords'])
                         for log_record in scope_log['logRecords']:
                             if add_log:
-                                add_log, first_ts, last_ts = conform_time(log_record, 'timeUnixNano', first_ts, ts_offset, last_ts)
+                                add_log, first_ts, last_ts = conform_time(log_record, 'timeUnixNano', first_ts, ts_offset, last_ts, speed)
                             if add_log:
-                                add_log, first_ts, last_ts = conform_time(log_record, 'observedTimeUnixNano', first_ts, ts_offset, last_ts)
+                                add_log, first_ts, last_ts = conform_time(log_record, 'observedTimeUnixNano', first_ts, ts_offset, last_ts, speed)
                     if add_log:
                         out_data['resourceLogs'].append(log)
+            if last_line:
+                break
         return first_ts, last_ts, out_data
 
 MAX_RECORDS_PER_UPLOAD = 100
 
-def upload(collector_url, signal, resources):
-    if signal == 'traces':
-        payload_type = 'resourceSpans'
-    elif signal == 'metrics':
-        payload_type = 'resourceMetrics'
-    elif signal == 'logs':
-        payload_type = 'resourceLogs'
+
+def upload(collector_url, signal, resources, verbose=True, stats=None):
+    payload_type = SIGNAL_PAYLOAD_TYPES[signal]
     for resource_spans_split in (resources[i:i + MAX_RECORDS_PER_UPLOAD] for i in range(0, len(resources), MAX_RECORDS_PER_UPLOAD)):
         payload = {payload_type:resource_spans_split}
         #print(payload)
         payload = gzip.compress(json.dumps(payload).encode('utf-8'))
         r = requests.post(f"{collector_url}/v1/{signal}", data=payload,
                         headers={'Content-Type':'application/json', 'Content-Encoding':'gzip'})
-        print(f"{signal}={r.json()}")
+        if stats is not None:
+            stats[f"{signal}_records"] += len(resource_spans_split)
+            stats['requests'] += 1
+            stats['bytes'] += len(payload)
+            stats['errors'] += 0 if r.ok else 1
+        if not r.ok:
+            print(f"{signal} upload failed: {r.status_code} {r.text}")
+        elif verbose:
+            print(f"{signal}={r.json()}")
+
+def resource_time(signal, resource):
+    """Latest (shifted) timestamp in a resource, i.e. when all of it has happened."""
+    latest = 0
+    if signal == 'traces':
+        for scope in resource['scopeSpans']:
+            for span in scope['spans']:
+                latest = max(latest, int(span.get('endTimeUnixNano', span.get('startTimeUnixNano', 0))))
+    elif signal == 'logs':
+        for scope_log in resource['scopeLogs']:
+            for log_record in scope_log['logRecords']:
+                latest = max(latest, int(log_record.get('timeUnixNano', log_record.get('observedTimeUnixNano', 0))))
+    elif signal == 'metrics':
+        for scope in resource['scopeMetrics']:
+            for scope_metric in scope['metrics']:
+                for metricType in ('sum', 'gauge', 'histogram'):
+                    for datapoint in scope_metric.get(metricType, {}).get('dataPoints', ()):
+                        latest = max(latest, int(datapoint.get('timeUnixNano', 0)))
+    return latest
+
+class ReplayScheduler:
+    """
+    Heap of parsed resources keyed by their shifted timestamp. run() emits
+    every resource once the wall clock reaches it, batching whatever came due
+    in the same tick per signal.
+
+    Deadlines are computed from a single monotonic anchor rather than by
+    accumulating sleeps, so the replay does not drift over hours of running.
+    Lag (how late a batch went out) is reported with the emit rate every
+    report_interval seconds.
+    """
 
-def load(file, collector_url, align_to_days):
+    def __init__(self, collector_url, *, tick=0.1, report_interval=10, stats=None):
+        self.collector_url = collector_url
+        self.stats = stats if stats is not None else Counter()
+        self.tick = tick
+        self.report_interval = report_interval
+        self._heap = []
+        self._seq = 0
+        self._horizon_ns = 0
+        self._anchor_wall_ns = time.time_ns()
+        self._anchor_mono_ns = time.monotonic_ns()
+        self._reset_report()
+
+    def _reset_report(self):
+        self._report_start = time.monotonic()
+        self._report_records = 0
+        self._report_batches = 0
+        self._report_lag_sum = 0.0
+        self._report_lag_max = 0.0
+
+    def now_ns(self):
+        return self._anchor_wall_ns + (time.monotonic_ns() - self._anchor_mono_ns)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def horizon_ns(self):
+        """Timestamp of the last resource currently scheduled."""
+        return self._horizon_ns
+
+    def schedule(self, signal, resources):
+        for resource in resources:
+            due_ns = resource_time(signal, resource)
+            self._seq += 1
+            heapq.heappush(self._heap, (due_ns, self._seq, signal, resource))
+            self._horizon_ns = max(self._horizon_ns, due_ns)
+
+    def _sleep_until(self, due_ns):
+        remaining = (due_ns - self.now_ns()) / 1e9
+        if remaining > 0:
+            time.sleep(min(remaining, self.tick))
+
+    def run_once(self):
+        """Waits for the next due resources and emits them; returns the number emitted."""
+        if not self._heap:
+            return 0
+        self._sleep_until(self._heap[0][0])
+        now_ns = self.now_ns()
+        batch = {}
+        lag_ns = 0
+        while self._heap and self._heap[0][0] <= now_ns:
+            due_ns, _, signal, resource = heapq.heappop(self._heap)
+            lag_ns = max(lag_ns, now_ns - due_ns)
+            batch.setdefault(signal, []).append(resource)
+        emitted = 0
+        for signal, resources in batch.items():
+            upload(self.collector_url, signal, resources, verbose=False, stats=self.stats)
+            emitted += len(resources)
+        if emitted:
+            lag = lag_ns / 1e9
+            self._report_records += emitted
+            self._report_batches += 1
+            self._report_lag_sum += lag
+            self._report_lag_max = max(self._report_lag_max, lag)
+        self.report()
+        return emitted
+
+    def report(self, force=False):
+        elapsed = time.monotonic() - self._report_start
+        if not force and elapsed < self.report_interval:
+            return
+        batches = max(self._report_batches, 1)
+        print(f"replay: {self._report_records / elapsed:.1f} records/s, "
+              f"lag avg={self._report_lag_sum / batches:.3f}s max={self._report_lag_max:.3f}s, "
+              f"queued={len(self._heap)}")
+        self._reset_report()
+
+REPLAY_LOOKAHEAD_S = 60
+
+def replay(file, collector_url, align_to_days, *, speed=1.0, duration=None, signals=tuple(SIGNAL_PAYLOAD_TYPES), day=None,
+           time_window=None):
+    """
+    Replays the recording as live traffic: timestamps are shifted to start now
+    (compressed by `speed`) and each resource is sent when its time arrives.
+    The recording is looped until `duration` seconds have passed (forever if None).
+    Returns the upload stats.
+    """
+    stats = Counter()
+    scheduler = ReplayScheduler(collector_url, stats=stats)
+    start_ns = scheduler.now_ns()
+    end_ns = start_ns + int(duration * 1e9) if duration is not None else None
+
+    index = load_index(file)
+    id_remapper = IdRemapper()
+    loop = 0
+    ts_offset_ns = start_ns
+    while end_ns is None or scheduler.now_ns() < end_ns:
+        # keep about one loop of the recording in memory: parse the next pass
+        # only once the scheduled one is close to running out
+        if len(scheduler) == 0 or scheduler.horizon_ns() - scheduler.now_ns() < REPLAY_LOOKAHEAD_S * 1e9:
+            print(f"> replay loop {loop} at {datetime.fromtimestamp(ts_offset_ns/1e9).strftime('%c')}")
+            id_remapper.set_loop(loop)
+            loop += 1
+            _, next_offset_ns, out_data = parse(file, ts_offset_ns, align_to_days, id_remapper, speed,
+                                             index=index, day=day, signals=signals, time_window=time_window)
+            stats['loops'] += 1
+            if next_offset_ns <= ts_offset_ns:
+                print("nothing to replay")
+                return stats
+            ts_offset_ns = next_offset_ns
+            for signal in signals:
+                scheduler.schedule(signal, out_data[SIGNAL_PAYLOAD_TYPES[signal]])
+        scheduler.run_once()
+    scheduler.report(force=True)
+    return stats
+
+def load(file, collector_url, align_to_days, signals=('traces',), day=None, time_window=None):
     
     # Get the current time
     now = datetime.now(tz=timezone.utc)
@@ -164,18 +645,98 @@ def load(file, collector_url, align_to_days):
     now_ns = int(now.timestamp() * 1e9)
     ts_offset_ns = int(ts_offset.timestamp() * 1e9)
     
+    stats = Counter()
+    index = load_index(file)
+    id_remapper = IdRemapper()
+    loop = 0
     while ts_offset_ns < now_ns:
         print(f"> loop {(now_ns - ts_offset_ns)/1e9}")
-        first_ts, ts_offset_ns, out_data = parse(file, ts_offset_ns, align_to_days)
+        id_remapper.set_loop(loop)
+        loop += 1
+        stats['loops'] += 1
+        first_ts, next_offset_ns, out_data = parse(file, ts_offset_ns, align_to_days, id_remapper,
+                                                 index=index, day=day, signals=signals, time_window=time_window)
+        if next_offset_ns <= ts_offset_ns:
+            print("nothing to load")
+            break
+        ts_offset_ns = next_offset_ns
         print(datetime.fromtimestamp(ts_offset_ns/1e9).strftime('%c'))
 
-        if len(out_data['resourceSpans']) > 0:
-            upload(collector_url, 'traces', out_data['resourceSpans'])
-        # if len(out_data['resourceMetrics']) > 0:
-        #     upload(collector_url, 'metrics', out_data['resourceMetrics'])
-        # if len(out_data['resourceLogs']) > 0:
-        #     upload(collector_url, 'logs', out_data['resourceLogs'])
+        for signal in signals:
+            resources = out_data[SIGNAL_PAYLOAD_TYPES[signal]]
+            if len(resources) > 0:
+                upload(collector_url, signal, resources, stats=stats)
+    return stats
+
+def recorded_time_ns(value):
+    """An ISO 8601 time as ns since the epoch, UTC unless it says otherwise."""
+    ts = datetime.fromisoformat(value)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(ts.timestamp()) * 10**9 + ts.microsecond * 1000
+
+def _play(job):
+    # process pool entry point; one recording per worker
+    file, collector_url, args = job
+    print(f"playing {file} -> {collector_url}")
+    start = time.monotonic()
+    if args.index:
+        build_index(file)
+    time_window = None if args.since is None and args.until is None else (args.since, args.until)
+    if args.realtime:
+        stats = replay(file, collector_url, args.align_to_days, speed=args.speed,
+                       duration=args.duration, signals=args.signals, day=args.day, time_window=time_window)
+    else:
+        stats = load(file, collector_url, args.align_to_days, signals=args.signals, day=args.day,
+                     time_window=time_window)
+    stats['seconds'] = time.monotonic() - start
+    return file, stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded OTLP NDJSON files into one or more collectors.")
+    parser.add_argument('recordings', nargs='*', default=['../recorded/apm.json'],
+                        help="recorded NDJSON files (default: ../recorded/apm.json)")
+    parser.add_argument('--collector', action='append', dest='collectors',
+                        help="collector OTLP/HTTP endpoint; repeat to spread recordings round-robin (default: http://127.0.0.1:4318)")
+    parser.add_argument('--signals', default='traces',
+                        type=lambda value: tuple(signal.strip() for signal in value.split(',') if signal.strip()),
+                        help="comma separated signals to upload: traces,metrics,logs (default: traces)")
+    parser.add_argument('--align-to-days', action=argparse.BooleanOptionalAction, default=True,
+                        help="start at the first Monday and loop back on the next one")
+    parser.add_argument('--day', choices=['M', 'Tu', 'W', 'Th', 'F'], default=None,
+                        help="replay only the spans recorded on this day of the week")
+    parser.add_argument('--since', type=recorded_time_ns, default=None,
+                        help="replay only from the hour holding this recorded time (ISO 8601, UTC if no offset)")
+    parser.add_argument('--until', type=recorded_time_ns, default=None,
+                        help="replay only up to the end of the hour holding this recorded time")
+    parser.add_argument('--index', action='store_true',
+                        help=f"(re)build the {INDEX_SUFFIX} sidecar index of each recording before playing it")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="size of the process pool (default: number of cores)")
+    parser.add_argument('--realtime', action='store_true', help="replay paced to the shifted timestamps")
+    parser.add_argument('--speed', type=float, default=1.0, help="replay speed multiplier for --realtime")
+    parser.add_argument('--duration', type=float, default=None, help="seconds to replay for with --realtime")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.signals) - set(SIGNAL_PAYLOAD_TYPES)
+    if unknown:
+        parser.error(f"unknown signals: {', '.join(sorted(unknown))}")
+    collectors = args.collectors or ['http://127.0.0.1:4318']
+    jobs = [(file, collectors[i % len(collectors)], args) for i, file in enumerate(args.recordings)]
 
+    start = time.monotonic()
+    totals = Counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(jobs)))) as pool:
+        futures = [pool.submit(_play, job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), start=1):
+            file, stats = future.result()
+            totals.update(stats)
+            print(f"[{done}/{len(jobs)}] {file}: {dict(stats)}")
+    elapsed = time.monotonic() - start
+    records = sum(totals[f"{signal}_records"] for signal in SIGNAL_PAYLOAD_TYPES)
+    print(f"played {len(jobs)} recordings in {elapsed:.1f}s: {records} records "
+          f"({records / elapsed:.1f}/s), {totals['requests']} requests, "
+          f"{totals['bytes']} bytes, {totals['errors']} errors")
 
-load('../recorded/apm.json', 'http://127.0.0.1:4318', True)
-#load('../recorded/elasticsearch.json', 'http://127.0.0.1:4319', False)
+if __name__ == '__main__':
+    main()
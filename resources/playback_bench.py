@@ -0,0 +1,268 @@
+"""
+Throughput benchmark for playback.py.
+
+Generates a synthetic OTLP NDJSON recording, then parses, transforms and
+uploads it to a local stand-in OTLP/HTTP sink, reporting records/sec, peak
+RSS and the time spent per stage (decode, conform_time, ID remap, encode,
+gzip, POST).
+
+    python playback_bench.py --lines 2000 --spans 20 --logs 5 --metrics 5
+    python playback_bench.py --recording ../recorded/apm.json --profile playback.prof
+"""
+import argparse
+import cProfile
+import gzip
+import json
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import playback
+
+DAYS_OF_WEEK = ['M', 'Tu', 'W', 'Th', 'F']
+
+def generate(path, *, lines, spans, logs, metrics, attributes, step_ms=100, seed=0):
+    """Writes a recording shaped like the collector's file exporter output; returns the record count."""
+    rng = random.Random(seed)
+    start_ns = 1_700_000_000_000_000_000
+    records = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(lines):
+            ts = start_ns + i * step_ms * 1_000_000
+            dow = DAYS_OF_WEEK[i * len(DAYS_OF_WEEK) // lines]
+            trace_id = rng.randbytes(16).hex()
+            parent_id = ''
+            span_list = []
+            for s in range(spans):
+                span_id = rng.randbytes(8).hex()
+                span_attributes = [{'key': f"com.example.attr_{a}", 'value': {'stringValue': f"value-{rng.randint(0, 99)}"}} for a in range(attributes)]
+                span_attributes.append({'key': 'com.example.day_of_week', 'value': {'stringValue': dow}})
+                span_attributes.append({'key': 'com.example.data_source', 'value': {'stringValue': 'monkey'}})
+                span_list.append({
+                    'traceId': trace_id, 'spanId': span_id, 'parentSpanId': parent_id,
+                    'name': f"span-{s}", 'kind': 2,
+                    'startTimeUnixNano': str(ts + s * 1000), 'endTimeUnixNano': str(ts + s * 1000 + 500_000),
+                    'attributes': span_attributes,
+                    'events': [{'timeUnixNano': str(ts + s * 1000 + 10), 'name': 'event'}],
+                    'status': {}
+                })
+                parent_id = span_id
+            log_list = [{
+                'timeUnixNano': str(ts + l), 'observedTimeUnixNano': str(ts + l),
+                'severityText': 'INFO', 'body': {'stringValue': f"log line {l}"},
+                'traceId': trace_id, 'spanId': span_list[0]['spanId'] if span_list else ''
+            } for l in range(logs)]
+            metric_list = [{
+                'name': f"metric_{m}",
+                'sum': {'dataPoints': [{'startTimeUnixNano': str(start_ns), 'timeUnixNano': str(ts), 'asInt': str(i)}],
+                        'aggregationTemporality': 2, 'isMonotonic': True}
+            } for m in range(metrics)]
+            line = {}
+            if span_list:
+                line['resourceSpans'] = [{'resource': {'attributes': []}, 'scopeSpans': [{'scope': {'name': 'bench'}, 'spans': span_list}]}]
+            if log_list:
+                line['resourceLogs'] = [{'resource': {'attributes': []}, 'scopeLogs': [{'scope': {'name': 'bench'}, 'logRecords': log_list}]}]
+            if metric_list:
+                line['resourceMetrics'] = [{'resource': {'attributes': []}, 'scopeMetrics': [{'scope': {'name': 'bench'}, 'metrics': metric_list}]}]
+            f.write(json.dumps(line) + '\n')
+            records += len(span_list) + len(log_list) + len(metric_list)
+    return records
+
+def count_records(path):
+    records = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            for span in data.get('resourceSpans', ()):
+                records += sum(len(scope['spans']) for scope in span['scopeSpans'])
+            for log in data.get('resourceLogs', ()):
+                records += sum(len(scope_log['logRecords']) for scope_log in log['scopeLogs'])
+            for metric in data.get('resourceMetrics', ()):
+                records += sum(len(scope['metrics']) for scope in metric['scopeMetrics'])
+    return records
+
+class SinkHandler(BaseHTTPRequestHandler):
+    """Stand-in for the collector's OTLP/HTTP receiver: reads and acknowledges every export."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.received_bytes += len(body)
+        self.server.received_requests += 1
+        response = b'{"partialSuccess":{}}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_sink():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SinkHandler)
+    server.received_bytes = 0
+    server.received_requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class StageTimer:
+    """Accumulates wall time per stage by wrapping the functions playback.py calls."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def wrap(self, stage, fn):
+        seconds = self.seconds
+        calls = self.calls
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                seconds[stage] += perf_counter() - start
+                calls[stage] += 1
+        return timed
+
+class _Proxy:
+    """Module stand-in that overrides some attributes and forwards the rest."""
+
+    def __init__(self, module, **overrides):
+        self._module = module
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+def instrument(timer):
+    """Patches playback's stage functions with timed wrappers; returns an undo callable."""
+    saved = {
+        'json': playback.json,
+        'gzip': playback.gzip,
+        'requests': playback.requests,
+        'conform_time': playback.conform_time,
+        'remap_spans': playback.IdRemapper.remap_spans,
+    }
+    playback.json = _Proxy(json, loads=timer.wrap('decode', json.loads), dumps=timer.wrap('encode', json.dumps))
+    playback.gzip = _Proxy(gzip, compress=timer.wrap('gzip', gzip.compress))
+    playback.requests = _Proxy(saved['requests'], post=timer.wrap('post', saved['requests'].post))
+    playback.conform_time = timer.wrap('conform_time', saved['conform_time'])
+    playback.IdRemapper.remap_spans = timer.wrap('id_remap', saved['remap_spans'])
+
+    def undo():
+        playback.json = saved['json']
+        playback.gzip = saved['gzip']
+        playback.requests = saved['requests']
+        playback.conform_time = saved['conform_time']
+        playback.IdRemapper.remap_spans = saved['remap_spans']
+    return undo
+
+def run_once(path, collector_url, signals):
+    """One parse + upload pass; returns (parse seconds, upload seconds, upload stats)."""
+    stats = playback.Counter()
+    start = time.perf_counter()
+    _, _, out_data = playback.parse(path, time.time_ns(), False, playback.IdRemapper(key=b'bench'))
+    parsed = time.perf_counter()
+    for signal in signals:
+        resources = out_data[playback.SIGNAL_PAYLOAD_TYPES[signal]]
+        if resources:
+            playback.upload(collector_url, signal, resources, verbose=False, stats=stats)
+    return parsed - start, time.perf_counter() - parsed, stats
+
+def peak_rss_mb():
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark playback parse, transform and upload throughput.")
+    parser.add_argument('--recording', help="existing NDJSON recording to use instead of a synthetic one")
+    parser.add_argument('--lines', type=int, default=1000, help="synthetic recording: number of NDJSON lines")
+    parser.add_argument('--spans', type=int, default=20, help="synthetic recording: spans per line")
+    parser.add_argument('--logs', type=int, default=5, help="synthetic recording: log records per line")
+    parser.add_argument('--metrics', type=int, default=5, help="synthetic recording: metrics per line")
+    parser.add_argument('--attributes', type=int, default=8, help="synthetic recording: extra attributes per span")
+    parser.add_argument('--signals', default='traces,metrics,logs', help="signals to upload")
+    parser.add_argument('--repeat', type=int, default=3, help="timed passes; the best one is reported")
+    parser.add_argument('--profile', metavar='PATH', help="dump a cProfile of one pass to PATH")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON to PATH")
+    args = parser.parse_args(argv)
+    signals = tuple(signal.strip() for signal in args.signals.split(',') if signal.strip())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.recording:
+            path = args.recording
+            records = count_records(path)
+        else:
+            path = os.path.join(tmp, 'bench.json')
+            start = time.perf_counter()
+            records = generate(path, lines=args.lines, spans=args.spans, logs=args.logs,
+                               metrics=args.metrics, attributes=args.attributes)
+            print(f"generated {records} records ({os.path.getsize(path) / 2**20:.1f} MiB) in {time.perf_counter() - start:.1f}s")
+
+        sink = start_sink()
+        collector_url = f"http://127.0.0.1:{sink.server_address[1]}"
+
+        # clean passes (no wrappers) for the headline numbers
+        best = None
+        for _ in range(args.repeat):
+            parse_s, upload_s, stats = run_once(path, collector_url, signals)
+            if best is None or parse_s + upload_s < best[0] + best[1]:
+                best = (parse_s, upload_s, stats)
+        parse_s, upload_s, stats = best
+
+        # one instrumented pass for the per-stage breakdown
+        timer = StageTimer()
+        undo = instrument(timer)
+        try:
+            run_once(path, collector_url, signals)
+        finally:
+            undo()
+
+        if args.profile:
+            profiler = cProfile.Profile()
+            profiler.runcall(run_once, path, collector_url, signals)
+            profiler.dump_stats(args.profile)
+            print(f"profile written to {args.profile}")
+
+        sink.shutdown()
+
+    total_s = parse_s + upload_s
+    results = {
+        'records': records,
+        'records_per_sec': records / total_s if total_s else 0,
+        'parse_records_per_sec': records / parse_s if parse_s else 0,
+        'parse_seconds': parse_s,
+        'upload_seconds': upload_s,
+        'requests': stats['requests'],
+        'upload_bytes': stats['bytes'],
+        'upload_errors': stats['errors'],
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': {stage: {'seconds': timer.seconds[stage], 'calls': timer.calls[stage]}
+                   for stage in ('decode', 'conform_time', 'id_remap', 'encode', 'gzip', 'post')}
+    }
+
+    print(f"records:        {records}")
+    print(f"throughput:     {results['records_per_sec']:.0f} records/s "
+          f"(parse {results['parse_records_per_sec']:.0f} records/s)")
+    print(f"parse/upload:   {parse_s:.3f}s / {upload_s:.3f}s, {stats['requests']} requests, "
+          f"{stats['bytes'] / 2**20:.1f} MiB gzipped, {stats['errors']} errors")
+    print(f"peak RSS:       {results['peak_rss_mb']:.1f} MiB")
+    print("stages (instrumented pass, includes timer overhead):")
+    for stage, stage_stats in results['stages'].items():
+        print(f"  {stage:<13} {stage_stats['seconds']:8.3f}s  {stage_stats['calls']:>9} calls")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+
+RECONCILE_STATE_PATH = os.environ.get('RECONCILE_STATE_PATH', '.reconcile_state.json')
+
+# bootstrap runs loaders concurrently and they share the state file
+_state_lock = threading.Lock()
+
+def content_hash(desired):
+    if isinstance(desired, (bytes, str)):
+        raw = desired.encode('utf8') if isinstance(desired, str) else desired
+    else:
+        raw = json.dumps(desired, sort_keys=True, separators=(',', ':')).encode('utf8')
+    return hashlib.sha256(raw).hexdigest()
+
+def load_state(path=RECONCILE_STATE_PATH):
+    try:
+        with open(path, 'r', encoding='utf8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _save_entries(resource_type, entries, path):
+    with _state_lock:
+        state = load_state(path)
+        state[resource_type] = entries
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, path)
+
+class Reconciler:
+    """
+    Brings one type of Elastic/Kibana object in line with the desired JSON
+    while making as few API calls as possible.
+
+    `fetch(desired)` is called once and returns {name: remote id} for the
+    objects that currently exist. A desired object is left alone when it
+    exists and its content hash matches what this reconciler last applied
+    (kept in the local state file). Otherwise it is created with
+    `create(name, desired)` or changed with `update(name, remote_id, desired)`,
+    both returning the remote id. Without an `update`, existing objects are
+    adopted as they are.
+    """
+
+    def __init__(self, resource_type, *, fetch, create, update=None, state_path=RECONCILE_STATE_PATH):
+        self.resource_type = resource_type
+        self.fetch = fetch
+        self.create = create
+        self.update = update
+        self.state_path = state_path
+
+    def apply(self, desired, *, force=False):
+        """
+        Reconciles {name: desired object}; returns {name: remote id} for the
+        objects that exist afterwards. Raises once the rest are recorded if
+        any object failed, so the bring-up step is not marked done.
+        """
+        cached = load_state(self.state_path).get(self.resource_type, {})
+        remote = self.fetch(desired)
+        entries = {}
+        ids = {}
+        summary = {'created': 0, 'updated': 0, 'unchanged': 0, 'adopted': 0, 'failed': 0}
+
+        for name, desired_object in desired.items():
+            digest = content_hash(desired_object)
+            remote_id = remote.get(name)
+            cached_entry = cached.get(name, {})
+            try:
+                if remote_id is None:
+                    remote_id = self.create(name, desired_object)
+                    outcome = 'created'
+                elif not force and cached_entry.get('hash') == digest and cached_entry.get('id') == remote_id:
+                    outcome = 'unchanged'
+                elif self.update is None:
+                    outcome = 'adopted'
+                else:
+                    remote_id = self.update(name, remote_id, desired_object)
+                    outcome = 'updated'
+            except Exception as inst:
+                print(f"{self.resource_type} {name}: {inst}")
+                summary['failed'] += 1
+                continue
+            if remote_id is None:
+                summary['failed'] += 1
+                continue
+
+            if outcome != 'unchanged':
+                print(f"{self.resource_type} {name}: {outcome}")
+            summary[outcome] += 1
+            entries[name] = {'hash': digest, 'id': remote_id}
+            ids[name] = remote_id
+
+        _save_entries(self.resource_type, entries, self.state_path)
+        print(f"{self.resource_type}: " + ", ".join(f"{count} {outcome}" for outcome, count in summary.items() if count))
+        if summary['failed']:
+            # the applied objects are recorded above, so a re-run only retries the failed ones
+            raise RuntimeError(f"{self.resource_type}: {summary['failed']} of {len(desired)} failed")
+        return ids
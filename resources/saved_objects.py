@@ -0,0 +1,58 @@
+import json
+import os
+import shutil
+import tempfile
+
+def rewrite(path, transform, *, marker=None):
+    """
+    Streams a saved objects .ndjson export through transform(saved_object),
+    which edits the object in place and returns True if it changed anything.
+    Lines not containing `marker` are copied as they are without being parsed,
+    as are objects the transform leaves alone. The result replaces `path`
+    atomically. Returns the number of objects changed.
+    """
+    changed = 0
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with open(path, 'r', encoding='utf8') as src, os.fdopen(fd, 'w', encoding='utf8') as dst:
+            for line in src:
+                if (marker is None or marker in line) and line.strip():
+                    saved_object = json.loads(line)
+                    if transform(saved_object):
+                        changed += 1
+                        line = json.dumps(saved_object) + '\n'
+                dst.write(line)
+        if changed:
+            shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return changed
+
+def panel_config_rewriter(key, mapping):
+    """Transform for rewrite() mapping the embeddableConfig[key] of dashboard panels through `mapping`."""
+    def transform(saved_object):
+        panels_json = saved_object.get('attributes', {}).get('panelsJSON')
+        if not panels_json:
+            return False
+        panels = json.loads(panels_json)
+        changed = False
+        for panel in panels:
+            embeddable_config = panel.get('embeddableConfig', {})
+            old_id = embeddable_config.get(key)
+            if old_id in mapping:
+                embeddable_config[key] = mapping[old_id]
+                print(f"Replaced {key} {old_id} with {mapping[old_id]}")
+                changed = True
+        if changed:
+            saved_object['attributes']['panelsJSON'] = json.dumps(panels)
+        return changed
+    return transform
+
+def rewrite_panel_ids(path, key, mapping):
+    """Replaces old ids with new ones in the `key` of every dashboard panel in the export at `path`."""
+    if not mapping:
+        return 0
+    return rewrite(path, panel_config_rewriter(key, mapping), marker=key)
@@ -1,59 +1,60 @@
-import requests
 import os
 import json
 
+import client
+import saved_objects
+from reconcile import Reconciler
+
 TIMEOUT = 10
 
 SLO_RESOURCES_PATH = 'slo'
+DASHBOARD_PATH = 'kibana/dashboards.ndjson'
+# SLO ID currently referenced by the dashboards, by SLO name
+DASHBOARD_SLO_IDS_PATH = 'kibana/slo_ids.json'
+
+def get_slos(desired):
+    """Ids of the SLOs that currently exist, by name."""
+    resp = client.kibana.get("/api/observability/slos", params={'perPage': 1000}, timeout=TIMEOUT)
+    resp.raise_for_status()
+    return {slo['name']: slo['id'] for slo in resp.json()['results']}
+
+def create_slo(name, body):
+    resp = client.kibana.post("/api/observability/slos", json=body, timeout=TIMEOUT)
+    resp_json = resp.json()
+    print(resp_json)
+    return resp_json['id']
+
+def update_slo(name, slo_id, body):
+    resp = client.kibana.put(f"/api/observability/slos/{slo_id}", json=body, timeout=TIMEOUT)
+    resp.raise_for_status()
+    return slo_id
 
 def load():
-    new_slo_ids = []
     slo_files = [file for file in os.listdir(SLO_RESOURCES_PATH) if file.endswith(".json")]
 
+    desired = {}
     for file in slo_files:
         with open(os.path.join(SLO_RESOURCES_PATH, file), "r", encoding='utf8') as f:
-            body = f.read()
-            resp = requests.post(
-                f"{os.environ['KIBANA_URL']}/api/observability/slos",
-                data=body,
-                timeout=TIMEOUT,
-                auth=(os.environ['ELASTICSEARCH_USER'], os.environ['ELASTICSEARCH_PASSWORD']),
-                headers={"kbn-xsrf": "reporting", "Content-Type": "application/json"}
-            )
-            resp_json = resp.json()
-            print(resp_json)
-            new_slo_id = resp_json['id']
-            new_slo_ids.append(new_slo_id)
-
-    # Now update the dashboard file with new SLO IDs
-    dashboard_path = 'kibana/dashboards.ndjson'
-    with open(dashboard_path, 'r', encoding='utf8') as f:
-        dashboard_lines = f.readlines()
-
-    updated_lines = []
-    slo_id_index = 0
-
-    for line in dashboard_lines:
-        data = json.loads(line)
-        if data.get('attributes') and data['attributes'].get('panelsJSON'):
-            panels = json.loads(data['attributes']['panelsJSON'])
-            for panel in panels:
-                embeddableConfig = panel.get('embeddableConfig', {})
-                if 'sloId' in embeddableConfig:
-                    if slo_id_index < len(new_slo_ids):
-                        old_slo_id = embeddableConfig['sloId']
-                        new_slo_id = new_slo_ids[slo_id_index]
-                        embeddableConfig['sloId'] = new_slo_id
-                        slo_id_index += 1
-                        print(f"Replaced SLO ID {old_slo_id} with {new_slo_id}")
-                    else:
-                        print("Warning: Not enough new SLO IDs to replace all existing ones")
-            # Update the panelsJSON with the modified panels
-            data['attributes']['panelsJSON'] = json.dumps(panels)
-
-        updated_line = json.dumps(data)
-        updated_lines.append(updated_line)
-
-    # Write back the updated dashboard
-    with open(dashboard_path, 'w', encoding='utf8') as f:
-        f.writelines(line + '\n' for line in updated_lines)
+            body = json.load(f)
+            desired[body['name']] = body
+
+    # existing SLOs are matched by name and reused rather than created again
+    slo_ids = Reconciler('slos', fetch=get_slos, create=create_slo, update=update_slo).apply(desired)
+
+    # Now point the dashboard panels at the SLO IDs, matched by SLO name
+    with open(DASHBOARD_SLO_IDS_PATH, 'r', encoding='utf8') as f:
+        dashboard_slo_ids = json.load(f)
+
+    mapping = {}
+    for name, slo_id in slo_ids.items():
+        if name not in dashboard_slo_ids:
+            print(f"Warning: SLO {name} is not referenced by the dashboards")
+        elif dashboard_slo_ids[name] != slo_id:
+            mapping[dashboard_slo_ids[name]] = slo_id
+    saved_objects.rewrite_panel_ids(DASHBOARD_PATH, 'sloId', mapping)
+
+    dashboard_slo_ids.update(slo_ids)
+    tmp_path = f"{DASHBOARD_SLO_IDS_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        json.dump(dashboard_slo_ids, f, indent=4)
+    os.replace(tmp_path, DASHBOARD_SLO_IDS_PATH)
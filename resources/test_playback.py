@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+import playback
+
+DAYS = ['M', 'Tu', 'W', 'Th', 'F']
+START_NS = 1_700_000_000_000_000_000
+STEP_NS = 60 * 10**9
+# small enough for the recording to span several buckets
+BUCKET_NS = 5 * STEP_NS
+
+def span_line(i, days):
+    spans = [{'traceId': f"{i:032x}", 'spanId': f"{i * 8 + s + 1:016x}", 'parentSpanId': '', 'name': f"span-{s}",
+              'startTimeUnixNano': str(START_NS + i * STEP_NS + s), 'endTimeUnixNano': str(START_NS + i * STEP_NS + s + 500),
+              'attributes': [{'key': 'com.example.day_of_week', 'value': {'stringValue': day}},
+                             {'key': 'com.example.data_source', 'value': {'stringValue': 'monkey'}}]}
+             for s, day in enumerate(days)]
+    return {'resourceSpans': [{'resource': {'attributes': []}, 'scopeSpans': [{'scope': {'name': 'test'}, 'spans': spans}]}]}
+
+def log_line(i):
+    ts = str(START_NS + i * STEP_NS)
+    return {'resourceLogs': [{'resource': {'attributes': []}, 'scopeLogs': [{'scope': {'name': 'test'}, 'logRecords': [
+        {'timeUnixNano': ts, 'observedTimeUnixNano': ts, 'body': {'stringValue': f"line {i}"},
+         'traceId': f"{i:032x}", 'spanId': f"{i * 8 + 1:016x}"}]}]}]}
+
+def metric_line(i):
+    return {'resourceMetrics': [{'resource': {'attributes': []}, 'scopeMetrics': [{'scope': {'name': 'test'}, 'metrics': [
+        {'name': 'trades', 'sum': {'dataPoints': [{'startTimeUnixNano': str(START_NS),
+                                                   'timeUnixNano': str(START_NS + i * STEP_NS), 'asInt': str(i)}]}}]}]}]}
+
+@pytest.fixture
+def recording(tmp_path):
+    """Wednesday to the Tuesday two weeks on, with spans, logs and metrics on separate lines and day changes mid-line."""
+    lines = []
+    i = 0
+    for days in (DAYS[2:], DAYS, DAYS[:2]):
+        for day in days:
+            for n in range(4):
+                i += 1
+                # the last span line of a day already holds the next day's first span
+                following = DAYS[(DAYS.index(day) + 1) % len(DAYS)]
+                lines.append(span_line(i, [day, day, following] if n == 3 else [day, day]))
+                lines.append(log_line(i) if n % 2 else metric_line(i))
+    path = tmp_path / 'recording.json'
+    path.write_text(''.join(json.dumps(line) + '\n' for line in lines) + '\n')
+    return str(path)
+
+def parse(file, index, **kwargs):
+    return playback.parse(file, 10**18, id_remapper=playback.IdRemapper(key=b'k' * 16), index=index, **kwargs)
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'align_to_days': True},
+    {'align_to_days': True, 'signals': ['traces']},
+    {'signals': ['logs']},
+    {'signals': ['metrics', 'logs']},
+] + [{'day': day} for day in DAYS] + [{'day': 'W', 'signals': ['traces']}] + [
+    {'time_window': (START_NS + 12 * STEP_NS, START_NS + 25 * STEP_NS)},
+    {'time_window': (START_NS + 12 * STEP_NS, None), 'signals': ['logs']},
+    {'time_window': (None, START_NS + 20 * STEP_NS), 'align_to_days': True},
+    {'time_window': (START_NS + 8 * STEP_NS, START_NS + 30 * STEP_NS), 'day': 'F'},
+])
+def test_indexed_parse_matches_linear(recording, options, monkeypatch):
+    monkeypatch.setattr(playback, 'INDEX_BUCKET_NS', BUCKET_NS)
+    index = playback.build_index(recording, bucket_ns=BUCKET_NS)
+    signals = options.get('signals')
+    linear = parse(recording, None, **options)
+    indexed = parse(recording, index, **options)
+    assert indexed[:2] == linear[:2]
+    for signal in signals or playback.SIGNAL_PAYLOAD_TYPES:
+        payload_type = playback.SIGNAL_PAYLOAD_TYPES[signal]
+        assert indexed[2][payload_type] == linear[2][payload_type]
+    assert any(linear[2][playback.SIGNAL_PAYLOAD_TYPES[signal]] for signal in signals or ['traces'])
+
+def test_stale_index_is_ignored(recording):
+    playback.build_index(recording)
+    assert playback.load_index(recording) is not None
+    with open(recording, 'a') as f:
+        f.write(json.dumps(log_line(999)) + '\n')
+    assert playback.load_index(recording) is None
+
+def test_time_window_seeks_to_its_first_bucket(recording):
+    index = playback.build_index(recording, bucket_ns=BUCKET_NS)
+    since = START_NS + 12 * STEP_NS
+    bucket = since // BUCKET_NS * BUCKET_NS
+    start, end = playback.index_window(index, time_window=(since, None))
+    assert start > 0 and end is None
+    with open(recording, 'rb') as f:
+        skipped = f.read(start).splitlines()
+        first = f.readline()
+    assert all(playback._line_summary(json.loads(line))[1] < bucket for line in skipped)
+    assert playback._line_summary(json.loads(first))[1] // BUCKET_NS * BUCKET_NS == bucket
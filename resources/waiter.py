@@ -0,0 +1,96 @@
+import heapq
+import time
+
+INITIAL_DELAY = 1
+MAX_DELAY = 30
+BACKOFF_FACTOR = 2
+TIMEOUT = 600
+
+class WaitFailed(Exception):
+    """Raised by a probe to stop waiting because the awaited thing can no longer happen."""
+
+def _probe(name, probe):
+    """Runs a probe; errors other than WaitFailed count as 'not ready yet'."""
+    try:
+        return probe()
+    except WaitFailed:
+        raise
+    except Exception as inst:
+        print(f"waiting for {name}: {inst}")
+        return None
+
+def wait_for(probe, *, name='condition', timeout=TIMEOUT, initial_delay=INITIAL_DELAY,
+             max_delay=MAX_DELAY, factor=BACKOFF_FACTOR):
+    """
+    Polls probe with exponential backoff until it returns something truthy,
+    which is returned. Raises TimeoutError once `timeout` seconds have passed.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        value = _probe(name, probe)
+        if value:
+            return value
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"{name} not ready after {timeout}s")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * factor, max_delay)
+
+class Waiter:
+    """
+    Waits on many probes at once from a single thread. Each probe gets its own
+    backoff schedule and deadline, and its on_ready callback runs as soon as
+    it succeeds, so early finishers are handled without waiting for the rest.
+    """
+
+    def __init__(self, *, timeout=TIMEOUT, initial_delay=INITIAL_DELAY, max_delay=MAX_DELAY, factor=BACKOFF_FACTOR):
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self._queue = []
+        self._seq = 0
+
+    def add(self, name, probe, on_ready=None):
+        now = time.monotonic()
+        self._seq += 1
+        heapq.heappush(self._queue, (now, self._seq, name, probe, on_ready, self.initial_delay, now + self.timeout, now))
+
+    def run(self):
+        """
+        Runs until every probe succeeded, failed or timed out. Returns
+        {name: (outcome, value, seconds)} with outcome 'ready', 'failed' or 'timeout'.
+        """
+        results = {}
+        while self._queue:
+            due, seq, name, probe, on_ready, delay, deadline, added = heapq.heappop(self._queue)
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                value = _probe(name, probe)
+            except WaitFailed as inst:
+                print(f"{name} failed: {inst}")
+                results[name] = ('failed', inst, time.monotonic() - added)
+                continue
+
+            if value:
+                results[name] = ('ready', value, time.monotonic() - added)
+                if on_ready is not None:
+                    try:
+                        on_ready(name, value)
+                    except Exception as inst:
+                        print(f"{name} ready, but handling it failed: {inst}")
+                        results[name] = ('failed', inst, time.monotonic() - added)
+                continue
+
+            now = time.monotonic()
+            if now >= deadline:
+                print(f"{name} not ready after {self.timeout}s")
+                results[name] = ('timeout', None, now - added)
+                continue
+            heapq.heappush(self._queue, (min(now + delay, deadline), seq, name, probe, on_ready,
+                                         min(delay * self.factor, self.max_delay), deadline, added))
+        return results
@@ -4,6 +4,7 @@ import requests
 import random
 import time
 import os
+import sys
 from threading import Thread
 
 from opentelemetry import trace, baggage, context
@@ -13,9 +14,22 @@ from opentelemetry.processor.baggage import BaggageSpanProcessor, ALLOW_ALL_BAGG
 from opentelemetry import _logs as logs
 from opentelemetry.processor.logrecord.baggage import BaggageLogRecordProcessor
 
+import queuelog
+
 app = Flask(__name__)
 app.logger.setLevel(logging.INFO)
 
+# one line per generated trade, on stdout only (not exported as OTel logs)
+trade_log = logging.getLogger('monkey.trades')
+trade_log.setLevel(os.environ.get('MONKEY_TRADE_LOG_LEVEL', 'INFO').upper())
+trade_log.propagate = False
+trade_log_handler = logging.StreamHandler(sys.stdout)
+trade_log_handler.setFormatter(logging.Formatter('%(message)s'))
+trade_log.addHandler(trade_log_handler)
+
+# formatting and handler I/O happen on the log queue's thread, not the trade generators'
+queuelog.install(logging.getLogger(), app.logger, trade_log)
+
 tracer_provider = trace.get_tracer_provider()
 tracer_provider.add_span_processor(BaggageSpanProcessor(ALLOW_ALL_BAGGAGE_KEYS))
 
@@ -60,7 +74,7 @@ def generate_trade_request(*, customer_id, symbol, day_of_week, region, latency,
                                        timeout=TRADE_TIMEOUT)
         trade_response.raise_for_status()
     except Exception as inst:
-        print(inst)
+        trade_log.warning("%s", inst)
 
 def generate_trade_requests():
     idx_of_week = 0
@@ -73,7 +87,7 @@ def generate_trade_requests():
         now = time.time()
         if now - day_start >= S_PER_DAY:
             idx_of_week = (idx_of_week + 1) % len(DAYS_OF_WEEK)
-            print(f"advance to {DAYS_OF_WEEK[idx_of_week]}")
+            trade_log.info("advance to %s", DAYS_OF_WEEK[idx_of_week])
             day_start = now
 
         sleep = float(random.randint(1, 1000) / 1000)
@@ -107,7 +121,8 @@ def generate_trade_requests():
         else:
             canary = "false"
 
-        print(f"trading {symbol} for {customer_id} on {DAYS_OF_WEEK[idx_of_week]} from {region} with latency {latency}, error_model={error_model}, error_db={error_db}, skew_market_factor={skew_market_factor}, canary={canary}")
+        trade_log.info("trading %s for %s on %s from %s with latency %s, error_model=%s, error_db=%s, skew_market_factor=%s, canary=%s",
+                       symbol, customer_id, DAYS_OF_WEEK[idx_of_week], region, latency, error_model, error_db, skew_market_factor, canary)
 
         generate_trade_request(customer_id=customer_id, symbol=symbol, day_of_week=DAYS_OF_WEEK[idx_of_week], region=region,
                     latency=latency, error_model=error_model, error_db=error_db, skew_market_factor=skew_market_factor, canary=canary,
@@ -147,7 +162,7 @@ def reset_market():
     high_tput_per_region = {}
     skew_market_factor_per_symbol = {}
     
-    app.logger.info(f"market reset")
+    app.logger.info("market reset")
     return None
 
 @app.post('/reset/error')
@@ -160,7 +175,7 @@ def reset_error():
     db_error_per_region = {}
     model_error_per_region = {}
     
-    app.logger.info(f"error reset")
+    app.logger.info("error reset")
     return None
 
 @app.post('/reset/test')
@@ -169,7 +184,7 @@ def test_error():
 
     canary_per_region = {}
     
-    app.logger.info(f"test reset")
+    app.logger.info("test reset")
     return None
 
 @app.get('/state')
@@ -310,7 +325,7 @@ def generate_trade_force(*, customer_id, day_of_week, region, symbol, action, sh
                                        timeout=TRADE_TIMEOUT)
         trade_response.raise_for_status()
     except Exception as inst:
-        print(inst)
+        trade_log.warning("%s", inst)
 
 def generate_trades(*, fixed_day_of_week=None, fixed_region = None, fixed_symbol = None,
                     fixed_action = None, fixed_shares_min = None, fixed_shares_max = None, 
@@ -351,7 +366,8 @@ def generate_trades(*, fixed_day_of_week=None, fixed_region = None, fixed_symbol
         if fixed_share_price_min is not None and share_price >= fixed_share_price_min and share_price <= fixed_share_price_max:
             trade_classification = classification
 
-        print(f"training {symbol} for {customer_id} on {DAYS_OF_WEEK[idx_of_week]} from {region}, classification {trade_classification}")
+        trade_log.info("training %s for %s on %s from %s, classification %s",
+                       symbol, customer_id, DAYS_OF_WEEK[idx_of_week], region, trade_classification)
 
         generate_trade_force(symbol=symbol, day_of_week=DAYS_OF_WEEK[idx_of_week], region=region, customer_id=customer_id,
                              action=action, shares=shares, share_price=share_price, classification=trade_classification,
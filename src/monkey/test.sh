@@ -12,5 +12,6 @@ export OTEL_METRIC_EXPORT_INTERVAL=5000
 # ./build.sh
 # cd ../src/trader
 # pip install -e lib/baggage-log-record-processor
+# pip install -e lib/queue-log-handler
 
 OTEL_SERVICE_NAME="monkey" opentelemetry-instrument flask run --host=0.0.0.0 -p 9002
\ No newline at end of file
@@ -1,29 +1,40 @@
-from flask import Flask, request
+from flask import Flask, g, request
 import logging
 
-import random
 import os
 import uuid
-import math
-
-import requests
+import time
 
 from opentelemetry import trace, baggage, context
-from opentelemetry.metrics import get_meter
 from opentelemetry.processor.baggage import BaggageSpanProcessor, ALLOW_ALL_BAGGAGE_KEYS
 
 from opentelemetry import _logs as logs
 from opentelemetry.processor.logrecord.baggage import BaggageLogRecordProcessor
 
+import queuelog
+
+import instrumentation
+import stats
+from trade_metrics import trade_metrics
+import trades
+
+# before the app exists, so the Flask instrumentation's tracer gets the sampler
+instrumentation.install_sampler(trace.get_tracer_provider())
+
 app = Flask(__name__)
-app.logger.setLevel(logging.INFO)
+# per-trade lines are INFO; WARNING skips them before their args are even formatted
+app.logger.setLevel(os.environ.get('TRADER_LOG_LEVEL', 'INFO').upper())
+# formatting and handler I/O happen on the log queue's thread, not the request's
+queuelog.install(logging.getLogger(), app.logger)
 
-ATTRIBUTE_PREFIX = "com.example"
+ATTRIBUTE_PREFIX = instrumentation.ATTRIBUTE_PREFIX
 
 import model
+import recorder
+import overload
 
 tracer_provider = trace.get_tracer_provider()
-tracer_provider.add_span_processor(BaggageSpanProcessor(ALLOW_ALL_BAGGAGE_KEYS))
+tracer_provider.add_span_processor(BaggageSpanProcessor(instrumentation.baggage_key_predicate()))
 
 if 'OTEL_PYTHON_LOGGING_AUTO_INSTRUMENTATION_ENABLED' in os.environ:
     print("enable otel logging")
@@ -32,114 +43,115 @@ if 'OTEL_PYTHON_LOGGING_AUTO_INSTRUMENTATION_ENABLED' in os.environ:
 
 tracer = trace.get_tracer("trader")
 
-meter = get_meter("trader")
-trading_revenue = meter.create_counter("trading_revenue", "units")
-trading_volume = meter.create_counter("trading_volume", "shares")
-
-def conform_request_bool(value):
-    return value.lower() == 'true'
+# trade fields that go on the server span and into baggage, in order
+TRADE_ATTRIBUTES = tuple((field, f"{ATTRIBUTE_PREFIX}.{field}") for field in
+                         ('customer_id', 'day_of_week', 'region', 'symbol', 'data_source', 'classification', 'canary'))
 
-def set_attribute_and_baggage(key, value):
+def set_attributes_and_baggage(items):
     current_span = trace.get_current_span()
-    current_span.set_attribute(key, value)
-    context.attach(baggage.set_baggage(key, value))
+    ctx = context.get_current()
+    for key, value in items:
+        current_span.set_attribute(key, value)
+        ctx = baggage.set_baggage(key, value, ctx)
+    context.attach(ctx)
+
+def json_response(body):
+    return app.response_class(body, mimetype='application/json')
+
+@app.errorhandler(overload.Overloaded)
+def overloaded(e):
+    app.logger.warning("shedding trade: %s", e)
+    return {'error': str(e)}, 503, {'Retry-After': '1'}
+
+@app.errorhandler(trades.BadTradeRequest)
+@app.errorhandler(stats.BadStatsQuery)
+def bad_request(e):
+    return {'error': str(e)}, 400
+
+@app.after_request
+def record_trade_stats(response):
+    args = g.get('trade_args')
+    if args is not None:
+        latency_s = time.perf_counter() - g.trade_started
+        action, shares, share_price = g.get('trade_result', (args.action, None, None))
+        stats.trade_stats.record(region=args.region, symbol=args.symbol, customer_id=args.customer_id,
+                                 action=action, canary=args.canary, shares=shares, share_price=share_price,
+                                 latency_s=latency_s, error=response.status_code >= 500)
+        handle = g.get('trade_metrics') or trade_metrics.bind(region=args.region, symbol=args.symbol, action=action,
+                                                              canary=args.canary)
+        handle.finished(latency_s * 1000)
+    return response
+
+@app.get('/stats')
+def trade_stats():
+    return stats.trade_stats.query(**stats.parse_query(request.args))
 
 @app.post('/reset')
 def reset():
     model.reset_market_data()
     return None
     
-def decode_common_args():
+def decode_common_args(*, force=False):
+    g.trade_started = time.perf_counter()
+    args = trades.parse(request.environ.get('QUERY_STRING', ''), force=force)
     trade_id = str(uuid.uuid4())
-    set_attribute_and_baggage(f"{ATTRIBUTE_PREFIX}.trade_id", trade_id)
-    
-    customer_id = request.args.get('customer_id', default=None, type=str)
-    set_attribute_and_baggage(f"{ATTRIBUTE_PREFIX}.customer_id", customer_id)
-    
-    day_of_week = request.args.get('day_of_week', default=None, type=str)
-    if day_of_week is None:
-        day_of_week = random.choice(['M','Tu', 'W', 'Th', 'F'])
-    set_attribute_and_baggage(f"{ATTRIBUTE_PREFIX}.day_of_week", day_of_week)
-    
-    region = request.args.get('region', default="NA", type=str)
-    set_attribute_and_baggage(f"{ATTRIBUTE_PREFIX}.region", region)
-
-    symbol = request.args.get('symbol', default='ESTC', type=str)
-    set_attribute_and_baggage(f"{ATTRIBUTE_PREFIX}.symbol", symbol)
-
-    data_source = request.args.get('data_source', default='monkey', type=str)
-    set_attribute_and_baggage(f"{ATTRIBUTE_PREFIX}.data_source", data_source)
-
-    classification = request.args.get('classification', default=None, type=str)
-    if classification is not None:
-        set_attribute_and_baggage(f"{ATTRIBUTE_PREFIX}.classification", classification)
-    
-    # forced errors
-    latency = request.args.get('latency', default=0, type=float)
-    error_model = request.args.get('error_model', default=False, type=conform_request_bool)
-    error_db = request.args.get('error_db', default=False, type=conform_request_bool)
-    skew_market_factor = request.args.get('skew_market_factor', default=0, type=int)
-
-    canary = request.args.get('canary', default="false", type=str)
-    set_attribute_and_baggage(f"{ATTRIBUTE_PREFIX}.canary", canary)
-    
-    return trade_id, customer_id, day_of_week, region, symbol, latency, error_model, error_db, skew_market_factor, canary, data_source, classification
-
-@tracer.start_as_current_span("trade")
-def trade(*, trade_id, customer_id, symbol, day_of_week, shares, share_price, canary, action, error_db):
+    items = [(f"{ATTRIBUTE_PREFIX}.trade_id", trade_id)]
+    for field, key in TRADE_ATTRIBUTES:
+        value = getattr(args, field)
+        if value is not None or field != 'classification':
+            items.append((key, value))
+    set_attributes_and_baggage(items)
+    g.trade_args = args
+    return trade_id, args
+
+@instrumentation.traced(tracer, "trade", 'coarse')
+def trade(*, trade_id, customer_id, region, symbol, day_of_week, shares, share_price, canary, action, error_db):
     current_span = trace.get_current_span()
     
-    app.logger.info(f"trade requested for {symbol} on day {day_of_week}")
+    app.logger.info("trade requested for %s on day %s", symbol, day_of_week)
+    g.trade_result = (action, shares, share_price)
+    g.trade_metrics = metrics = trade_metrics.bind(region=region, symbol=symbol, action=action, canary=canary)
     
     current_span.set_attribute(f"{ATTRIBUTE_PREFIX}.shares", shares)
     current_span.set_attribute(f"{ATTRIBUTE_PREFIX}.share_price", share_price)
     current_span.set_attribute(f"{ATTRIBUTE_PREFIX}.action", action)
     if action == 'buy' or action == 'sell':
         current_span.set_attribute(f"{ATTRIBUTE_PREFIX}.value", shares * share_price)
-        trading_revenue.add(math.ceil(share_price * shares * .001))
-        trading_volume.add(shares)
+        metrics.traded(shares, share_price)
     else:
         current_span.set_attribute(f"{ATTRIBUTE_PREFIX}.value", 0)
 
-    response = {}
-    response['id'] = trade_id
-    response['symbol']= symbol
-        
     if error_db is True:
         share_price = -share_price
         shares = -shares
-    trade_response = requests.post(f"http://{os.environ['ROUTER_HOST']}:9000/record", params={'canary': canary, 'customer_id': customer_id, 'trade_id': trade_id, 'symbol': symbol, 'shares': shares, 'share_price': share_price, 'action': action})
-    trade_response.raise_for_status()
-    trade_response_json = trade_response.json()
+    record_params = {'canary': canary, 'customer_id': customer_id, 'trade_id': trade_id, 'symbol': symbol, 'shares': shares, 'share_price': share_price, 'action': action}
+    # forced db errors are always recorded synchronously so the failure still shows on this trade
+    if recorder.write_behind() and error_db is not True:
+        recorder.recorder.submit(record_params)
+    else:
+        trade_response_json = recorder.recorder.record(record_params)
 
-    response['shares']= shares
-    response['share_price']= share_price
-    response['action']= action
+    app.logger.info("traded %s on day %s for %s", symbol, day_of_week, customer_id)
     
-    app.logger.info(f"traded {symbol} on day {day_of_week} for {customer_id}")
-    
-    return response
+    return json_response(trades.encode_response(trade_id=trade_id, symbol=symbol, shares=shares,
+                                                 share_price=share_price, action=action))
     
 @app.post('/trade/force')
 def trade_force():
-    trade_id, customer_id, day_of_week, region, symbol, latency, error_model, error_db, skew_market_factor, canary, data_source, classification = decode_common_args()
-
-    action = request.args.get('action', type=str)
-    shares = request.args.get('shares', type=int)
-    share_price = request.args.get('share_price', type=float)
+    trade_id, args = decode_common_args(force=True)
 
-    return trade (trade_id=trade_id, symbol=symbol, customer_id=customer_id, day_of_week=day_of_week, shares=shares, share_price=share_price, canary=canary, action=action, error_db=False)
+    return trade (trade_id=trade_id, region=args.region, symbol=args.symbol, customer_id=args.customer_id, day_of_week=args.day_of_week, shares=args.shares, share_price=args.share_price, canary=args.canary, action=args.action, error_db=False)
 
 @app.post('/trade/request')
 def trade_request():
-    trade_id, customer_id, day_of_week, region, symbol, latency, error_model, error_db, skew_market_factor, canary, data_source, classification = decode_common_args()
+    trade_id, args = decode_common_args()
 
-    action, shares, share_price = run_model(trade_id=trade_id, customer_id=customer_id, day_of_week=day_of_week, symbol=symbol, 
-                                                   error=error_model, latency=latency, skew_market_factor=skew_market_factor)
+    action, shares, share_price = run_model(trade_id=trade_id, customer_id=args.customer_id, day_of_week=args.day_of_week, symbol=args.symbol, 
+                                                   error=args.error_model, latency=args.latency, skew_market_factor=args.skew_market_factor)
 
-    return trade (trade_id=trade_id, symbol=symbol, customer_id=customer_id, day_of_week=day_of_week, shares=shares, share_price=share_price, canary=canary, action=action, error_db=error_db)
+    return trade (trade_id=trade_id, region=args.region, symbol=args.symbol, customer_id=args.customer_id, day_of_week=args.day_of_week, shares=shares, share_price=share_price, canary=args.canary, action=action, error_db=args.error_db)
 
-@tracer.start_as_current_span("run_model")
+@instrumentation.traced(tracer, "run_model", 'coarse')
 def run_model(*, trade_id, customer_id, day_of_week, symbol, error=False, latency=0.0, skew_market_factor=0):
     current_span = trace.get_current_span()
     
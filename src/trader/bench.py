@@ -0,0 +1,342 @@
+"""
+End-to-end throughput benchmark for the trader.
+
+Runs app.py in-process against a local stand-in for the router's /record
+endpoint (with configurable latency and error rate) and in-memory OTel
+exporters, then drives /trade/request and /trade/force through Flask's
+test client at fixed rates and concurrency levels. Reports req/s,
+p50/p99/p999 latency, CPU time per request and memory allocated per request
+for every combination, and can write the results as JSON to compare commits.
+
+    python bench.py --rates 0,200,500 --concurrency 1,8 --duration 5
+    python bench.py --router-latency-ms 20 --recorder-mode write_behind --json after.json --baseline before.json
+
+A rate of 0 runs closed-loop (each worker sends its next request as soon as
+the previous one returns). At a fixed rate, latency is measured from when a
+request was due rather than when it was sent, so falling behind shows up as
+latency instead of being hidden. CPU time is the whole process, so it
+includes the stand-in router and the exporters; allocations are measured in
+a separate sequential pass under tracemalloc, which would distort timings.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from opentelemetry import trace, metrics
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+ENDPOINTS = ('trade/request', 'trade/force')
+SYMBOLS = ['ESTC', 'MSFT', 'AAPL', 'GOOG', 'AMZN']
+DAYS_OF_WEEK = ['M', 'Tu', 'W', 'Th', 'F']
+REGIONS = ['NA', 'EU', 'LATAM', 'EMEA']
+
+class RouterHandler(BaseHTTPRequestHandler):
+    """Stand-in for the router's /record: waits the configured latency, then acknowledges or fails the trade."""
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes; with Nagle on, keep-alive
+    # clients wait out a delayed ACK on every response
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.received += 1
+        if random.random() < server.error_rate:
+            status, body = 500, b'{"error":"stand-in router error"}'
+        else:
+            params = {key: values[0] for key, values in parse_qs(urlsplit(self.path).query).items()}
+            status, body = 200, json.dumps(params).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_router(*, latency_ms, error_rate):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RouterHandler)
+    server.daemon_threads = True
+    server.latency = latency_ms / 1000
+    server.error_rate = error_rate
+    server.received = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def setup_telemetry():
+    """Installs SDK providers with in-memory exporters; must run before app.py is imported."""
+    spans = InMemorySpanExporter()
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(BatchSpanProcessor(spans))
+    trace.set_tracer_provider(tracer_provider)
+    reader = InMemoryMetricReader()
+    metrics.set_meter_provider(MeterProvider(metric_readers=[reader]))
+
+    # what opentelemetry-instrument would add in the container, when installed
+    try:
+        from opentelemetry.instrumentation.flask import FlaskInstrumentor
+        FlaskInstrumentor().instrument()
+    except ImportError:
+        print("opentelemetry-instrumentation-flask not installed; server spans not included", file=sys.stderr)
+    try:
+        from opentelemetry.instrumentation.requests import RequestsInstrumentor
+        RequestsInstrumentor().instrument()
+    except ImportError:
+        print("opentelemetry-instrumentation-requests not installed; router client spans not included", file=sys.stderr)
+    return tracer_provider, spans, reader
+
+def trade_query(endpoint, rng):
+    query = {
+        'customer_id': f"b{rng.randint(0, 999):03d}",
+        'symbol': rng.choice(SYMBOLS),
+        'day_of_week': rng.choice(DAYS_OF_WEEK),
+        'region': rng.choice(REGIONS),
+        'canary': 'false',
+    }
+    if endpoint == 'trade/force':
+        query.update(action=rng.choice(['buy', 'sell']), shares=rng.randint(1, 100),
+                     share_price=round(rng.uniform(1, 1000), 2))
+    return query
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run_scenario(app, endpoint, *, rate, concurrency, duration, seed=0):
+    """
+    Sends requests from `concurrency` threads for `duration` seconds, at
+    `rate` requests/s in total (0: as fast as they go). Returns the latencies
+    in seconds, the status counts and the wall and CPU seconds spent.
+    """
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    next_index = 0
+
+    def worker(n):
+        nonlocal next_index
+        client = app.test_client()
+        rng = random.Random(seed * 1000 + n)
+        local_latencies = []
+        local_statuses = Counter()
+        while True:
+            with lock:
+                index = next_index
+                next_index += 1
+            if rate:
+                due = start + index / rate
+                if due >= end:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                due = time.perf_counter()
+                if due >= end:
+                    break
+            response = client.post(f"/{endpoint}", query_string=trade_query(endpoint, rng))
+            local_latencies.append(time.perf_counter() - due)
+            local_statuses[response.status_code] += 1
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+
+    threads = [threading.Thread(target=worker, args=(n,), name=f"bench-{n}") for n in range(concurrency)]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    end = start + duration
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_s = time.perf_counter() - start
+    cpu_s = time.process_time() - cpu_start
+    return latencies, statuses, wall_s, cpu_s
+
+def measure_allocations(app, endpoint, requests, seed=0):
+    """Average peak bytes allocated while serving one request, and bytes still held after it."""
+    client = app.test_client()
+    rng = random.Random(seed)
+    tracemalloc.start()
+    try:
+        first, _ = tracemalloc.get_traced_memory()
+        peak_total = 0
+        for _ in range(requests):
+            # garbage from earlier requests freed mid-request would hide this one's allocations
+            gc.collect()
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            client.post(f"/{endpoint}", query_string=trade_query(endpoint, rng))
+            _, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - before
+        last, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak_total / requests, (last - first) / requests
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+def report(scenario):
+    print(f"  {scenario['endpoint']:<14} rate {scenario['target_rate'] or 'max':>5}  x{scenario['concurrency']:<3}"
+          f" {scenario['requests_per_sec']:8.0f} req/s  p50 {scenario['p50_ms']:7.2f}ms  p99 {scenario['p99_ms']:7.2f}ms"
+          f"  p999 {scenario['p999_ms']:7.2f}ms  {scenario['cpu_us_per_request']:7.0f}us CPU/req"
+          f"  {scenario['alloc_peak_kib_per_request']:6.1f}KiB alloc/req  {scenario['spans_per_request']:4.1f} spans/req"
+          f"  errors {scenario['errors']}")
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    by_key = {(s['endpoint'], s['target_rate'], s['concurrency']): s for s in baseline['scenarios']}
+    print(f"compared with {baseline_path} ({baseline.get('commit') or 'unknown commit'}):")
+    for scenario in results['scenarios']:
+        before = by_key.get((scenario['endpoint'], scenario['target_rate'], scenario['concurrency']))
+        if before is None:
+            continue
+        changes = []
+        for key, label in (('requests_per_sec', 'req/s'), ('p99_ms', 'p99'), ('cpu_us_per_request', 'CPU/req'),
+                           ('alloc_peak_kib_per_request', 'alloc/req')):
+            if before[key]:
+                changes.append(f"{label} {100 * (scenario[key] - before[key]) / before[key]:+6.1f}%")
+        print(f"  {scenario['endpoint']:<14} rate {scenario['target_rate'] or 'max':>5}  x{scenario['concurrency']:<3} "
+              + "  ".join(changes))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark trader throughput against a stand-in router.")
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help="endpoints to drive")
+    parser.add_argument('--rates', type=int_list, default=[0], help="total requests/s per run; 0 runs closed-loop")
+    parser.add_argument('--concurrency', type=int_list, default=[1, 8], help="client threads per run")
+    parser.add_argument('--duration', type=float, default=5, help="seconds per run")
+    parser.add_argument('--warmup', type=int, default=200, help="untimed requests per endpoint before the runs")
+    parser.add_argument('--alloc-requests', type=int, default=200, help="requests in the allocation pass")
+    parser.add_argument('--router-latency-ms', type=float, default=0, help="stand-in router delay per /record")
+    parser.add_argument('--router-error-rate', type=float, default=0, help="fraction of /record calls that fail with 500")
+    parser.add_argument('--recorder-mode', choices=['sync', 'write_behind'],
+                        default=os.environ.get('TRADE_RECORDER_MODE', 'sync'))
+    parser.add_argument('--log-level', default='INFO', help="app log level; records are formatted but discarded")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON to PATH")
+    parser.add_argument('--baseline', metavar='PATH', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+    endpoints = [endpoint.strip().strip('/') for endpoint in args.endpoints.split(',') if endpoint.strip()]
+
+    router = start_router(latency_ms=args.router_latency_ms, error_rate=args.router_error_rate)
+    spill_dir = tempfile.TemporaryDirectory()
+    os.environ['ROUTER_HOST'] = '127.0.0.1'
+    os.environ['ROUTER_PORT'] = str(router.server_address[1])
+    os.environ['TRADE_RECORDER_MODE'] = args.recorder_mode
+    os.environ['TRADE_RECORDER_SPILL_PATH'] = os.path.join(spill_dir.name, 'spill.ndjson')
+    os.environ['TRADER_CHECKPOINT_PATH'] = os.path.join(spill_dir.name, 'market_state.bin')
+
+    tracer_provider, spans, _ = setup_telemetry()
+    import app as trader
+    import model
+    import recorder
+    import queuelog
+
+    # keep the service's log formatting cost without flooding the terminal
+    devnull = open(os.devnull, 'w')
+    for handler in trader.app.logger.handlers:
+        # the app's handlers sit behind the log queue's handler
+        for inner in getattr(handler, 'handlers', [handler]):
+            if isinstance(inner, logging.StreamHandler):
+                inner.setStream(devnull)
+    trader.app.logger.setLevel(args.log_level.upper())
+
+    for endpoint in endpoints:
+        client = trader.app.test_client()
+        rng = random.Random(-1)
+        for _ in range(args.warmup):
+            client.post(f"/{endpoint}", query_string=trade_query(endpoint, rng))
+
+    results = {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'config': {key: value for key, value in vars(args).items() if key not in ('json', 'baseline')},
+        'scenarios': [],
+    }
+    print(f"trader benchmark: recorder {args.recorder_mode}, router latency {args.router_latency_ms}ms, "
+          f"router errors {100 * args.router_error_rate:.1f}%")
+    for endpoint in endpoints:
+        alloc_peak, retained = measure_allocations(trader.app, endpoint, args.alloc_requests)
+        for rate in args.rates:
+            for concurrency in args.concurrency:
+                model.reset_market_data()
+                tracer_provider.force_flush()
+                spans.clear()
+                latencies, statuses, wall_s, cpu_s = run_scenario(trader.app, endpoint, rate=rate,
+                                                                  concurrency=concurrency, duration=args.duration)
+                if recorder.write_behind():
+                    # the flusher's CPU belongs to these requests too
+                    cpu_start = time.process_time()
+                    recorder.recorder.stop()
+                    cpu_s += time.process_time() - cpu_start
+                tracer_provider.force_flush()
+                completed = len(latencies)
+                latencies.sort()
+                scenario = {
+                    'endpoint': endpoint,
+                    'target_rate': rate,
+                    'concurrency': concurrency,
+                    'requests': completed,
+                    'requests_per_sec': completed / wall_s if wall_s else 0,
+                    'p50_ms': 1000 * percentile(latencies, 0.50),
+                    'p99_ms': 1000 * percentile(latencies, 0.99),
+                    'p999_ms': 1000 * percentile(latencies, 0.999),
+                    'max_ms': 1000 * latencies[-1] if latencies else 0,
+                    'cpu_us_per_request': 1e6 * cpu_s / completed if completed else 0,
+                    'alloc_peak_kib_per_request': alloc_peak / 1024,
+                    'retained_bytes_per_request': retained,
+                    'spans_per_request': len(spans.get_finished_spans()) / completed if completed else 0,
+                    'statuses': {str(status): count for status, count in sorted(statuses.items())},
+                    'errors': sum(count for status, count in statuses.items() if status >= 400),
+                }
+                results['scenarios'].append(scenario)
+                report(scenario)
+
+    queuelog.log_queue.stop()
+    results['log_queue'] = queuelog.log_queue.stats()
+    print(f"log queue: {sum(results['log_queue']['dropped'].values())} records dropped, "
+          f"{sum(results['log_queue']['sampled_out'].values())} sampled out")
+    model.checkpointer.stop()
+    router.shutdown()
+    spill_dir.cleanup()
+    devnull.close()
+
+    if args.baseline:
+        compare(results, args.baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Checkpoints of the trader's market state, so a restart carries on with the
+same prices instead of starting over from the seed.
+
+The state (the seed prices and each symbol's moving-average window) is
+written as a small binary file every TRADER_CHECKPOINT_INTERVAL_S seconds
+by a background thread, to a temp file that is then renamed over the
+checkpoint, so a crash leaves either the old or the new one. Unchanged state
+is not written again. If writing ever takes longer than
+TRADER_CHECKPOINT_MAX_OVERHEAD of the time between checkpoints, the interval
+is stretched to stay within it. An empty TRADER_CHECKPOINT_PATH turns
+checkpointing off.
+
+Layout (little-endian): magic b'TMKT', version, window size, seed count,
+symbol count, the seed prices as doubles, then per symbol its UTF-8 name
+length (H), value count (B), name and values (doubles).
+"""
+import atexit
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from opentelemetry.metrics import get_meter
+
+PATH = os.environ.get('TRADER_CHECKPOINT_PATH', 'market_state.bin')
+INTERVAL_S = float(os.environ.get('TRADER_CHECKPOINT_INTERVAL_S', 5))
+# fraction of wall time checkpoint writes may take
+MAX_OVERHEAD = float(os.environ.get('TRADER_CHECKPOINT_MAX_OVERHEAD', 0.01))
+
+MAGIC = b'TMKT'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBH')
+SYMBOL = struct.Struct('<HB')
+
+logger = logging.getLogger(__name__)
+meter = get_meter("trader")
+
+def worker_path(path):
+    """The path for one prefork worker (market_state.bin -> market_state.3.bin), for files each worker keeps to itself."""
+    worker = os.environ.get('TRADER_WORKER_ID')
+    if not path or worker is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{worker}{ext}"
+
+def encode(window_size, seed, windows):
+    """windows: (symbol, [values]) pairs; only the last window_size values of each are kept."""
+    parts = [HEADER.pack(MAGIC, VERSION, window_size, len(seed), 0), struct.pack(f'<{len(seed)}d', *seed)]
+    count = 0
+    for symbol, values in windows:
+        name = symbol.encode('utf8')
+        values = values[-window_size:]
+        if len(name) > 0xffff or not values:
+            continue
+        parts.append(SYMBOL.pack(len(name), len(values)))
+        parts.append(name)
+        parts.append(struct.pack(f'<{len(values)}d', *values))
+        count += 1
+    parts[0] = HEADER.pack(MAGIC, VERSION, window_size, len(seed), count)
+    return b''.join(parts)
+
+def decode(data):
+    """Returns (window_size, seed, {symbol: [values]}); raises ValueError on anything malformed."""
+    try:
+        magic, version, window_size, seed_count, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a version {VERSION} market checkpoint")
+        offset = HEADER.size
+        seed = list(struct.unpack_from(f'<{seed_count}d', data, offset))
+        offset += 8 * seed_count
+        windows = {}
+        for _ in range(count):
+            name_length, value_count = SYMBOL.unpack_from(data, offset)
+            offset += SYMBOL.size
+            symbol = data[offset:offset + name_length].decode('utf8')
+            offset += name_length
+            windows[symbol] = list(struct.unpack_from(f'<{value_count}d', data, offset))
+            offset += 8 * value_count
+    except (struct.error, UnicodeDecodeError) as inst:
+        raise ValueError(f"truncated or corrupt market checkpoint: {inst}") from None
+    return window_size, seed, windows
+
+def write_atomic(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.market_state-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def load(path):
+    """The decoded checkpoint at path, or None if there is none (or it is unusable)."""
+    if not path:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return decode(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as inst:
+        logger.warning("ignoring market checkpoint %s: %s", path, inst)
+        return None
+
+class Checkpointer:
+    """
+    Writes snapshot() -> (window_size, seed, windows) to path periodically
+    and at exit. snapshot() runs on the checkpoint thread, so it must only
+    copy the state, not lock it.
+    """
+
+    def __init__(self, snapshot, *, path=PATH, interval_s=INTERVAL_S, max_overhead=MAX_OVERHEAD):
+        self.snapshot = snapshot
+        self.path = worker_path(path)
+        self.interval_s = interval_s
+        self.max_overhead = max_overhead
+        self._last = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._duration = meter.create_histogram("market_checkpoint.duration", unit="ms",
+                                                description="time to encode and write one market state checkpoint")
+
+    def save(self):
+        """Writes a checkpoint now if the state changed; returns the seconds it took (0 if skipped)."""
+        if not self.path:
+            return 0.0
+        start = time.perf_counter()
+        with self._lock:
+            data = encode(*self.snapshot())
+            if data == self._last:
+                return 0.0
+            try:
+                write_atomic(self.path, data)
+            except OSError as inst:
+                logger.warning("writing market checkpoint %s failed: %s", self.path, inst)
+                return 0.0
+            self._last = data
+        elapsed = time.perf_counter() - start
+        self._duration.record(elapsed * 1000)
+        return elapsed
+
+    def _run(self):
+        wait = self.interval_s
+        while not self._stopping.wait(wait):
+            elapsed = self.save()
+            wait = max(self.interval_s, elapsed / self.max_overhead if self.max_overhead > 0 else 0)
+
+    def start(self):
+        if not self.path or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='market-checkpoint', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        self.save()
@@ -0,0 +1,129 @@
+"""
+How much of each trade the trader traces.
+
+TRADER_INSTRUMENTATION picks the span granularity:
+
+    full    trade, run_model, sim_market_data, sim_decide and buy/sell spans
+    coarse  only the trade and run_model spans; the model's attributes and
+            exceptions land on run_model
+    errors  like full, but ordinary trades that start a trace at the
+            trader are not sampled (the sample ratio defaults to 0), so
+            only the trades TradeSampler always keeps and those a sampling
+            caller passed on are traced
+
+TradeSampler decides at the trader's HTTP server span: trades with forced
+errors, canary trades and trades with injected latency are always kept.
+Anything else follows the caller's sampled flag when there is one (as
+ParentBased would), and is otherwise kept with probability
+TRADER_SAMPLE_RATIO (by trace id, so the same traces are kept by every
+service using a ratio sampler). Spans below it follow its decision. Real
+(unforced) errors cannot be known at the head of a trace, so they are only
+kept when their trade happens to be sampled.
+
+The sampler is only installed when TRADER_INSTRUMENTATION or
+TRADER_SAMPLE_RATIO is set; otherwise OTEL_TRACES_SAMPLER (or the SDK's
+default) stays in charge.
+
+BaggageSpanProcessor only copies the baggage keys in TRADER_BAGGAGE_SPAN_KEYS
+('*' for all) onto the trader's spans; the server span still gets every trade
+attribute set directly. Playback groups spans by day, so day_of_week has to
+stay on every span.
+"""
+import contextlib
+import os
+from urllib.parse import parse_qs
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace.sampling import Decision, Sampler, SamplingResult, TraceIdRatioBased
+from opentelemetry.trace import SpanKind
+
+# prefix of the trade attributes on the trader's spans, baggage and metrics
+ATTRIBUTE_PREFIX = "com.example"
+
+LEVELS = ('full', 'coarse', 'errors')
+# the trader's sampler only replaces the configured one when asked for
+CONFIGURED = 'TRADER_INSTRUMENTATION' in os.environ or 'TRADER_SAMPLE_RATIO' in os.environ
+LEVEL = os.environ.get('TRADER_INSTRUMENTATION', 'full')
+if LEVEL not in LEVELS:
+    raise ValueError(f"TRADER_INSTRUMENTATION must be one of {', '.join(LEVELS)}, not {LEVEL!r}")
+SAMPLE_RATIO = float(os.environ.get('TRADER_SAMPLE_RATIO', 0 if LEVEL == 'errors' else 1))
+BAGGAGE_SPAN_KEYS = os.environ.get('TRADER_BAGGAGE_SPAN_KEYS', ','.join(f"{ATTRIBUTE_PREFIX}.{key}" for key in
+                                   ('trade_id', 'customer_id', 'day_of_week', 'region', 'symbol', 'canary',
+                                    'data_source')))
+
+def enabled(granularity):
+    return granularity == 'coarse' or LEVEL != 'coarse'
+
+def traced(tracer, name, granularity='full'):
+    """Decorator: runs the function in a span, or leaves it alone when the level skips this span."""
+    def decorate(fn):
+        return tracer.start_as_current_span(name)(fn) if enabled(granularity) else fn
+    return decorate
+
+def span(tracer, name, granularity='full'):
+    """Context manager: a new span, or the current one when the level skips this span."""
+    if enabled(granularity):
+        return tracer.start_as_current_span(name)
+    return contextlib.nullcontext(trace.get_current_span())
+
+def baggage_key_predicate():
+    keys = {key.strip() for key in BAGGAGE_SPAN_KEYS.split(',') if key.strip()}
+    if '*' in keys:
+        return lambda key: True
+    return lambda key: key in keys
+
+# span attributes the HTTP instrumentation may carry the request's query in, depending on its semconv mode
+QUERY_ATTRIBUTES = ('url.query', 'http.target', 'http.url')
+
+def _request_args(attributes):
+    for key in QUERY_ATTRIBUTES:
+        value = (attributes or {}).get(key)
+        if value:
+            return parse_qs(value if key == 'url.query' else value.partition('?')[2])
+    return {}
+
+def _arg(args, name):
+    values = args.get(name)
+    return values[0] if values else None
+
+def always_keep(args):
+    if any((_arg(args, name) or '').lower() == 'true' for name in ('canary', 'error_model', 'error_db')):
+        return True
+    try:
+        return float(_arg(args, 'latency') or 0) > 0
+    except ValueError:
+        return False
+
+class TradeSampler(Sampler):
+    """
+    Head sampler for the trader. The server span of an always-keep trade is
+    sampled whatever the caller decided; any other span follows its parent
+    (local or remote), and spans without one are decided by the ratio.
+    """
+
+    def __init__(self, ratio=SAMPLE_RATIO):
+        self.ratio = TraceIdRatioBased(ratio)
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        parent = trace.get_current_span(parent_context).get_span_context()
+        parent_trace_state = parent.trace_state if parent.is_valid else None
+        local_parent = parent.is_valid and not parent.is_remote
+        if not local_parent and kind == SpanKind.SERVER and always_keep(_request_args(attributes)):
+            return SamplingResult(Decision.RECORD_AND_SAMPLE, attributes, parent_trace_state)
+        if parent.is_valid:
+            decision = Decision.RECORD_AND_SAMPLE if parent.trace_flags.sampled else Decision.DROP
+            return SamplingResult(decision, attributes, parent_trace_state)
+        return self.ratio.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+
+    def get_description(self):
+        return f"TradeSampler{{{self.ratio.get_description()}}}"
+
+def install_sampler(tracer_provider):
+    """
+    Replaces the SDK tracer provider's sampler, unless neither
+    TRADER_INSTRUMENTATION nor TRADER_SAMPLE_RATIO is set. Tracers capture
+    the sampler when they are created, so this has to run before the Flask
+    app (and its instrumentation's tracer) is.
+    """
+    if CONFIGURED and hasattr(tracer_provider, 'sampler'):
+        tracer_provider.sampler = TradeSampler()
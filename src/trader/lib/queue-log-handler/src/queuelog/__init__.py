@@ -0,0 +1,4 @@
+from .handler import LogQueue, QueueLogHandler, install, log_queue
+from .version import __version__
+
+__all__ = ["LogQueue", "QueueLogHandler", "install", "log_queue", "__version__"]
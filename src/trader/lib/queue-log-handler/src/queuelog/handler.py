@@ -0,0 +1,178 @@
+import atexit
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from opentelemetry import context
+
+CAPACITY = int(os.environ.get('LOG_QUEUE_CAPACITY', 10000))
+# past half capacity, only one in this many records below WARNING is kept
+SAMPLE_EVERY = int(os.environ.get('LOG_QUEUE_SAMPLE_EVERY', 10))
+POLL_INTERVAL_S = float(os.environ.get('LOG_QUEUE_POLL_INTERVAL_S', 0.05))
+REPORT_INTERVAL_S = float(os.environ.get('LOG_QUEUE_REPORT_INTERVAL_S', 60))
+
+logger = logging.getLogger(__name__)
+
+class LogQueue:
+    """
+    Bounded hand-off from the threads that log to one background thread that
+    formats and writes their records.
+
+    Logging threads only append to a deque (atomic, so no lock is taken) and
+    never format anything: a record keeps its message and args, and the
+    listener formats it when its handlers run. The OTel context current when
+    the record was logged is carried along and attached around the handlers,
+    so trace correlation and baggage still come out right.
+
+    Past half capacity, records below WARNING are sampled (one in
+    sample_every kept); at capacity, records are dropped. Both are counted
+    by level, and the listener logs a summary every report_interval_s while
+    it happens. Args are formatted late, so pass values, not objects that
+    change after the call.
+    """
+
+    def __init__(self, *, capacity=CAPACITY, sample_every=SAMPLE_EVERY, poll_interval_s=POLL_INTERVAL_S,
+                 report_interval_s=REPORT_INTERVAL_S):
+        self.capacity = capacity
+        self.high_water = capacity // 2
+        self.sample_every = max(1, sample_every)
+        self.poll_interval_s = poll_interval_s
+        self.report_interval_s = report_interval_s
+
+        self._records = deque()
+        self._sequence = itertools.count()
+        # taken only when records are sampled or dropped, never on the normal path
+        self._counter_lock = threading.Lock()
+        self._dropped = Counter()
+        self._sampled_out = Counter()
+        self._reported = (0, 0)
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def put(self, record, handlers):
+        depth = len(self._records)
+        if depth >= self.capacity:
+            with self._counter_lock:
+                self._dropped[record.levelname] += 1
+            return
+        if depth >= self.high_water and record.levelno < logging.WARNING and next(self._sequence) % self.sample_every:
+            with self._counter_lock:
+                self._sampled_out[record.levelname] += 1
+            return
+        self._records.append((record, handlers, context.get_current()))
+        if self._thread is None:
+            self._start()
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='log-queue', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def _after_fork(self):
+        # the parent's thread and records did not come along
+        self._records.clear()
+        self._start_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _handle(self, record, handlers, ctx):
+        token = context.attach(ctx)
+        try:
+            for handler in handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+        finally:
+            context.detach(token)
+
+    def _drain(self):
+        while True:
+            try:
+                item = self._records.popleft()
+            except IndexError:
+                return
+            self._handle(*item)
+
+    def _run(self):
+        next_report = time.monotonic() + self.report_interval_s
+        while not self._stopping.is_set():
+            self._drain()
+            if time.monotonic() >= next_report:
+                self._report()
+                next_report = time.monotonic() + self.report_interval_s
+            self._stopping.wait(self.poll_interval_s)
+
+    def _report(self):
+        stats = self.stats()
+        dropped = sum(stats['dropped'].values())
+        sampled_out = sum(stats['sampled_out'].values())
+        if (dropped, sampled_out) != self._reported:
+            logger.warning("log queue under pressure: %d records dropped, %d sampled out so far (%s dropped, %s sampled out)",
+                           dropped, sampled_out, stats['dropped'], stats['sampled_out'])
+            self._reported = (dropped, sampled_out)
+
+    def stats(self):
+        with self._counter_lock:
+            return {'queued': len(self._records), 'dropped': dict(self._dropped),
+                    'sampled_out': dict(self._sampled_out)}
+
+    def stop(self):
+        """Stops the listener after writing out whatever is still queued."""
+        thread = self._thread
+        if thread is not None:
+            self._stopping.set()
+            thread.join()
+            self._thread = None
+        self._drain()
+
+class QueueLogHandler(logging.Handler):
+    """Puts records on a LogQueue for the handlers it wraps; emitting takes no lock and does no I/O."""
+
+    def __init__(self, log_queue, handlers):
+        super().__init__()
+        self.log_queue = log_queue
+        self.handlers = list(handlers)
+
+    def handle(self, record):
+        # logging.Handler.handle would take the handler lock around emit()
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        self.log_queue.put(record, self.handlers)
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush()
+
+log_queue = LogQueue()
+
+def install(*loggers, queue=None):
+    """
+    Moves the handlers of each logger (the root logger when none are given)
+    behind a QueueLogHandler on `queue` (the shared log_queue by default).
+    Handlers added afterwards are not affected.
+    """
+    queue = queue or log_queue
+    for target in loggers or (logging.getLogger(),):
+        handlers = [handler for handler in target.handlers if not isinstance(handler, QueueLogHandler)]
+        if not handlers:
+            continue
+        for handler in handlers:
+            target.removeHandler(handler)
+        target.addHandler(QueueLogHandler(queue, handlers))
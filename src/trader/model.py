@@ -6,6 +6,9 @@ import uuid
 from app import app
 from opentelemetry import trace
 
+import checkpoint
+import instrumentation
+
 tracer = trace.get_tracer("trader")
 
 MARKET_WINDOW_SIZE = 5
@@ -37,8 +40,35 @@ def clamp(n, minn, maxn):
 def reset_market_data():
     global market_data
     market_data = {}
-
-@tracer.start_as_current_span("sim_market_data")
+    # or a restart before the next checkpoint would bring the old prices back
+    checkpointer.save()
+
+def market_state():
+    # runs on the checkpoint thread: list() copies are atomic, so trades never wait on it
+    return MARKET_WINDOW_SIZE, market_data_seed, [(symbol, list(sma.values)) for symbol, sma in list(market_data.items())]
+
+def restore_market_data():
+    global market_data, market_data_seed
+    start = time.perf_counter()
+    state = checkpoint.load(checkpointer.path)
+    if state is None:
+        return
+    _, seed, windows = state
+    if len(seed) == len(market_data_seed):
+        market_data_seed = seed
+    for symbol, values in windows.items():
+        sma = StreamingMovingAverage(window_size=MARKET_WINDOW_SIZE)
+        sma.values = values[-MARKET_WINDOW_SIZE:]
+        sma.sum = sum(sma.values)
+        market_data[symbol] = sma
+    app.logger.info("restored market state for %d symbols from %s in %.1fms", len(windows), checkpointer.path,
+                    1000 * (time.perf_counter() - start))
+
+checkpointer = checkpoint.Checkpointer(market_state)
+restore_market_data()
+checkpointer.start()
+
+@instrumentation.traced(tracer, "sim_market_data")
 def sim_market_data(*, symbol, day_of_week, skew_market_factor=0):
     global market_data
     
@@ -57,24 +87,24 @@ def sim_market_data(*, symbol, day_of_week, skew_market_factor=0):
         
     market_factor += skew_market_factor
     market_factor = clamp(market_factor, -100, 100)
-    app.logger.info(f"market_factor: {symbol}={market_factor}")
+    app.logger.info("market_factor: %s=%s", symbol, market_factor)
         
     initial_idx = hash(symbol) % len(market_data_seed)
     if symbol not in market_data:
         share_price = market_data_seed[initial_idx]
         market_data[symbol] = StreamingMovingAverage(window_size=MARKET_WINDOW_SIZE)
-        app.logger.info(f"initial share price for {symbol}: ${'{0:0.2f}'.format(share_price)}, idx={initial_idx}")
+        app.logger.info("initial share price for %s: $%0.2f, idx=%s", symbol, share_price, initial_idx)
     else:
         current_share_price = market_data[symbol].get()
         share_price = current_share_price + (current_share_price * (float(market_factor) / 100.0))
         share_price = clamp(share_price, random.randint(1, 100), random.randint(900, 1000))
 
     smoothed_share_price = round(market_data[symbol].process(share_price), 2)
-    app.logger.info(f"current market share price for {symbol}: ${'{0:0.2f}'.format(smoothed_share_price)}")
+    app.logger.info("current market share price for %s: $%0.2f", symbol, smoothed_share_price)
 
     return market_factor, smoothed_share_price
 
-@tracer.start_as_current_span("sim_decide")
+@instrumentation.traced(tracer, "sim_decide")
 def sim_decide(*, symbol, market_factor, error, latency):
 
     if error:
@@ -83,14 +113,14 @@ def sim_decide(*, symbol, market_factor, error, latency):
     action = 'hold'
     shares = 0
     if market_factor <= -25:
-        with tracer.start_as_current_span("sell") as span:
+        with instrumentation.span(tracer, "sell") as span:
             action = 'sell'
             if market_factor <= -75:
                 shares = random.randint(50, 100)
             else:
                 shares = random.randint(1, 50)
     elif market_factor >= 25:
-        with tracer.start_as_current_span("buy") as buy:
+        with instrumentation.span(tracer, "buy") as buy:
             action = 'buy'
             if market_factor >= 75:
                 shares = random.randint(50, 100)
@@ -100,7 +130,7 @@ def sim_decide(*, symbol, market_factor, error, latency):
     if latency > 0:
         time.sleep(latency)
         inst = "HTTPSConnectionPool(host=market.example.com, port=443): Max retries exceeded with url: / (Caused by NameResolutionError(Failed to resolve market.example.com ([Errno -2] Name or service not known)))"
-        app.logger.warn(f"unable to fetch current market data; skipping: {inst}")
+        app.logger.warning("unable to fetch current market data; skipping: %s", inst)
 
     return action, shares
     
\ No newline at end of file
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+
+from opentelemetry.metrics import get_meter, Observation
+
+# router calls slower than this count as congestion and shrink the limit
+LATENCY_TARGET_MS = float(os.environ.get('ROUTER_LATENCY_TARGET_MS', 250))
+INITIAL_LIMIT = float(os.environ.get('ROUTER_CONCURRENCY_INITIAL', 20))
+MIN_LIMIT = float(os.environ.get('ROUTER_CONCURRENCY_MIN', 2))
+MAX_LIMIT = float(os.environ.get('ROUTER_CONCURRENCY_MAX', 200))
+BACKOFF_RATIO = float(os.environ.get('ROUTER_CONCURRENCY_BACKOFF', 0.9))
+BREAKER_FAILURES = int(os.environ.get('ROUTER_BREAKER_FAILURES', 5))
+BREAKER_OPEN_S = float(os.environ.get('ROUTER_BREAKER_OPEN_S', 10))
+
+meter = get_meter("trader")
+
+class Overloaded(Exception):
+    """Raised instead of calling the router when it is over its limit or its circuit is open."""
+
+class AimdLimiter:
+    """
+    Concurrency limit that adapts to the router's latency: it grows by about
+    one per limit's worth of fast calls and shrinks by BACKOFF_RATIO on a
+    slow or failed call (at most once per round trip, so a burst of slow
+    calls only counts once). Calls beyond the limit are rejected at once.
+    """
+
+    def __init__(self, *, initial=INITIAL_LIMIT, min_limit=MIN_LIMIT, max_limit=MAX_LIMIT,
+                 latency_target_ms=LATENCY_TARGET_MS, backoff_ratio=BACKOFF_RATIO):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target_ms / 1000
+        self.backoff_ratio = backoff_ratio
+        self.inflight = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a slot and returns its start time; raises Overloaded when none is free."""
+        with self._lock:
+            if self.inflight >= int(self.limit):
+                raise Overloaded(f"router concurrency limit {int(self.limit)} reached")
+            self.inflight += 1
+        return time.monotonic()
+
+    def cancel(self):
+        """Gives back a slot that was not used, without adjusting the limit."""
+        with self._lock:
+            self.inflight -= 1
+
+    def release(self, started, ok):
+        now = time.monotonic()
+        latency = now - started
+        with self._lock:
+            self.inflight -= 1
+            if not ok or latency > self.latency_target:
+                if started >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+class CircuitBreaker:
+    """
+    Opens after BREAKER_FAILURES consecutive failures and rejects calls for
+    BREAKER_OPEN_S seconds, then lets a single trial call through
+    (half-open): its success closes the circuit, its failure opens it again.
+
+    allow() returns a ticket (None when the call is rejected) to hand back
+    to record(). Each state change starts a new generation, and results of
+    calls admitted in an earlier one are ignored, so a slow call that started
+    before the circuit opened cannot close it or let a second trial in.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name, *, failures=BREAKER_FAILURES, open_s=BREAKER_OPEN_S):
+        self.name = name
+        self.failure_threshold = failures
+        self.open_s = open_s
+        self.state = self.CLOSED
+        self._generation = 0
+        self._failures = 0
+        self._open_until = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def _enter(self, state):
+        self.state = state
+        self._generation += 1
+        self._failures = 0
+        self._trial_running = False
+        if state == self.OPEN:
+            self._open_until = time.monotonic() + self.open_s
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return self._generation
+            if self.state == self.OPEN and time.monotonic() >= self._open_until:
+                self._enter(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return self._generation
+            return None
+
+    def record(self, ticket, ok):
+        with self._lock:
+            if ticket != self._generation:
+                return
+            if self.state == self.HALF_OPEN:
+                # only the trial is admitted in a half-open generation
+                self._enter(self.CLOSED if ok else self.OPEN)
+            elif ok:
+                self._failures = 0
+            else:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._enter(self.OPEN)
+
+class RouterGuard:
+    """One adaptive limiter for all router calls, and a circuit breaker each for the canary and regular paths."""
+
+    def __init__(self):
+        self.limiter = AimdLimiter()
+        self.breakers = {True: CircuitBreaker('canary'), False: CircuitBreaker('regular')}
+        self._rejected = meter.create_counter("router.rejected", unit="requests",
+                                              description="router calls shed by the trader")
+        meter.create_observable_gauge("router.concurrency_limit", callbacks=[self._observe_limit], unit="requests")
+        meter.create_observable_gauge("router.inflight", callbacks=[self._observe_inflight], unit="requests")
+        meter.create_observable_gauge("router.circuit_state", callbacks=[self._observe_breakers],
+                                      description="0 closed, 1 half-open, 2 open")
+
+    def _observe_limit(self, options):
+        yield Observation(int(self.limiter.limit))
+
+    def _observe_inflight(self, options):
+        yield Observation(self.limiter.inflight)
+
+    def _observe_breakers(self, options):
+        for breaker in self.breakers.values():
+            yield Observation(breaker.state, {'path': breaker.name})
+
+    def call(self, canary, send):
+        """
+        Runs send() -> response under the limiter and the path's breaker.
+        Exceptions and 5xx responses count as failures. Raises Overloaded
+        without calling send when the call has to be shed.
+        """
+        breaker = self.breakers[canary]
+        try:
+            started = self.limiter.acquire()
+        except Overloaded:
+            self._rejected.add(1, {'reason': 'concurrency_limit', 'path': breaker.name})
+            raise
+        ticket = breaker.allow()
+        if ticket is None:
+            self.limiter.cancel()
+            self._rejected.add(1, {'reason': 'circuit_open', 'path': breaker.name})
+            raise Overloaded(f"router circuit for {breaker.name} trades is open")
+
+        ok = False
+        try:
+            response = send()
+            ok = response.status_code < 500
+            return response
+        finally:
+            self.limiter.release(started, ok)
+            breaker.record(ticket, ok)
+
+guard = RouterGuard()
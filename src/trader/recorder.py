@@ -0,0 +1,284 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from opentelemetry import context, propagate
+from opentelemetry.metrics import get_meter, Observation
+
+from checkpoint import worker_path
+from overload import guard, Overloaded
+
+logger = logging.getLogger(__name__)
+
+# 'sync' records each trade before trade() responds; 'write_behind' queues it
+RECORDER_MODE = os.environ.get('TRADE_RECORDER_MODE', 'sync')
+QUEUE_SIZE = int(os.environ.get('TRADE_RECORDER_QUEUE_SIZE', 10000))
+BATCH_SIZE = int(os.environ.get('TRADE_RECORDER_BATCH_SIZE', 64))
+MAX_DELAY_MS = float(os.environ.get('TRADE_RECORDER_MAX_DELAY_MS', 50))
+# how long a request waits for room in a full queue before its trade goes to the spill file
+ENQUEUE_TIMEOUT_MS = float(os.environ.get('TRADE_RECORDER_ENQUEUE_TIMEOUT_MS', 100))
+CONCURRENCY = int(os.environ.get('TRADE_RECORDER_CONCURRENCY', 8))
+SPILL_PATH = os.environ.get('TRADE_RECORDER_SPILL_PATH', 'trade_recorder_spill.ndjson')
+SPILL_RETRY_S = float(os.environ.get('TRADE_RECORDER_SPILL_RETRY_S', 5))
+TIMEOUT = float(os.environ.get('TRADE_RECORDER_TIMEOUT_S', 5))
+
+meter = get_meter("trader")
+
+def record_url():
+    return f"http://{os.environ['ROUTER_HOST']}:{os.environ.get('ROUTER_PORT', 9000)}/record"
+
+class TradeRecorder:
+    """
+    Sends trades to the router's /record endpoint.
+
+    record() does it synchronously. submit() puts the trade on a bounded
+    queue instead; a background flusher takes up to batch_size trades at a
+    time (waiting at most max_delay_ms for a batch to fill) and sends them
+    concurrently over pooled connections. The router has no batch endpoint,
+    so a micro-batch is a burst of concurrent /record calls.
+
+    Trades that cannot be sent (router down, or the queue stays full) are
+    appended to a local spill file, which the flusher retries every
+    spill_retry_s seconds. Prefork workers each get their own spill file,
+    since replaying moves it aside. Spilling does not wait for the disk: the
+    flusher fsyncs the file after each batch (at least every spill_retry_s),
+    so a power loss, though not a crash, can lose the last few spilled trades. The trace context and baggage of the request
+    that submitted a trade are carried along, so the /record call still
+    belongs to the trade's trace.
+    """
+
+    def __init__(self, *, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, max_delay_ms=MAX_DELAY_MS,
+                 enqueue_timeout_ms=ENQUEUE_TIMEOUT_MS, concurrency=CONCURRENCY, spill_path=SPILL_PATH,
+                 spill_retry_s=SPILL_RETRY_S, timeout=TIMEOUT):
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self.concurrency = concurrency
+        self.spill_path = worker_path(spill_path)
+        self.spill_retry_s = spill_retry_s
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._spill_lock = threading.Lock()
+        self._spill_unsynced = False
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pool = None
+        self._atexit_registered = False
+
+        meter.create_observable_gauge("trade_recorder.queue_depth", callbacks=[self._observe_queue_depth],
+                                      unit="trades", description="trades waiting to be sent to the router")
+        self._flush_latency = meter.create_histogram("trade_recorder.flush_latency", unit="ms",
+                                                     description="time to send one micro-batch")
+        self._batch_size = meter.create_histogram("trade_recorder.batch_size", unit="trades")
+        self._spilled = meter.create_counter("trade_recorder.spilled", unit="trades",
+                                             description="trades written to the spill file")
+
+    def _observe_queue_depth(self, options):
+        yield Observation(self._queue.qsize())
+
+    def record(self, params):
+        """Records one trade synchronously; returns the router's response JSON."""
+        response = self._post(params)
+        response.raise_for_status()
+        return response.json()
+
+    def _post(self, params):
+        # the router only sends canary == 'True' to the canary recorder
+        return guard.call(params.get('canary') == 'True',
+                          lambda: self.session.post(record_url(), params=params, timeout=self.timeout))
+
+    def submit(self, params):
+        """Queues one trade for recording; never waits longer than enqueue_timeout_ms."""
+        self._ensure_started()
+        carrier = {}
+        propagate.inject(carrier)
+        item = {'params': params, 'carrier': carrier}
+        try:
+            self._queue.put(item, timeout=self.enqueue_timeout)
+        except queue.Full:
+            logger.warning("trade recorder queue full, spilling trade %s", params.get('trade_id'))
+            self._spill([item])
+
+    def _ensure_started(self):
+        # started lazily, so that a forked worker gets its own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='trade-recorder')
+                self._thread = threading.Thread(target=self._run, name='trade-recorder-flusher', daemon=True)
+                self._thread.start()
+                if not self._atexit_registered:
+                    atexit.register(self.stop)
+                    self._atexit_registered = True
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=self.spill_retry_s)
+        except queue.Empty:
+            return []
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        next_spill_retry = time.monotonic() + self.spill_retry_s
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if batch:
+                self.flush(batch)
+            self._sync_spill()
+            if time.monotonic() >= next_spill_retry:
+                self.replay_spill()
+                next_spill_retry = time.monotonic() + self.spill_retry_s
+
+    def _send(self, item):
+        token = context.attach(propagate.extract(item['carrier']))
+        try:
+            response = self._post(item['params'])
+        except (requests.RequestException, Overloaded) as inst:
+            logger.warning("recording trade %s failed: %s", item['params'].get('trade_id'), inst)
+            return False
+        finally:
+            context.detach(token)
+        if response.status_code >= 500:
+            logger.warning("recording trade %s failed: %s", item['params'].get('trade_id'), response.status_code)
+            return False
+        if response.status_code >= 400:
+            # the router will never take this one; retrying would not help
+            logger.error("trade %s rejected: %s %s", item['params'].get('trade_id'), response.status_code, response.text)
+        return True
+
+    def flush(self, batch):
+        """Sends a batch concurrently; whatever could not be sent is spilled. Returns the number sent."""
+        start = time.monotonic()
+        sent = list(self._pool.map(self._send, batch))
+        failed = [item for item, ok in zip(batch, sent) if not ok]
+        self._flush_latency.record((time.monotonic() - start) * 1000)
+        self._batch_size.record(len(batch))
+        if failed:
+            self._spill(failed)
+        return len(batch) - len(failed)
+
+    def _spill(self, items):
+        # no fsync here, as this runs on request threads: the flusher syncs the file on its next round
+        with self._spill_lock:
+            with open(self.spill_path, 'a', encoding='utf8') as f:
+                for item in items:
+                    f.write(json.dumps(item, separators=(',', ':')) + '\n')
+            self._spill_unsynced = True
+        self._spilled.add(len(items))
+
+    def _sync_spill(self):
+        """fsyncs the spill file if trades were spilled since the last call (flusher thread only)."""
+        with self._spill_lock:
+            if not self._spill_unsynced:
+                return
+            self._spill_unsynced = False
+        try:
+            # any descriptor of the file will do, so the lock is not held for the fsync
+            fd = os.open(self.spill_path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def replay_spill(self):
+        """
+        Retries the spilled trades, spilling again those that still fail.
+        The file is moved aside under the lock and sent without it, so
+        request threads can keep spilling meanwhile (flusher thread only).
+        """
+        replaying_path = f"{self.spill_path}.replaying"
+        with self._spill_lock:
+            # a .replaying file left by a crash mid-replay is retried first
+            if not os.path.exists(replaying_path):
+                try:
+                    os.replace(self.spill_path, replaying_path)
+                except FileNotFoundError:
+                    return 0
+        with open(replaying_path, 'r', encoding='utf8') as f:
+            items = [json.loads(line) for line in f if line.strip()]
+
+        remaining = []
+        sent = 0
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            if remaining:
+                # the router is still down; keep the rest for next time
+                remaining.extend(batch)
+                continue
+            results = list(self._pool.map(self._send, batch))
+            sent += sum(results)
+            remaining.extend(item for item, ok in zip(batch, results) if not ok)
+
+        with self._spill_lock:
+            if remaining:
+                with open(self.spill_path, 'a', encoding='utf8') as f:
+                    for item in remaining:
+                        f.write(json.dumps(item, separators=(',', ':')) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.unlink(replaying_path)
+        if sent:
+            logger.info("recorded %d spilled trades, %d left", sent, len(remaining))
+        return sent
+
+    def stop(self):
+        """Stops the flusher, sending (or spilling) whatever is still queued."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        try:
+            # wakes the flusher up if it is waiting on an empty queue
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join()
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                batch.append(item)
+        if batch:
+            self.flush(batch)
+        self._sync_spill()
+        self._pool.shutdown()
+        self._thread = None
+        self._stopping.clear()
+
+recorder = TradeRecorder()
+
+def write_behind():
+    return RECORDER_MODE == 'write_behind'
@@ -0,0 +1,156 @@
+"""
+Prefork server for the trader.
+
+The master binds the listening socket, then forks TRADER_WORKERS workers
+(one per core by default) that all accept on it. Each worker initialises
+OpenTelemetry itself after the fork, with its own service.instance.id, and
+only then imports the app, so it has its own tracer/meter providers and its
+own market state. The master imports neither and just restarts workers
+that die.
+
+    TRADER_WORKERS=4 python serve.py
+"""
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+HOST = os.environ.get('TRADER_BIND_HOST', '0.0.0.0')
+PORT = int(os.environ.get('TRADER_PORT', 9001))
+WORKERS = int(os.environ.get('TRADER_WORKERS', 0)) or os.cpu_count() or 1
+BACKLOG = int(os.environ.get('TRADER_BACKLOG', 1024))
+# a worker dying faster than this after starting is not restarted in a tight loop
+RESTART_DELAY_S = 1
+
+def bind():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+def instance_id(worker):
+    return f"{socket.gethostname()}-{worker}"
+
+def run_worker(worker, sock):
+    """Runs in the forked child until it is told to stop."""
+    def terminate(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+
+    # the resource is built from the environment when OTel initialises
+    attributes = os.environ.get('OTEL_RESOURCE_ATTRIBUTES')
+    os.environ['OTEL_RESOURCE_ATTRIBUTES'] = ','.join(filter(None, [attributes, f"service.instance.id={instance_id(worker)}"]))
+    # each worker checkpoints (and restores) its own market state and has its own recorder spill file
+    os.environ['TRADER_WORKER_ID'] = str(worker)
+
+    from opentelemetry.instrumentation.auto_instrumentation import initialize
+    initialize()
+
+    from werkzeug.serving import make_server
+    from app import app
+    import queuelog
+
+    # werkzeug would add this handler itself on the first request, writing its
+    # access log line on the request thread
+    access_log = logging.getLogger('werkzeug')
+    if not access_log.hasHandlers():
+        access_log.setLevel(logging.INFO)
+        access_log.addHandler(logging.StreamHandler())
+    queuelog.install(access_log)
+
+    server = make_server(HOST, PORT, app, threaded=True, fd=sock.fileno())
+    print(f"worker {worker} (pid {os.getpid()}) serving on {HOST}:{PORT}", flush=True)
+    server.serve_forever()
+
+def shutdown_worker():
+    """
+    Does what atexit would have in a worker: sends the recorder's queue, writes
+    the last market checkpoint, drains the log queue, then flushes and shuts
+    down the OTel providers, in that order since each step still emits
+    telemetry. Only what the worker got as far as importing is shut down.
+    """
+    steps = []
+    if 'recorder' in sys.modules:
+        steps.append(sys.modules['recorder'].recorder.stop)
+    if 'model' in sys.modules:
+        steps.append(sys.modules['model'].checkpointer.stop)
+    if 'queuelog' in sys.modules:
+        steps.append(sys.modules['queuelog'].log_queue.stop)
+    if 'opentelemetry.trace' in sys.modules:
+        from opentelemetry import trace, metrics, _logs
+        for provider in (trace.get_tracer_provider(), metrics.get_meter_provider(), _logs.get_logger_provider()):
+            # the API's no-op providers have no shutdown
+            if hasattr(provider, 'shutdown'):
+                steps.append(provider.shutdown)
+    for step in steps:
+        try:
+            step()
+        except Exception as inst:
+            print(f"worker shutdown: {step.__qualname__} failed: {inst}", file=sys.stderr, flush=True)
+
+def spawn(worker, sock):
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            run_worker(worker, sock)
+        except SystemExit as inst:
+            code = inst.code or 0
+        except BaseException as inst:
+            print(f"worker {worker} failed: {inst}", file=sys.stderr, flush=True)
+        finally:
+            # the child must not return into main(), and os._exit skips atexit
+            shutdown_worker()
+            os._exit(code)
+    return pid
+
+def main():
+    sock = bind()
+    print(f"trader master (pid {os.getpid()}) starting {WORKERS} workers on {HOST}:{PORT}", flush=True)
+
+    workers = {}
+    started = {}
+    for worker in range(WORKERS):
+        workers[spawn(worker, sock)] = worker
+        started[worker] = time.monotonic()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        worker = workers.pop(pid, None)
+        if worker is None or stopping:
+            continue
+        print(f"worker {worker} (pid {pid}) exited with status {status}, restarting", flush=True)
+        if time.monotonic() - started[worker] < RESTART_DELAY_S:
+            time.sleep(RESTART_DELAY_S)
+        workers[spawn(worker, sock)] = worker
+        started[worker] = time.monotonic()
+
+    sock.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""
+Sliding-window trade aggregates, kept in the trader itself and served by
+/stats.
+
+For each value of each dimension (region, symbol, customer_id, action,
+canary), and for all trades together, a ring of TRADER_STATS_WINDOW_S /
+TRADER_STATS_BUCKET_S buckets holds the count, errors (5xx responses),
+volume, notional value and a latency sketch of the trades in that bucket.
+Buckets are reused as the window slides, and each dimension keeps at most
+TRADER_STATS_MAX_KEYS values (values not seen for a whole window are evicted
+to make room, otherwise new ones are counted under OTHER), so memory stays
+bounded whatever the traffic.
+
+The latency sketch counts latencies in logarithmic bins (each LATENCY_GAMMA
+times wider than the last), so its quantiles are within about 5% of the
+real ones.
+
+With TRADER_STATS_EXPORT=true, the window's rates, error rates, volume,
+notional value and p99 latency are also exported as observable gauges for
+the dimensions in TRADER_STATS_EXPORT_DIMENSIONS (as com.example.<dimension>
+attributes, like the trade's span attributes); they are read from the
+rings at collection time, so trades pay nothing extra for them. Prefork
+workers each keep (and serve) their own aggregates.
+"""
+import math
+import os
+import threading
+import time
+
+from opentelemetry.metrics import get_meter, Observation
+
+from instrumentation import ATTRIBUTE_PREFIX
+
+WINDOW_S = float(os.environ.get('TRADER_STATS_WINDOW_S', 60))
+BUCKET_S = float(os.environ.get('TRADER_STATS_BUCKET_S', 5))
+MAX_KEYS = int(os.environ.get('TRADER_STATS_MAX_KEYS', 1000))
+EXPORT = os.environ.get('TRADER_STATS_EXPORT', 'false').lower() == 'true'
+# customer_id is left out by default: one gauge series per customer is what a backend charges for
+EXPORT_DIMENSIONS = os.environ.get('TRADER_STATS_EXPORT_DIMENSIONS', 'region,symbol,action,canary')
+
+DIMENSIONS = ('region', 'symbol', 'customer_id', 'action', 'canary')
+OTHER = '_other'
+QUANTILES = (0.5, 0.9, 0.99)
+LATENCY_GAMMA = 1.1
+_LOG_GAMMA = math.log(LATENCY_GAMMA)
+# latencies below this (in ms) share the lowest bin
+_MIN_LATENCY_MS = 0.01
+
+meter = get_meter("trader")
+
+class BadStatsQuery(ValueError):
+    """A /stats query parameter that cannot be used."""
+
+def latency_bin(latency_ms):
+    return math.ceil(math.log(max(latency_ms, _MIN_LATENCY_MS)) / _LOG_GAMMA)
+
+def bin_latency(index):
+    """The middle of a latency bin, in ms."""
+    return 2 * LATENCY_GAMMA ** index / (LATENCY_GAMMA + 1)
+
+class Bucket:
+    __slots__ = ('epoch', 'count', 'errors', 'volume', 'notional', 'latency')
+
+    def __init__(self):
+        self.reset(-1)
+
+    def reset(self, epoch):
+        self.epoch = epoch
+        self.count = 0
+        self.errors = 0
+        self.volume = 0
+        self.notional = 0.0
+        self.latency = {}
+
+class Ring:
+    """The buckets of one key; bucket epoch e lives in slot e % size."""
+    __slots__ = ('buckets', 'latest')
+
+    def __init__(self, size):
+        self.buckets = [Bucket() for _ in range(size)]
+        self.latest = -1
+
+    def bucket(self, epoch):
+        bucket = self.buckets[epoch % len(self.buckets)]
+        if bucket.epoch != epoch:
+            bucket.reset(epoch)
+        self.latest = epoch
+        return bucket
+
+    def summary(self, first_epoch, seconds):
+        count = errors = volume = 0
+        notional = 0.0
+        latency = {}
+        for bucket in self.buckets:
+            if bucket.epoch < first_epoch:
+                continue
+            count += bucket.count
+            errors += bucket.errors
+            volume += bucket.volume
+            notional += bucket.notional
+            for index, n in bucket.latency.items():
+                latency[index] = latency.get(index, 0) + n
+        return {
+            'count': count,
+            'rate_per_s': count / seconds if seconds > 0 else 0.0,
+            'errors': errors,
+            'error_rate': errors / count if count else 0.0,
+            'volume': volume,
+            'notional': round(notional, 2),
+            'latency_ms': quantiles(latency, count),
+        }
+
+def quantiles(latency, count):
+    result = {f"p{round(q * 100)}": None for q in QUANTILES}
+    if not count:
+        return result
+    indexes = sorted(latency)
+    seen = 0
+    position = 0
+    for q in QUANTILES:
+        rank = q * (count - 1)
+        while seen + latency[indexes[position]] <= rank:
+            seen += latency[indexes[position]]
+            position += 1
+        result[f"p{round(q * 100)}"] = round(bin_latency(indexes[position]), 3)
+    return result
+
+class TradeStats:
+    def __init__(self, *, window_s=WINDOW_S, bucket_s=BUCKET_S, max_keys=MAX_KEYS):
+        self.bucket_s = bucket_s
+        self.size = max(1, math.ceil(window_s / bucket_s))
+        self.window_s = self.size * bucket_s
+        self.max_keys = max_keys
+        self.started = time.monotonic()
+        self.total = Ring(self.size)
+        self.rings = {dimension: {} for dimension in DIMENSIONS}
+        self._swept = {dimension: -1 for dimension in DIMENSIONS}
+        self._lock = threading.Lock()
+
+    def _ring(self, dimension, value, epoch):
+        rings = self.rings[dimension]
+        ring = rings.get(value)
+        if ring is not None:
+            return ring
+        if len(rings) >= self.max_keys and self._swept[dimension] != epoch:
+            # at most one sweep per bucket, so a flood of new values cannot make every trade scan
+            self._swept[dimension] = epoch
+            for stale in [key for key, ring in rings.items() if ring.latest <= epoch - self.size and key != OTHER]:
+                del rings[stale]
+        if len(rings) >= self.max_keys:
+            value = OTHER
+            ring = rings.get(value)
+            if ring is not None:
+                return ring
+        ring = rings[value] = Ring(self.size)
+        return ring
+
+    def record(self, *, region, symbol, customer_id, action, canary, shares, share_price, latency_s, error):
+        """Adds one finished trade; shares and share_price only count for buys and sells that succeeded."""
+        traded = not error and action in ('buy', 'sell') and shares is not None and share_price is not None
+        index = latency_bin(latency_s * 1000)
+        epoch = int(time.monotonic() // self.bucket_s)
+        with self._lock:
+            rings = [self.total]
+            for dimension, value in zip(DIMENSIONS, (region, symbol, customer_id, action, canary)):
+                rings.append(self._ring(dimension, 'none' if value is None else str(value), epoch))
+            for ring in rings:
+                bucket = ring.bucket(epoch)
+                bucket.count += 1
+                if error:
+                    bucket.errors += 1
+                if traded:
+                    bucket.volume += shares
+                    bucket.notional += shares * share_price
+                bucket.latency[index] = bucket.latency.get(index, 0) + 1
+
+    def _span(self, window_s):
+        """(first epoch, seconds covered) of the last window_s seconds, rounded up to whole buckets."""
+        buckets = self.size if window_s is None else min(self.size, max(1, math.ceil(window_s / self.bucket_s)))
+        now = time.monotonic()
+        epoch = int(now // self.bucket_s)
+        first_epoch = epoch - buckets + 1
+        return first_epoch, now - max(first_epoch * self.bucket_s, self.started)
+
+    def query(self, *, dimension=None, window_s=None, top=None):
+        """The aggregates over the last window_s seconds, each dimension's values sorted by count and cut to top."""
+        if dimension is not None and dimension not in DIMENSIONS:
+            raise BadStatsQuery(f"dimension must be one of {', '.join(DIMENSIONS)}, not {dimension!r}")
+        first_epoch, seconds = self._span(window_s)
+        result = {'window_s': round(seconds, 3), 'bucket_s': self.bucket_s}
+        with self._lock:
+            result['total'] = self.total.summary(first_epoch, seconds)
+            dimensions = {}
+            for name in (dimension,) if dimension else DIMENSIONS:
+                summaries = [(value, ring.summary(first_epoch, seconds)) for value, ring in self.rings[name].items()
+                             if ring.latest >= first_epoch]
+                summaries.sort(key=lambda item: item[1]['count'], reverse=True)
+                dimensions[name] = dict(summaries[:top])
+        result['dimensions'] = dimensions
+        return result
+
+    def reset(self):
+        with self._lock:
+            self.total = Ring(self.size)
+            self.rings = {dimension: {} for dimension in DIMENSIONS}
+
+def parse_query(args):
+    """query() keyword arguments from /stats' query parameters (dimension, window, top)."""
+    kwargs = {'dimension': args.get('dimension') or None}
+    for name, key, convert in (('window', 'window_s', float), ('top', 'top', int)):
+        value = args.get(name)
+        if not value:
+            continue
+        try:
+            kwargs[key] = convert(value)
+        except ValueError:
+            raise BadStatsQuery(f"{name}: {value!r} is not a number") from None
+        if not kwargs[key] > 0:
+            raise BadStatsQuery(f"{name} must be positive, not {value!r}")
+    return kwargs
+
+class StatsExporter:
+    """Observable gauges over a TradeStats window, one series per exported dimension value."""
+
+    GAUGES = (
+        ('trade_stats.rate', 'rate_per_s', "trades/s"),
+        ('trade_stats.error_rate', 'error_rate', "1"),
+        ('trade_stats.volume', 'volume', "shares"),
+        ('trade_stats.notional', 'notional', "units"),
+        ('trade_stats.latency_p99', None, "ms"),
+    )
+
+    def __init__(self, stats, dimensions):
+        self.stats = stats
+        self.dimensions = [dimension for dimension in dimensions if dimension in DIMENSIONS]
+        for name, field, unit in self.GAUGES:
+            meter.create_observable_gauge(name, callbacks=[self._observer(field)], unit=unit,
+                                          description=f"over the trader's last {stats.window_s:g}s")
+
+    def _observer(self, field):
+        def observe(options):
+            snapshot = self.stats.query()
+            series = [({}, snapshot['total'])]
+            for dimension in self.dimensions:
+                key = f"{ATTRIBUTE_PREFIX}.{dimension}"
+                series.extend(({key: value}, summary)
+                              for value, summary in snapshot['dimensions'][dimension].items())
+            for attributes, summary in series:
+                value = summary['latency_ms']['p99'] if field is None else summary[field]
+                if value is not None:
+                    yield Observation(value, attributes)
+        return observe
+
+trade_stats = TradeStats()
+if EXPORT:
+    StatsExporter(trade_stats, [dimension.strip() for dimension in EXPORT_DIMENSIONS.split(',')])
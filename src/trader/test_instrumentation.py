@@ -0,0 +1,68 @@
+from opentelemetry import baggage, context, trace
+from opentelemetry.processor.baggage import BaggageSpanProcessor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import Decision, ParentBased, TraceIdRatioBased
+from opentelemetry.trace import NonRecordingSpan, SpanContext, SpanKind, TraceFlags
+
+import instrumentation
+
+TRACE_ID = 0x0af7651916cd43dd8448eb211c80319c
+
+def remote_parent(sampled):
+    span_context = SpanContext(TRACE_ID, 0xb7ad6b7169203331, is_remote=True,
+                               trace_flags=TraceFlags(TraceFlags.SAMPLED if sampled else TraceFlags.DEFAULT))
+    return trace.set_span_in_context(NonRecordingSpan(span_context))
+
+def decide(sampler, parent, query):
+    return sampler.should_sample(parent, TRACE_ID, "POST /trade/request", SpanKind.SERVER,
+                                 {'url.query': query}).decision
+
+def test_remote_parent_decision_is_followed():
+    sampler = instrumentation.TradeSampler(ratio=1.0)
+    assert decide(sampler, remote_parent(False), 'symbol=ESTC') == Decision.DROP
+    assert decide(instrumentation.TradeSampler(ratio=0.0), remote_parent(True), 'symbol=ESTC') == Decision.RECORD_AND_SAMPLE
+
+def test_always_keep_trades_override_an_unsampled_parent():
+    sampler = instrumentation.TradeSampler(ratio=0.0)
+    for query in ('canary=true', 'error_model=true', 'error_db=True', 'latency=0.5'):
+        assert decide(sampler, remote_parent(False), query) == Decision.RECORD_AND_SAMPLE
+    assert decide(sampler, remote_parent(False), 'latency=0') == Decision.DROP
+
+def test_ratio_decides_root_spans():
+    assert decide(instrumentation.TradeSampler(ratio=0.0), None, 'symbol=ESTC') == Decision.DROP
+    assert decide(instrumentation.TradeSampler(ratio=1.0), None, 'symbol=ESTC') == Decision.RECORD_AND_SAMPLE
+
+def test_configured_sampler_is_kept_unless_asked(monkeypatch):
+    configured = ParentBased(TraceIdRatioBased(0.0))
+    provider = TracerProvider(sampler=configured)
+    monkeypatch.setattr(instrumentation, 'CONFIGURED', False)
+    instrumentation.install_sampler(provider)
+    assert provider.sampler is configured
+    monkeypatch.setattr(instrumentation, 'CONFIGURED', True)
+    instrumentation.install_sampler(provider)
+    assert isinstance(provider.sampler, instrumentation.TradeSampler)
+
+def test_child_spans_keep_day_and_region():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(BaggageSpanProcessor(instrumentation.baggage_key_predicate()))
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer("test")
+    ctx = None
+    for key, value in (('day_of_week', 'Tu'), ('region', 'EMEA'), ('classification', 'fraud')):
+        ctx = baggage.set_baggage(f"com.example.{key}", value, ctx)
+    token = context.attach(ctx)
+    try:
+        with tracer.start_as_current_span("trade"):
+            with tracer.start_as_current_span("sim_market_data"):
+                pass
+    finally:
+        context.detach(token)
+    spans = exporter.get_finished_spans()
+    assert [span.name for span in spans] == ['sim_market_data', 'trade']
+    for span in spans:
+        assert span.attributes['com.example.day_of_week'] == 'Tu'
+        assert span.attributes['com.example.region'] == 'EMEA'
+        assert 'com.example.classification' not in span.attributes
@@ -0,0 +1,82 @@
+"""
+The trader's per-trade metrics, dimensioned by region, symbol, action and
+canary (as com.example.* attributes, like the trade's span attributes).
+
+The OTel Python API has no bound instruments, so a TradeHandle stands in
+for one: it holds the instruments and one attribute dict for its
+combination, built once and passed as is on every call (the SDK neither
+copies nor keeps it), so a trade never builds attributes.
+
+Handles are cached per combination, least recently used first out past
+TRADER_METRICS_MAX_HANDLES, so an unbounded stream of symbols cannot grow
+the cache. Only the handle is dropped: the series' totals live in the SDK,
+so a combination that comes back carries on where it left off.
+"""
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from opentelemetry.metrics import get_meter
+
+from instrumentation import ATTRIBUTE_PREFIX
+
+MAX_HANDLES = int(os.environ.get('TRADER_METRICS_MAX_HANDLES', 1024))
+
+meter = get_meter("trader")
+
+class TradeHandle:
+    __slots__ = ('metrics', 'attributes')
+
+    def __init__(self, metrics, attributes):
+        self.metrics = metrics
+        self.attributes = attributes
+
+    def traded(self, shares, share_price):
+        """A buy or sell of shares at share_price."""
+        metrics = self.metrics
+        metrics.revenue.add(math.ceil(share_price * shares * .001), self.attributes)
+        metrics.volume.add(shares, self.attributes)
+        metrics.share_price.record(share_price, self.attributes)
+
+    def finished(self, duration_ms):
+        """A trade request answered after duration_ms, whatever its outcome."""
+        self.metrics.duration.record(duration_ms, self.attributes)
+
+class TradeMetrics:
+    def __init__(self, *, max_handles=MAX_HANDLES):
+        self.max_handles = max_handles
+        self.revenue = meter.create_counter("trading_revenue", "units")
+        self.volume = meter.create_counter("trading_volume", "shares")
+        self.duration = meter.create_histogram("trade.duration", unit="ms",
+                                               description="time to answer a trade request")
+        self.share_price = meter.create_histogram("trade.share_price", unit="units",
+                                                  description="share price of buys and sells")
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bind(self, *, region, symbol, action, canary):
+        key = (region, symbol, action, canary)
+        # get() and move_to_end() are single C calls, so hits need no lock; only misses change the cache's size
+        handle = self._handles.get(key)
+        if handle is not None:
+            try:
+                self._handles.move_to_end(key)
+            except KeyError:
+                # evicted meanwhile; its series lives on in the SDK
+                pass
+            return handle
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None:
+                return handle
+            # action is None when the model failed before deciding
+            handle = TradeHandle(self, {f"{ATTRIBUTE_PREFIX}.region": region, f"{ATTRIBUTE_PREFIX}.symbol": symbol,
+                                        f"{ATTRIBUTE_PREFIX}.action": action or 'none',
+                                        f"{ATTRIBUTE_PREFIX}.canary": canary})
+            self._handles[key] = handle
+            if len(self._handles) > self.max_handles:
+                self._handles.popitem(last=False)
+        return handle
+
+trade_metrics = TradeMetrics()
@@ -0,0 +1,129 @@
+"""
+Trade request parsing and response encoding for the trader's routes.
+
+parse() walks the WSGI QUERY_STRING once, converting each known field as
+it goes (no intermediate MultiDict or list of pairs, no per-field lookups),
+and returns a frozen TradeRequest. Empty values count as not given. Values that do not convert,
+unknown days of the week, and /trade/force requests without a complete
+trade raise BadTradeRequest, which the app turns into a 400.
+
+encode_response() writes the trade response JSON directly.
+"""
+import math
+import random
+from dataclasses import dataclass, fields
+from json.encoder import encode_basestring_ascii
+from urllib.parse import unquote_plus
+
+DAYS_OF_WEEK = ('M', 'Tu', 'W', 'Th', 'F')
+ACTIONS = ('buy', 'sell', 'hold')
+
+class BadTradeRequest(ValueError):
+    """The query string does not describe a valid trade."""
+
+@dataclass(frozen=True, slots=True)
+class TradeRequest:
+    day_of_week: str
+    customer_id: str | None = None
+    region: str = 'NA'
+    symbol: str = 'ESTC'
+    data_source: str = 'monkey'
+    classification: str | None = None
+    canary: str = 'false'
+    # forced errors
+    latency: float = 0.0
+    error_model: bool = False
+    error_db: bool = False
+    skew_market_factor: int = 0
+    # /trade/force only
+    action: str | None = None
+    shares: int | None = None
+    share_price: float | None = None
+
+def _bool(value):
+    return value.lower() == 'true'
+
+def _finite(value):
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{value!r} is not a finite number")
+    return number
+
+def _day_of_week(value):
+    if value not in DAYS_OF_WEEK:
+        raise ValueError(f"{value!r} is not one of {', '.join(DAYS_OF_WEEK)}")
+    return value
+
+def _action(value):
+    if value not in ACTIONS:
+        raise ValueError(f"{value!r} is not one of {', '.join(ACTIONS)}")
+    return value
+
+# query parameter -> converter; anything else in the query is ignored
+CONVERTERS = {
+    'customer_id': str,
+    'day_of_week': _day_of_week,
+    'region': str,
+    'symbol': str,
+    'data_source': str,
+    'classification': str,
+    'canary': str,
+    'latency': _finite,
+    'error_model': _bool,
+    'error_db': _bool,
+    'skew_market_factor': int,
+    'action': _action,
+    'shares': int,
+    'share_price': _finite,
+}
+
+# query parameter -> (position in TradeRequest, converter); day_of_week's default is picked per request
+_FIELDS = {field.name: (index, CONVERTERS[field.name]) for index, field in enumerate(fields(TradeRequest))}
+_DEFAULTS = tuple(None if field.name == 'day_of_week' else field.default for field in fields(TradeRequest))
+_DAY_OF_WEEK = _FIELDS['day_of_week'][0]
+_FORCE_FIELDS = tuple((name, _FIELDS[name][0]) for name in ('action', 'shares', 'share_price'))
+
+def _unquote(value):
+    if not value.isascii():
+        # WSGI hands over the raw bytes as latin-1
+        value = value.encode('latin-1').decode('utf-8', 'replace')
+    return unquote_plus(value)
+
+def parse(query_string, *, force=False):
+    """Parses a WSGI QUERY_STRING into a TradeRequest; the first value of a repeated field wins."""
+    values = list(_DEFAULTS)
+    seen = 0
+    start = 0
+    end = len(query_string)
+    while start < end:
+        stop = query_string.find('&', start)
+        if stop < 0:
+            stop = end
+        equals = query_string.find('=', start, stop)
+        # pairs without a value count as not given
+        if equals > start and equals + 1 < stop:
+            field = _FIELDS.get(query_string[start:equals])
+            if field is not None and not seen & (1 << field[0]):
+                index, convert = field
+                seen |= 1 << index
+                value = query_string[equals + 1:stop]
+                if '%' in value or '+' in value or not value.isascii():
+                    value = _unquote(value)
+                try:
+                    values[index] = convert(value)
+                except ValueError as inst:
+                    raise BadTradeRequest(f"invalid {query_string[start:equals]}: {inst}") from None
+        start = stop + 1
+
+    if force:
+        missing = [name for name, index in _FORCE_FIELDS if values[index] is None]
+        if missing:
+            raise BadTradeRequest(f"missing {', '.join(missing)}")
+    if values[_DAY_OF_WEEK] is None:
+        values[_DAY_OF_WEEK] = random.choice(DAYS_OF_WEEK)
+    return TradeRequest(*values)
+
+def encode_response(*, trade_id, symbol, shares, share_price, action):
+    """The trade response body; shares and share_price are always finite numbers here."""
+    return (f'{{"id":{encode_basestring_ascii(trade_id)},"symbol":{encode_basestring_ascii(symbol)},'
+            f'"shares":{shares!r},"share_price":{share_price!r},"action":{encode_basestring_ascii(action)}}}')
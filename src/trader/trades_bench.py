@@ -0,0 +1,144 @@
+"""
+Microbenchmark for trades.py: parsing a trade request and encoding its
+response, against the request.args.get() / dict-return path it replaced.
+
+Each case runs on a prebuilt WSGI environ, so both sides pay for building
+the Request object but nothing else of Flask's request handling. Reports
+wall and CPU time per operation and the peak memory allocated per operation
+(from a separate tracemalloc pass).
+
+    python trades_bench.py --iterations 50000 --json trades.json
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from flask import Flask, Request
+from werkzeug.test import EnvironBuilder
+
+import trades
+
+REQUEST_QUERY = {'symbol': 'ESTC', 'day_of_week': 'Tu', 'customer_id': 'l.johnson', 'latency': 0,
+                 'region': 'EMEA', 'error_model': False, 'error_db': False, 'skew_market_factor': 0,
+                 'canary': 'false', 'data_source': 'monkey'}
+FORCE_QUERY = {'symbol': 'MSI', 'day_of_week': 'F', 'shares': 42, 'action': 'buy', 'region': 'NA',
+               'customer_id': 'q.bert', 'share_price': 512, 'data_source': 'training',
+               'classification': 'not fraud'}
+
+def conform_request_bool(value):
+    return value.lower() == 'true'
+
+def legacy_parse(environ, force):
+    """What decode_common_args() and trade_force() did before trades.parse()."""
+    args = Request(environ).args
+    customer_id = args.get('customer_id', default=None, type=str)
+    day_of_week = args.get('day_of_week', default=None, type=str)
+    if day_of_week is None:
+        day_of_week = random.choice(['M', 'Tu', 'W', 'Th', 'F'])
+    region = args.get('region', default="NA", type=str)
+    symbol = args.get('symbol', default='ESTC', type=str)
+    data_source = args.get('data_source', default='monkey', type=str)
+    classification = args.get('classification', default=None, type=str)
+    latency = args.get('latency', default=0, type=float)
+    error_model = args.get('error_model', default=False, type=conform_request_bool)
+    error_db = args.get('error_db', default=False, type=conform_request_bool)
+    skew_market_factor = args.get('skew_market_factor', default=0, type=int)
+    canary = args.get('canary', default="false", type=str)
+    result = (customer_id, day_of_week, region, symbol, latency, error_model, error_db, skew_market_factor,
+              canary, data_source, classification)
+    if force:
+        result += (args.get('action', type=str), args.get('shares', type=int), args.get('share_price', type=float))
+    return result
+
+def new_parse(environ, force):
+    return trades.parse(Request(environ).environ.get('QUERY_STRING', ''), force=force)
+
+def legacy_encode(app, trade_id):
+    response = {}
+    response['id'] = trade_id
+    response['symbol'] = 'ESTC'
+    response['shares'] = 42
+    response['share_price'] = 512.25
+    response['action'] = 'buy'
+    # what Flask does with a dict returned from a view
+    return app.json.response(response)
+
+def new_encode(app, trade_id):
+    return app.response_class(trades.encode_response(trade_id=trade_id, symbol='ESTC', shares=42,
+                                                      share_price=512.25, action='buy'),
+                              mimetype='application/json')
+
+def time_case(fn, args, iterations, repeat):
+    """Best wall and CPU seconds per call over `repeat` runs."""
+    best_wall = best_cpu = None
+    for _ in range(repeat):
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(*args)
+        wall = (time.perf_counter() - start) / iterations
+        cpu = (time.process_time() - cpu_start) / iterations
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+    return best_wall, best_cpu
+
+def peak_allocated(fn, args, iterations):
+    tracemalloc.start()
+    try:
+        total = 0
+        for _ in range(iterations):
+            # garbage from earlier calls freed mid-call would hide this call's allocations
+            gc.collect()
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn(*args)
+            _, peak = tracemalloc.get_traced_memory()
+            total += peak - before
+    finally:
+        tracemalloc.stop()
+    return total / iterations
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark trade request parsing and response encoding.")
+    parser.add_argument('--iterations', type=int, default=20000, help="calls per timed run")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per case; the best one is reported")
+    parser.add_argument('--alloc-iterations', type=int, default=1000, help="calls in the allocation pass")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON to PATH")
+    args = parser.parse_args(argv)
+
+    app = Flask(__name__)
+    request_environ = EnvironBuilder(path='/trade/request', method='POST', query_string=REQUEST_QUERY).get_environ()
+    force_environ = EnvironBuilder(path='/trade/force', method='POST', query_string=FORCE_QUERY).get_environ()
+    trade_id = '0b0e5c4e-7f4e-4a8e-9d3f-6c1b9a3f2d10'
+
+    cases = [
+        ('parse /trade/request', legacy_parse, new_parse, (request_environ, False)),
+        ('parse /trade/force', legacy_parse, new_parse, (force_environ, True)),
+        ('encode response', lambda *a: legacy_encode(app, *a), lambda *a: new_encode(app, *a), (trade_id,)),
+    ]
+
+    results = {'iterations': args.iterations, 'cases': []}
+    with app.app_context():
+        for name, legacy, new, case_args in cases:
+            entry = {'case': name}
+            for label, fn in (('legacy', legacy), ('new', new)):
+                wall, cpu = time_case(fn, case_args, args.iterations, args.repeat)
+                entry[label] = {'ns_per_op': wall * 1e9, 'cpu_ns_per_op': cpu * 1e9,
+                                'alloc_peak_bytes_per_op': peak_allocated(fn, case_args, args.alloc_iterations)}
+            results['cases'].append(entry)
+            legacy_stats, new_stats = entry['legacy'], entry['new']
+            print(f"{name:<22} legacy {legacy_stats['ns_per_op']:8.0f}ns {legacy_stats['cpu_ns_per_op']:8.0f}ns CPU "
+                  f"{legacy_stats['alloc_peak_bytes_per_op']:7.0f}B alloc   "
+                  f"new {new_stats['ns_per_op']:8.0f}ns {new_stats['cpu_ns_per_op']:8.0f}ns CPU "
+                  f"{new_stats['alloc_peak_bytes_per_op']:7.0f}B alloc   "
+                  f"{legacy_stats['cpu_ns_per_op'] / new_stats['cpu_ns_per_op']:4.1f}x")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()